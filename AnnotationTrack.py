@@ -0,0 +1,195 @@
+# 檔案: AnnotationTrack.py
+# 職責: 「只輸出疊加資料」的渲染模式。不重新編碼影片，而是產生逐幀的標註軌 (骨架關節點、信心分數、
+#       投手框、棒球框、累積最大球速)，由前端疊在原始影片上自行繪製。
+#
+# 標註軌格式 (版本 1)：
+#   座標量化為整數 (實際值 = 整數 / coord_scale)，信心分數量化為 0~100，球速量化為 0.1 km/h；
+#   每個陣列沿著時間軸做差分 (第一筆為絕對值，之後為與前一筆的差)，前端以累加還原。
+#   - json:   {"version", "fps", "width", "height", "frame_count", "coord_scale", "score_scale", "speed_scale",
+#              "kpt_thr", "skeleton", "arrays": {名稱: 差分後的巢狀整數列表}}
+#   - binary: b"BBAT" + uint32 (little-endian) header 長度 + header JSON (同上，但 arrays 改為
+#             {名稱: {"dtype", "shape", "offset"}}) + 依序排列的 little-endian 陣列內容
+#   arrays 的內容：
+#     pose_frames (N,)、keypoints (N, 17, 2)、keypoint_scores (N, 17)、pose_bbox (N, 4)
+#     ball_frames (M,)、ball_boxes (M, 4)
+#     speed_frames (K,)、max_speed (K,)：累積最大球速只在變化的影格記錄一次
+
+import json
+import struct
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from BallSpeed import BallSpeedEstimate, estimate_ball_speed_from_json
+from Drawingfunction import SKELETON_CONNECTIONS, KeyFrameEncoder
+from FramePipeline import VideoMeta, run_frame_pipeline
+
+TRACK_VERSION = 1
+COORD_SCALE = 10     # 0.1 像素
+SCORE_SCALE = 100
+SPEED_SCALE = 10     # 0.1 km/h
+NUM_KEYPOINTS = 17
+
+BINARY_MAGIC = b"BBAT"
+
+
+def _unwrap_bbox(bbox_data):
+    # 與 draw_pitcher_on_frame 相同：API 回傳的 bbox 可能有多層列表包裝
+    while isinstance(bbox_data, list) and len(bbox_data) > 0 and isinstance(bbox_data[0], list):
+        bbox_data = bbox_data[0]
+    if bbox_data and len(bbox_data) == 4 and all(isinstance(c, (int, float)) for c in bbox_data):
+        return bbox_data
+    return None
+
+
+def _delta(array: np.ndarray) -> np.ndarray:
+    """沿著第 0 軸差分：第一筆保留絕對值。"""
+    if len(array) == 0:
+        return array
+    return np.concatenate([array[:1], np.diff(array, axis=0)], axis=0)
+
+
+def build_annotation_arrays(pose_json: dict, ball_json: dict, meta: VideoMeta,
+                            pixel_to_meter: float = 0.04,
+                            min_valid_speed_kmh: float = 30,
+                            max_valid_speed_kmh: float = 200,
+                            ball_speed: Optional[BallSpeedEstimate] = None) -> Tuple[Dict[str, np.ndarray], float]:
+    """
+    把 POSE / BALL API 的結果整理成量化後的整數陣列 (尚未差分)，並回傳最大球速。
+    只使用與渲染影片相同的資料 (每幀第一個投手、棒球框)，不需要解碼影片。
+    ball_speed 為已算好的球速 (服務層的結果，包含離群值剔除) 時直接使用，不重新計算。
+    """
+    last_frame = meta.frame_count if meta.frame_count > 0 else None
+
+    pose_frames, keypoints, scores, bboxes = [], [], [], []
+    for frame in sorted(pose_json.get('frames', []), key=lambda f: f['frame_idx']):
+        predictions = frame.get('predictions', [])
+        if not predictions or (last_frame is not None and frame['frame_idx'] >= last_frame):
+            continue
+        pitcher = predictions[0]
+        frame_keypoints = np.asarray(pitcher.get('keypoints') or [], dtype=np.float64)
+        frame_scores = np.asarray(pitcher.get('keypoint_scores') or [], dtype=np.float64)
+        if frame_keypoints.shape != (NUM_KEYPOINTS, 2) or frame_scores.shape != (NUM_KEYPOINTS,):
+            continue
+        bbox = _unwrap_bbox(pitcher.get('bbox'))
+        pose_frames.append(frame['frame_idx'])
+        keypoints.append(frame_keypoints)
+        scores.append(frame_scores)
+        bboxes.append(bbox if bbox is not None else [0, 0, 0, 0])
+
+    ball_results = sorted(
+        (frame_idx, box) for frame_idx, box in ball_json.get('results', [])
+        if box is not None and (last_frame is None or frame_idx < last_frame)
+    )
+
+    # 累積最大球速：與渲染影片左上角的數字相同，只在數值變化時記錄
+    speed = ball_speed
+    if speed is None:
+        speed = estimate_ball_speed_from_json(
+            ball_json, meta.fps, meta.frame_count, pixel_to_meter=pixel_to_meter,
+            min_valid_speed_kmh=min_valid_speed_kmh, max_valid_speed_kmh=max_valid_speed_kmh
+        )
+    running_max = speed.running_max_kmh()
+    increased = np.diff(np.concatenate([[0.0], running_max])) > 0
+    speed_frames = speed.end_frames[increased]
+    speed_values = running_max[increased]
+
+    arrays = {
+        "pose_frames": np.asarray(pose_frames, dtype=np.int32),
+        "keypoints": np.round(np.asarray(keypoints, dtype=np.float64).reshape(-1, NUM_KEYPOINTS, 2) * COORD_SCALE).astype(np.int32),
+        "keypoint_scores": np.round(np.clip(np.asarray(scores, dtype=np.float64).reshape(-1, NUM_KEYPOINTS), 0, 1) * SCORE_SCALE).astype(np.int32),
+        "pose_bbox": np.round(np.asarray(bboxes, dtype=np.float64).reshape(-1, 4) * COORD_SCALE).astype(np.int32),
+        "ball_frames": np.asarray([frame_idx for frame_idx, _ in ball_results], dtype=np.int32),
+        "ball_boxes": np.round(np.asarray([box for _, box in ball_results], dtype=np.float64).reshape(-1, 4) * COORD_SCALE).astype(np.int32),
+        "speed_frames": np.asarray(speed_frames, dtype=np.int32),
+        "max_speed": np.round(np.asarray(speed_values, dtype=np.float64) * SPEED_SCALE).astype(np.int32),
+    }
+    return arrays, speed.max_speed_kmh
+
+
+def _header(meta: VideoMeta) -> dict:
+    return {
+        "version": TRACK_VERSION,
+        "fps": meta.fps,
+        "width": meta.width,
+        "height": meta.height,
+        "frame_count": meta.frame_count,
+        "coord_scale": COORD_SCALE,
+        "score_scale": SCORE_SCALE,
+        "speed_scale": SPEED_SCALE,
+        "kpt_thr": 0.3,
+        "skeleton": SKELETON_CONNECTIONS,
+    }
+
+
+def encode_annotation_track(arrays: Dict[str, np.ndarray], meta: VideoMeta, track_format: str = "json") -> Tuple[bytes, str, str]:
+    """
+    把量化後的陣列差分並序列化。回傳 (內容, 副檔名, content_type)。
+    """
+    header = _header(meta)
+    deltas = {name: _delta(array) for name, array in arrays.items()}
+
+    if track_format == "binary":
+        layout, chunks, offset = {}, [], 0
+        for name, array in deltas.items():
+            # 差分後數值通常很小，能放進 int16 就用 int16
+            small = array.size == 0 or (array.min() >= np.iinfo(np.int16).min and array.max() <= np.iinfo(np.int16).max)
+            data = np.ascontiguousarray(array.astype("<i2" if small else "<i4")).tobytes()
+            layout[name] = {"dtype": "int16" if small else "int32", "shape": list(array.shape), "offset": offset}
+            chunks.append(data)
+            offset += len(data)
+        header["arrays"] = layout
+        header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        payload = BINARY_MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes + b"".join(chunks)
+        return payload, "bin", "application/octet-stream"
+
+    header["arrays"] = {name: array.tolist() for name, array in deltas.items()}
+    return json.dumps(header, separators=(",", ":")).encode("utf-8"), "json", "application/json"
+
+
+def decode_annotation_track(payload: bytes) -> Tuple[dict, Dict[str, np.ndarray]]:
+    """encode_annotation_track 的反向操作 (累加還原差分)，回傳 (header, 量化後的陣列)。供測試與除錯使用。"""
+    if payload[:4] == BINARY_MAGIC:
+        (header_length,) = struct.unpack("<I", payload[4:8])
+        header = json.loads(payload[8:8 + header_length])
+        body = payload[8 + header_length:]
+        arrays = {}
+        for name, spec in header.pop("arrays").items():
+            dtype = np.dtype("<i2" if spec["dtype"] == "int16" else "<i4")
+            count = int(np.prod(spec["shape"]))
+            data = np.frombuffer(body, dtype=dtype, count=count, offset=spec["offset"])
+            arrays[name] = data.reshape(spec["shape"]).astype(np.int32)
+    else:
+        header = json.loads(payload)
+        arrays = {name: np.asarray(values, dtype=np.int32) for name, values in header.pop("arrays").items()}
+    return header, {name: np.cumsum(array, axis=0, dtype=np.int32) if len(array) else array
+                    for name, array in arrays.items()}
+
+
+def build_overlay_outputs(input_video_path: str,
+                          pose_json: dict,
+                          ball_json: dict,
+                          frame_indices: dict,
+                          track_format: str = "json",
+                          pixel_to_meter: float = 0.04,
+                          min_valid_speed_kmh: float = 30,
+                          max_valid_speed_kmh: float = 200,
+                          jpeg_quality: int = 95,
+                          webp_quality: Optional[int] = None,
+                          thumbnail_width: int = 0,
+                          ball_speed: Optional[BallSpeedEstimate] = None) -> Tuple[bytes, str, str, float, dict]:
+    """
+    overlay 模式下取代 render_video_and_key_frames：不繪圖也不編碼影片，
+    只解碼到最後一個關鍵影格為止 (擷取關鍵影格)，並產生標註軌。
+    Returns:
+        (標註軌內容, 副檔名, content_type, 最大球速 km/h, 關鍵影格編碼結果字典)
+    """
+    key_frame_encoder = KeyFrameEncoder(frame_indices, jpeg_quality, webp_quality, thumbnail_width)
+    # 關鍵影格都擷取完就停止解碼；沒有關鍵影格時只讀取影片資訊
+    meta = run_frame_pipeline(input_video_path, [key_frame_encoder])
+
+    arrays, max_speed_kmh = build_annotation_arrays(
+        pose_json, ball_json, meta, pixel_to_meter, min_valid_speed_kmh, max_valid_speed_kmh, ball_speed
+    )
+    track, extension, content_type = encode_annotation_track(arrays, meta, track_format)
+    return track, extension, content_type, max_speed_kmh, key_frame_encoder.encoded_frames
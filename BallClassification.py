@@ -1,54 +1,55 @@
-import pandas as pd
 import numpy as np
 
+from model_registry import registry
+
+def get_default_ball_model():
+    """
+    由模型登錄表取得目前版本的球路分類模型：每個行程延遲載入一次 (行程池中的 worker 也各自載入，
+    MODEL_MMAP 時各行程以記憶體對應共用同一份攤平的森林)，有新版本時自動替換。
+    """
+    return registry.get("ball_quality")
+
+def encode_ball_features(ball_json, target_length=239):
+    """
+    把 BALL API 回傳的 ball_json['results'] 直接轉成模型的輸入向量 (2 * target_length,)：
+    前半為每筆結果的棒球框中心 x，後半為中心 y (與訓練時的欄位順序 x_0..x_{n-1}, y_0..y_{n-1} 相同)。
+    沒有偵測到、框格式不符或任一座標為 None 的位置為 NaN；不足 target_length 筆以 NaN 補齊，超過的部分捨棄。
+    """
+    results = ball_json['results'][:target_length]
+    # 每筆結果為 [frame_idx, [x1, y1, x2, y2] 或 None]；dtype=float 會把座標中的 None 轉成 NaN
+    boxes = np.full((target_length, 4), np.nan)
+    valid_rows = [i for i, item in enumerate(results) if item[1] is not None and len(item[1]) == 4]
+    if valid_rows:
+        boxes[valid_rows] = np.array([results[i][1] for i in valid_rows], dtype=np.float64)
+
+    centers = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=1)
+    # 只要有一個座標缺少，x 與 y 都視為缺少
+    centers[np.isnan(boxes).any(axis=1)] = np.nan
+    return centers.T.reshape(-1)
+
+def classify_ball_quality_batch(ball_jsons, model, target_length=239):
+    """
+    一次計算多筆球路的好球機率 (只呼叫一次 predict_proba)，回傳 np.ndarray (N,)。
+    """
+    if len(ball_jsons) == 0:
+        return np.zeros(0)
+    features = np.stack([encode_ball_features(ball_json, target_length) for ball_json in ball_jsons])
+    return model.predict_proba(features)[:, 1]
+
 def classify_ball_quality(ball_json, model, target_length=239):
     """
     這個函數ball_json就是棒球api回傳的json檔案
     model就是一個隨機森林模型
     輸出浮點數代表是好球的機率
     """
-    results = ball_json['results']
-    x_list = []
-    y_list = []
-
-    for item in results:
-        coords = item[1]
-        # Check if coords is not None and has 4 elements
-        if coords is not None and len(coords) == 4:
-            x1, y1, x2, y2 = coords
-            # Ensure all coordinates are not None. If any are, append None.
-            if all(c is not None for c in [x1, y1, x2, y2]):
-                center_x = (x1 + x2) / 2
-                center_y = (y1 + y2) / 2
-                x_list.append(center_x)
-                y_list.append(center_y)
-            else:
-                x_list.append(None)
-                y_list.append(None)
-        else:
-            # If coords itself is None or malformed, append None
-            x_list.append(None)
-            y_list.append(None)
-
-    # Pad with None values until target_length
-    while len(x_list) < target_length:
-        x_list.append(None)
-        y_list.append(None)
-
-    # Truncate to target_length (as a safeguard)
-    x_list = x_list[:target_length]
-    y_list = y_list[:target_length]
-
-    # Create column names
-    columns = [f'x_{i}' for i in range(target_length)] + [f'y_{i}' for i in range(target_length)]
-    values = x_list + y_list
-    
-    # Create DataFrame. Pandas can handle None, which will become NaN.
-    df = pd.DataFrame([values], columns=columns)
-
-    # Note: Many machine learning models, including RandomForest, do not natively
-    # handle NaN values. You might need to impute or handle these NaNs before prediction.
-    # For demonstration, I'm leaving it as is, assuming your model or pipeline
-    # is set up to handle potential NaNs (which Pandas will convert from None).
-    
-    return float(model.predict_proba(df.to_numpy())[0][1])
\ No newline at end of file
+    return float(classify_ball_quality_batch([ball_json], model, target_length)[0])
+
+def predict_ball_quality(ball_json, target_length=239):
+    """
+    使用預設模型計算好球機率，給行程池呼叫 (不需要把模型 pickle 傳進子行程)。
+    """
+    return classify_ball_quality(ball_json, get_default_ball_model(), target_length)
+
+def predict_ball_quality_batch(ball_jsons, target_length=239):
+    """predict_ball_quality 的批次版本，回傳 np.ndarray (N,)。"""
+    return classify_ball_quality_batch(ball_jsons, get_default_ball_model(), target_length)
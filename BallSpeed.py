@@ -0,0 +1,112 @@
+# 檔案: BallSpeed.py
+# 職責: 由 BALL API 的棒球框計算球速，不需要解碼影片 (只用到 fps 與 ball_json['results'])。
+#       以 NumPy 一次算出所有相鄰偵測之間的速度，提供最大 / 中位數球速、逐段速度曲線與離群值剔除。
+#       預設設定 (不剔除離群值) 的最大球速與渲染影片時 BallSpeedTracker 逐幀計算的結果完全相同。
+
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from FramePipeline import probe_video
+
+KMH_PER_MPS = 3.6
+
+
+class BallSpeedEstimate(NamedTuple):
+    max_speed_kmh: float
+    median_speed_kmh: float
+    start_frames: np.ndarray   # (K,) 每一段的起點影格
+    end_frames: np.ndarray     # (K,) 每一段的終點影格
+    speeds_kmh: np.ndarray     # (K,) 每一段的速度
+    valid: np.ndarray          # (K,) bool，落在合理範圍內且不是離群值
+
+    def running_max_kmh(self) -> np.ndarray:
+        """每一段結束時的累積最大球速 (與渲染影片左上角顯示的數字相同)。"""
+        return np.maximum.accumulate(np.where(self.valid, self.speeds_kmh, 0.0)) if len(self.valid) else self.speeds_kmh
+
+    def to_dict(self) -> Dict:
+        return {
+            "max_speed_kmh": self.max_speed_kmh,
+            "median_speed_kmh": self.median_speed_kmh,
+            "segments": {
+                "start_frame": self.start_frames.tolist(),
+                "end_frame": self.end_frames.tolist(),
+                "speed_kmh": np.round(self.speeds_kmh, 2).tolist(),
+                "valid": self.valid.tolist(),
+            },
+        }
+
+
+def ball_centers(ball_json: dict, frame_count: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    取出有偵測到棒球的影格編號 (遞增) 與框中心點 (整數像素，與 BallSpeedTracker 的算法相同)。
+    同一影格出現多次時以最後一筆為準；frame_count 有值時忽略超出影片長度的影格。
+    """
+    boxes = {frame_idx: box for frame_idx, box in ball_json.get('results', [])}
+    items = sorted((frame_idx, box) for frame_idx, box in boxes.items()
+                   if box is not None and (not frame_count or frame_idx < frame_count))
+    if not items:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 2), dtype=np.int64)
+
+    frames = np.asarray([frame_idx for frame_idx, _ in items], dtype=np.int64)
+    corners = np.trunc(np.asarray([box for _, box in items], dtype=np.float64)).astype(np.int64)
+    centers = np.stack([(corners[:, 0] + corners[:, 2]) // 2, (corners[:, 1] + corners[:, 3]) // 2], axis=1)
+    return frames, centers
+
+
+def estimate_ball_speed(frames: np.ndarray,
+                        centers: np.ndarray,
+                        fps: float,
+                        pixel_to_meter: float = 0.04,
+                        min_valid_speed_kmh: float = 30,
+                        max_valid_speed_kmh: float = 200,
+                        outlier_rejection: str = "none",
+                        outlier_threshold: float = 3.5) -> BallSpeedEstimate:
+    """
+    計算相鄰兩次偵測之間的平均速度。
+    outlier_rejection="mad" 時，在合理範圍內的速度中再以 MAD (median absolute deviation)
+    剔除 modified z-score 超過 outlier_threshold 的段落 (例如誤判成別的物體造成的跳動)。
+    """
+    frames = np.asarray(frames, dtype=np.int64)
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+
+    if len(frames) < 2 or not fps:
+        empty = np.zeros(0)
+        return BallSpeedEstimate(0.0, 0.0, empty.astype(np.int64), empty.astype(np.int64), empty, empty.astype(bool))
+
+    distance_pixels = np.hypot(*np.diff(centers, axis=0).T)
+    dt = np.diff(frames) / fps
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speeds_kmh = np.where(dt > 0, distance_pixels * pixel_to_meter / dt * KMH_PER_MPS, np.nan)
+    valid = (dt > 0) & (speeds_kmh >= min_valid_speed_kmh) & (speeds_kmh <= max_valid_speed_kmh)
+
+    if outlier_rejection == "mad" and valid.sum() >= 3:
+        in_range = speeds_kmh[valid]
+        median = np.median(in_range)
+        mad = np.median(np.abs(in_range - median))
+        if mad > 0:
+            modified_z = 0.6745 * np.abs(speeds_kmh - median) / mad
+            valid &= modified_z <= outlier_threshold
+
+    valid_speeds = speeds_kmh[valid]
+    return BallSpeedEstimate(
+        max_speed_kmh=float(np.round(valid_speeds.max(), 2)) if len(valid_speeds) else 0.0,
+        median_speed_kmh=float(np.round(np.median(valid_speeds), 2)) if len(valid_speeds) else 0.0,
+        start_frames=frames[:-1],
+        end_frames=frames[1:],
+        speeds_kmh=np.nan_to_num(speeds_kmh),
+        valid=valid,
+    )
+
+
+def estimate_ball_speed_from_json(ball_json: dict, fps: float, frame_count: Optional[int] = None,
+                                  **options) -> BallSpeedEstimate:
+    """直接由 BALL API 的回傳結果計算球速，options 同 estimate_ball_speed。"""
+    frames, centers = ball_centers(ball_json, frame_count)
+    return estimate_ball_speed(frames, centers, fps, **options)
+
+
+def estimate_ball_speed_for_video(input_video_path: str, ball_json: dict, **options) -> BallSpeedEstimate:
+    """讀取影片的 fps (不解碼影格) 後計算球速，options 同 estimate_ball_speed。"""
+    meta = probe_video(input_video_path)
+    return estimate_ball_speed_from_json(ball_json, meta.fps, meta.frame_count, **options)
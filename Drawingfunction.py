@@ -2,7 +2,9 @@ import cv2
 import os
 import math
 import numpy as np
-from typing import Tuple # 導入 Tuple 以正確標註回傳型別
+from typing import Dict, NamedTuple, Optional, Tuple # 導入 Tuple 以正確標註回傳型別
+from FramePipeline import FrameConsumer, VideoMeta, run_frame_pipeline
+from VideoEncoder import EncoderOptions, FFmpegEncodeError, OpenCVEncoder, create_video_encoder
 
 """
 畫投手骨架的函數
@@ -80,92 +82,272 @@ def draw_pitcher_on_frame(image, pitcher_data, kpt_thr=0.3, line_thickness=1, po
 
     return image
 
+class KeyFrameSnapshotter(FrameConsumer):
+    """
+    擷取指定影格並存成圖片檔案 (存的是尚未繪圖的原始畫面，必須排在繪圖 consumer 之前)。
+    frame_indices 例如 {"release": 100, "landing": 50, "shoulder": 70}，編號為 None 的不儲存。
+    """
+    def __init__(self, input_video_path: str, frame_indices: dict, output_dir: str = "temp_rendered_videos"):
+        self.input_video_path = input_video_path
+        self.output_dir = output_dir
+        self.targets = {}
+        for name, idx in frame_indices.items():
+            if idx is not None:
+                self.targets.setdefault(idx, []).append(name)
+        self.saved_image_paths = {}
+
+    def on_start(self, meta: VideoMeta) -> None:
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def on_frame(self, frame_idx: int, frame) -> None:
+        for name in self.targets.pop(frame_idx, []):
+            # 構建圖片儲存路徑
+            image_filename = f"{name}_{os.path.basename(self.input_video_path).replace('.', '_')}.jpg"
+            image_path = os.path.join(self.output_dir, image_filename)
+
+            cv2.imwrite(image_path, frame)
+            self.saved_image_paths[f"{name}_frame_path"] = image_path
+            print(f"已儲存 {name} 影格至 {image_path}")
+
+    @property
+    def done(self) -> bool:
+        return not self.targets
+
+
+class EncodedImage(NamedTuple):
+    data: bytes
+    extension: str
+    content_type: str
+
+
+def encode_image(frame, image_format: str = "jpeg", quality: int = 95) -> EncodedImage:
+    """在記憶體中把畫面編碼成 JPEG 或 WebP，不經過檔案系統。"""
+    if image_format == "webp":
+        ok, buffer = cv2.imencode(".webp", frame, [cv2.IMWRITE_WEBP_QUALITY, int(quality)])
+        encoded = EncodedImage(buffer.tobytes(), "webp", "image/webp")
+    else:
+        ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+        encoded = EncodedImage(buffer.tobytes(), "jpg", "image/jpeg")
+    if not ok:
+        raise RuntimeError(f"影格編碼失敗 ({image_format})")
+    return encoded
+
+
+class KeyFrameEncoder(FrameConsumer):
+    """
+    擷取指定影格並在記憶體中編碼 (同 KeyFrameSnapshotter，必須排在繪圖 consumer 之前)。
+    每個影格一定有 "jpeg"；webp_quality 有值時多一份 "webp"，thumbnail_width > 0 時多一份縮圖 "thumbnail" (JPEG)。
+    結果在 encoded_frames，例如 {"release": {"jpeg": EncodedImage, "thumbnail": EncodedImage}}。
+    """
+    def __init__(self, frame_indices: dict, jpeg_quality: int = 95,
+                 webp_quality: Optional[int] = None, thumbnail_width: int = 0):
+        self.jpeg_quality = jpeg_quality
+        self.webp_quality = webp_quality
+        self.thumbnail_width = thumbnail_width
+        self.targets = {}
+        for name, idx in frame_indices.items():
+            if idx is not None:
+                self.targets.setdefault(idx, []).append(name)
+        self.encoded_frames: Dict[str, Dict[str, EncodedImage]] = {}
+
+    def _encode_variants(self, frame) -> Dict[str, EncodedImage]:
+        variants = {"jpeg": encode_image(frame, "jpeg", self.jpeg_quality)}
+        if self.webp_quality is not None:
+            variants["webp"] = encode_image(frame, "webp", self.webp_quality)
+        if self.thumbnail_width > 0:
+            height, width = frame.shape[:2]
+            thumbnail = frame
+            if width > self.thumbnail_width:
+                thumbnail_height = max(1, round(height * self.thumbnail_width / width))
+                thumbnail = cv2.resize(frame, (self.thumbnail_width, thumbnail_height), interpolation=cv2.INTER_AREA)
+            variants["thumbnail"] = encode_image(thumbnail, "jpeg", self.jpeg_quality)
+        return variants
+
+    def on_frame(self, frame_idx: int, frame) -> None:
+        names = self.targets.pop(frame_idx, [])
+        if names:
+            variants = self._encode_variants(frame)
+            for name in names:
+                self.encoded_frames[name] = variants
+                print(f"已編碼 {name} 影格 (第 {frame_idx} 幀)")
+
+    @property
+    def done(self) -> bool:
+        return not self.targets
+
+
+class BallSpeedTracker(FrameConsumer):
+    """
+    根據棒球框中心點在相鄰偵測幀之間的位移計算球速，並記錄目前為止的最大球速。
+    只用到 ball_json 與 fps，不會讀取畫面內容。
+    """
+    def __init__(self, ball_json: dict, pixel_to_meter: float = 0.04,
+                 min_valid_speed_kmh: float = 30, max_valid_speed_kmh: float = 200):
+        self.ball_frames = {frame_idx: box for frame_idx, box in ball_json.get('results', [])}
+        self.pixel_to_meter = pixel_to_meter
+        self.min_valid_speed_kmh = min_valid_speed_kmh
+        self.max_valid_speed_kmh = max_valid_speed_kmh
+        self.fps = None
+        self.prev_center = None
+        self.prev_frame_idx = None
+        self.max_speed_kmh = 0
+
+    def on_start(self, meta: VideoMeta) -> None:
+        self.fps = meta.fps
+
+    def on_frame(self, frame_idx: int, frame) -> None:
+        current_ball_box = self.ball_frames.get(frame_idx)
+        # 如果 current_ball_box 是 None，則跳過速度計算
+        if current_ball_box is None:
+            return
+
+        x1, y1, x2, y2 = map(int, current_ball_box)
+        cx = (x1 + x2) // 2
+        cy = (y1 + y2) // 2
+
+        if self.prev_center is not None and self.prev_frame_idx is not None:
+            dx = cx - self.prev_center[0]
+            dy = cy - self.prev_center[1]
+            distance_pixels = math.sqrt(dx**2 + dy**2)
+            dt = (frame_idx - self.prev_frame_idx) / self.fps
+
+            if dt > 0:
+                distance_m = distance_pixels * self.pixel_to_meter
+                speed_mps = distance_m / dt
+                speed_kmh = speed_mps * 3.6
+
+                if self.min_valid_speed_kmh <= speed_kmh <= self.max_valid_speed_kmh:
+                    self.max_speed_kmh = max(self.max_speed_kmh, speed_kmh)
+
+        self.prev_center = (cx, cy)
+        self.prev_frame_idx = frame_idx
+
+
+class BallSpeedTimeline(FrameConsumer):
+    """
+    以服務層預先算好的 BallSpeed.BallSpeedEstimate 提供目前為止的最大球速 (與 BallSpeedTracker 介面相同)，
+    影片上的數字與回傳的 max_speed_kmh 使用同一份結果 (包含離群值剔除)，不再逐幀重新計算。
+    """
+    def __init__(self, ball_speed):
+        self.end_frames = np.asarray(ball_speed.end_frames)
+        self.running_max = ball_speed.running_max_kmh()
+        self.max_speed_kmh = 0
+
+    def on_frame(self, frame_idx: int, frame) -> None:
+        # 已結束的段落中最後一段的累積最大值
+        position = int(np.searchsorted(self.end_frames, frame_idx, side="right"))
+        self.max_speed_kmh = float(self.running_max[position - 1]) if position else 0
+
+
+class PoseOverlay(FrameConsumer):
+    """在每一幀畫上投手骨架。"""
+    def __init__(self, pose_json: dict):
+        self.pose_frames = {f['frame_idx']: f.get('predictions', []) for f in pose_json.get('frames', [])}
+
+    def on_frame(self, frame_idx: int, frame) -> None:
+        pose_predictions_for_frame = self.pose_frames.get(frame_idx, [])
+        if pose_predictions_for_frame:
+            draw_pitcher_on_frame(frame, pose_predictions_for_frame[0])
+
+
+class BallOverlay(FrameConsumer):
+    """在每一幀畫上棒球的偵測框。"""
+    def __init__(self, ball_json: dict):
+        self.ball_frames = {frame_idx: box for frame_idx, box in ball_json.get('results', [])}
+
+    def on_frame(self, frame_idx: int, frame) -> None:
+        current_ball_box = self.ball_frames.get(frame_idx)
+        if current_ball_box is not None:
+            x1, y1, x2, y2 = map(int, current_ball_box)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
+            cv2.putText(frame, "Baseball", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+
+
+class SpeedLabelOverlay(FrameConsumer):
+    """在左上角畫上目前為止的最大球速 (必須排在 BallSpeedTracker / BallSpeedTimeline 之後)。"""
+    def __init__(self, speed_tracker):
+        self.speed_tracker = speed_tracker
+
+    def on_frame(self, frame_idx: int, frame) -> None:
+        label = f"Max Speed: {self.speed_tracker.max_speed_kmh:.1f} km/h"
+        cv2.rectangle(frame, (30, 30), (360, 80), (0, 0, 0), -1)  # 黑底
+        cv2.putText(frame, label, (40, 65), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)  # 白字
+
+
+# 舊名稱：以 cv2.VideoWriter (avc1) 寫入輸出影片
+VideoWriterConsumer = OpenCVEncoder
+
+
+def rendered_video_path_for(input_video_path: str, output_dir: str = "temp_rendered_videos") -> str:
+    return os.path.join(output_dir, f"temp_rendered_{os.path.basename(input_video_path)}")
+
+
+def render_video_and_key_frames(input_video_path: str,
+                                pose_json: dict,
+                                ball_json: dict,
+                                frame_indices: dict,
+                                pixel_to_meter: float = 0.04,
+                                min_valid_speed_kmh: float = 30,
+                                max_valid_speed_kmh: float = 200,
+                                jpeg_quality: int = 95,
+                                webp_quality: Optional[int] = None,
+                                thumbnail_width: int = 0,
+                                encoder: str = "opencv",
+                                encoder_options: Optional[EncoderOptions] = None,
+                                ffmpeg_binary: str = "ffmpeg",
+                                ball_speed=None) -> Tuple[str, float, dict]:
+    """
+    只解碼一次影片，同時完成：關鍵影格擷取、骨架與棒球框繪製、球速計算、輸出渲染影片。
+    關鍵影格直接在記憶體中編碼 (見 KeyFrameEncoder)，不寫入暫存檔。
+    encoder 為輸出影片的編碼後端 (opencv / ffmpeg / auto，見 VideoEncoder.create_video_encoder)。
+    ball_speed 為已算好的 BallSpeed.BallSpeedEstimate 時直接畫上它的結果 (忽略 pixel_to_meter 與速度範圍)。
+    Returns:
+        (渲染影片路徑, 最大球速 km/h, 關鍵影格編碼結果字典 {名稱: {變體: EncodedImage}})
+    """
+    output_video_path = rendered_video_path_for(input_video_path)
+
+    def render(backend: str):
+        key_frame_encoder = KeyFrameEncoder(frame_indices, jpeg_quality, webp_quality, thumbnail_width)
+        if ball_speed is not None:
+            speed_tracker = BallSpeedTimeline(ball_speed)
+        else:
+            speed_tracker = BallSpeedTracker(ball_json, pixel_to_meter, min_valid_speed_kmh, max_valid_speed_kmh)
+        consumers = [
+            key_frame_encoder,  # 原始畫面，必須在繪圖之前
+            PoseOverlay(pose_json),
+            BallOverlay(ball_json),
+            speed_tracker,
+            SpeedLabelOverlay(speed_tracker),
+            create_video_encoder(output_video_path, backend, encoder_options, ffmpeg_binary),
+        ]
+        run_frame_pipeline(input_video_path, consumers)
+        return key_frame_encoder, speed_tracker
+
+    try:
+        key_frame_encoder, speed_tracker = render(encoder)
+    except FFmpegEncodeError as e:
+        # ffmpeg 無法編碼這支影片時改用 OpenCV 重新輸出一次
+        print(f"⚠️ {e}，改用 OpenCV 編碼")
+        key_frame_encoder, speed_tracker = render("opencv")
+
+    if ball_speed is not None:
+        max_speed_kmh = ball_speed.max_speed_kmh
+    else:
+        max_speed_kmh = float(np.round(speed_tracker.max_speed_kmh, 2))
+    return output_video_path, max_speed_kmh, key_frame_encoder.encoded_frames
+
+
 def render_video_with_pose_and_max_ball_speed(input_video_path: str,
                                               pose_json: dict,
                                               ball_json: dict,
                                               pixel_to_meter: float = 0.04,
                                               min_valid_speed_kmh: float = 30,
                                               max_valid_speed_kmh: float = 200) -> Tuple[str, float]:
-    # Define a temporary directory for rendered videos
-    output_dir = "temp_rendered_videos"
-    os.makedirs(output_dir, exist_ok=True) # Ensure this directory exists
-
-    # Construct the output video path within the temporary directory
-    output_video_path = os.path.join(output_dir, f"temp_rendered_{os.path.basename(input_video_path)}")
-
-    cap = cv2.VideoCapture(input_video_path)
-    if not cap.isOpened():
-        raise RuntimeError(f"無法開啟影片：{input_video_path}")
-
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    #fourcc = cv2.VideoWriter_fourcc(*'X264') # <-- 修改這一行
-    fourcc = cv2.VideoWriter_fourcc(*'avc1') # <-- 修改這一行
-    out = cv2.VideoWriter(output_video_path, fourcc, fps, (width, height))
-    
-    # 確保 pose_frames 和 ball_frames 被正確初始化
-    pose_frames = {f['frame_idx']: f.get('predictions', []) for f in pose_json.get('frames', [])}
-    ball_frames = {frame_idx: box for frame_idx, box in ball_json.get('results', [])}
-
-    prev_center = None
-    prev_frame_idx = None
-    max_speed_kmh = 0
-
-    frame_idx = 0
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        # --- 畫骨架 ---
-        # 整合進來的繪圖邏輯
-        pose_predictions_for_frame = pose_frames.get(frame_idx, [])
-        if pose_predictions_for_frame:
-            pitcher_data = pose_predictions_for_frame[0]
-            # 直接呼叫本檔案內的繪圖函式
-            draw_pitcher_on_frame(frame, pitcher_data)
-
-        # --- 畫棒球 + 計算速度 ---
-        if frame_idx in ball_frames:
-            current_ball_box = ball_frames[frame_idx]
-            # 確保 current_ball_box 不是 None 才能進行 map(int, ...)
-            if current_ball_box is not None:
-                x1, y1, x2, y2 = map(int, current_ball_box)
-                cx = (x1 + x2) // 2
-                cy = (y1 + y2) // 2
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
-                cv2.putText(frame, "Baseball", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
-
-                if prev_center is not None and prev_frame_idx is not None:
-                    dx = cx - prev_center[0]
-                    dy = cy - prev_center[1]
-                    distance_pixels = math.sqrt(dx**2 + dy**2)
-                    dt = (frame_idx - prev_frame_idx) / fps
-
-                    if dt > 0:
-                        distance_m = distance_pixels * pixel_to_meter
-                        speed_mps = distance_m / dt
-                        speed_kmh = speed_mps * 3.6
-
-                        if min_valid_speed_kmh <= speed_kmh <= max_valid_speed_kmh:
-                            max_speed_kmh = max(max_speed_kmh, speed_kmh)
-
-                prev_center = (cx, cy)
-                prev_frame_idx = frame_idx
-            # 如果 current_ball_box 是 None，則跳過棒球框繪製和速度計算
-
-        # --- 畫最大球速 ---
-        label = f"Max Speed: {max_speed_kmh:.1f} km/h"
-        cv2.rectangle(frame, (30, 30), (360, 80), (0, 0, 0), -1)  # 黑底
-        cv2.putText(frame, label, (40, 65), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)  # 白字
-
-        out.write(frame)
-        frame_idx += 1
-
-    cap.release()
-    out.release()
-    return output_video_path, float(np.round(max_speed_kmh,2))
+    output_video_path, max_speed_kmh, _ = render_video_and_key_frames(
+        input_video_path, pose_json, ball_json, {},
+        pixel_to_meter, min_valid_speed_kmh, max_valid_speed_kmh
+    )
+    return output_video_path, max_speed_kmh
 
 def save_specific_frames(input_video_path: str, frame_indices: dict) -> dict:
     """
@@ -179,46 +361,10 @@ def save_specific_frames(input_video_path: str, frame_indices: dict) -> dict:
         一個字典，包含儲存的圖片路徑，例如
         {"release_frame_path": "path/to/release.jpg", ...}。
     """
-    saved_image_paths = {}
-    output_dir = "temp_rendered_videos" # 使用相同的暫存目錄
-    os.makedirs(output_dir, exist_ok=True)
-
-    cap = cv2.VideoCapture(input_video_path)
-    if not cap.isOpened():
+    snapshotter = KeyFrameSnapshotter(input_video_path, frame_indices)
+    try:
+        # 所有目標影格都已儲存時管線會提前結束
+        run_frame_pipeline(input_video_path, [snapshotter])
+    except RuntimeError:
         print(f"無法開啟影片：{input_video_path}")
-        return saved_image_paths
-
-    # 預先找出所有需要儲存的影格編號，並排序，以便一次性遍歷影片
-    frames_to_save = sorted([
-        (name, idx) for name, idx in frame_indices.items() if idx is not None
-    ], key=lambda x: x[1])
-
-    current_frame_idx = 0
-    frame_pointer = 0 # 用於追蹤 frames_to_save 的進度
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        if frame_pointer < len(frames_to_save):
-            name, target_frame_idx = frames_to_save[frame_pointer]
-
-            if current_frame_idx == target_frame_idx:
-                # 構建圖片儲存路徑
-                image_filename = f"{name}_{os.path.basename(input_video_path).replace('.', '_')}.jpg"
-                image_path = os.path.join(output_dir, image_filename)
-                
-                cv2.imwrite(image_path, frame)
-                saved_image_paths[f"{name}_frame_path"] = image_path
-                print(f"已儲存 {name} 影格至 {image_path}")
-                frame_pointer += 1 # 移動到下一個要儲存的影格
-
-        current_frame_idx += 1
-
-        # 如果所有目標影格都已儲存，則提前結束
-        if frame_pointer == len(frames_to_save):
-            break
-
-    cap.release()
-    return saved_image_paths
+    return snapshotter.saved_image_paths
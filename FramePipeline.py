@@ -0,0 +1,93 @@
+import cv2
+from typing import List, NamedTuple
+
+"""
+單次解碼的影格管線：
+影片只用 cv2.VideoCapture 解碼一次，每一幀依序交給多個 consumer 處理
+(骨架繪製、棒球框繪製、關鍵影格擷取、球速追蹤、影片輸出...)。
+"""
+
+
+class VideoMeta(NamedTuple):
+    width: int
+    height: int
+    fps: float
+    frame_count: int
+
+
+class FrameConsumer:
+    """
+    影格消費者的基底類別。子類別依需要覆寫以下方法：
+    - on_start: 開始解碼前呼叫一次，拿到影片的寬高與 fps
+    - on_frame: 每解碼一幀呼叫一次，可直接在 frame 上繪圖 (in-place)
+    - on_end: 解碼結束後呼叫一次 (釋放資源)
+    - done: 回傳 True 代表這個 consumer 已不需要後續影格
+    """
+
+    def on_start(self, meta: VideoMeta) -> None:
+        pass
+
+    def on_frame(self, frame_idx: int, frame) -> None:
+        pass
+
+    def on_end(self) -> None:
+        pass
+
+    @property
+    def done(self) -> bool:
+        return False
+
+
+def read_video_meta(cap) -> VideoMeta:
+    return VideoMeta(
+        width=int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        height=int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        fps=cap.get(cv2.CAP_PROP_FPS),
+        frame_count=int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+    )
+
+
+def probe_video(input_video_path: str) -> VideoMeta:
+    """只讀取影片資訊 (解析度、fps、總幀數)，不解碼任何影格。"""
+    cap = cv2.VideoCapture(input_video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"無法開啟影片：{input_video_path}")
+    try:
+        return read_video_meta(cap)
+    finally:
+        cap.release()
+
+
+def run_frame_pipeline(input_video_path: str, consumers: List[FrameConsumer]) -> VideoMeta:
+    """
+    解碼影片一次，並把每一幀依 consumers 的順序交給它們處理。
+    注意 consumer 的順序就是處理順序：需要原始畫面的 consumer (例如關鍵影格擷取)
+    必須排在會在畫面上繪圖的 consumer 之前。
+    當所有 consumer 都回報 done 時會提前結束解碼。
+    """
+    cap = cv2.VideoCapture(input_video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"無法開啟影片：{input_video_path}")
+
+    meta = read_video_meta(cap)
+    started = []
+    try:
+        for consumer in consumers:
+            consumer.on_start(meta)
+            started.append(consumer)
+
+        frame_idx = 0
+        while not all(consumer.done for consumer in consumers):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            for consumer in consumers:
+                if not consumer.done:
+                    consumer.on_frame(frame_idx, frame)
+            frame_idx += 1
+    finally:
+        cap.release()
+        for consumer in started:
+            consumer.on_end()
+
+    return meta
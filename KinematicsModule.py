@@ -2,7 +2,61 @@
 import os
 import json
 import numpy as np
-import cv2
+
+"""
+骨架序列資料結構
+"""
+class PoseSequence:
+    """
+    以 NumPy 陣列表示的骨架序列：
+    - keypoints: np.ndarray(T, 17, 3)，連續記憶體，最後一維為 (x, y, score)
+    - frames: np.ndarray(T,)，每一列對應的影格編號
+    - num_keypoints: np.ndarray(T,)，API 原始回傳的關節點數量 (不足 17 點的列以 NaN 補齊)
+    影格編號到列索引的查詢為 O(1) (查表陣列)。
+    """
+    __slots__ = ("keypoints", "frames", "num_keypoints", "_row_lookup")
+
+    def __init__(self, keypoints, frames, num_keypoints=None):
+        self.keypoints = np.ascontiguousarray(keypoints, dtype=np.float64).reshape(-1, 17, 3)
+        self.frames = np.asarray(frames, dtype=np.int64).reshape(-1)
+        if num_keypoints is None:
+            num_keypoints = np.full(len(self.frames), 17, dtype=np.int64)
+        self.num_keypoints = np.asarray(num_keypoints, dtype=np.int64)
+
+        # 影格編號 → 列索引；同一影格出現多次時以第一次為準
+        lookup_size = int(self.frames.max()) + 1 if len(self.frames) and self.frames.min() >= 0 else 0
+        self._row_lookup = np.full(lookup_size, -1, dtype=np.int64)
+        if lookup_size:
+            rows = np.arange(len(self.frames))
+            self._row_lookup[self.frames[::-1]] = rows[::-1]
+
+    def __len__(self):
+        return len(self.frames)
+
+    def row_of(self, frame_id):
+        """回傳影格編號對應的列索引，找不到時回傳 None。"""
+        if frame_id is None or not 0 <= frame_id < len(self._row_lookup):
+            return None
+        row = self._row_lookup[frame_id]
+        return int(row) if row >= 0 else None
+
+
+def as_pose_sequence(pose_sequence):
+    """
+    舊版相容：把 list[{"frame": int, "keypoints": np.ndarray(17, 3)}] 轉成 PoseSequence。
+    已經是 PoseSequence 則直接回傳。
+    """
+    if isinstance(pose_sequence, PoseSequence):
+        return pose_sequence
+    keypoints = np.full((len(pose_sequence), 17, 3), np.nan)
+    num_keypoints = np.zeros(len(pose_sequence), dtype=np.int64)
+    for i, item in enumerate(pose_sequence):
+        kp = np.asarray(item["keypoints"], dtype=np.float64)[:17]
+        keypoints[i, :kp.shape[0], :kp.shape[1]] = kp
+        num_keypoints[i] = kp.shape[0]
+    frames = [item["frame"] for item in pose_sequence]
+    return PoseSequence(keypoints, frames, num_keypoints)
+
 # landing.py
 """
 落地那一幀
@@ -10,11 +64,12 @@ import cv2
 def detect_landing_frame(pose_sequence, release_frame, back_offset=9):
     """
     根據 release_frame 向前推 back_offset 幀作為落地點
-    - pose_sequence: 骨架序列（list of dict，含 frame 與 keypoints）
+    - pose_sequence: 骨架序列 (PoseSequence)
     - release_frame: 偵測出的出手幀編號
     - back_offset: 預設往前 9 幀
     """
-    candidate_index = next((i for i, item in enumerate(pose_sequence) if item["frame"] == release_frame), None)
+    pose_sequence = as_pose_sequence(pose_sequence)
+    candidate_index = pose_sequence.row_of(release_frame)
     if candidate_index is None:
         print(f"❌ 找不到 release_frame = {release_frame} 的對應資料")
         return None
@@ -24,60 +79,45 @@ def detect_landing_frame(pose_sequence, release_frame, back_offset=9):
         print(f"❌ 推估 index = {landing_index} 超出範圍")
         return None
 
-    landing_item = pose_sequence[landing_index]
-    landing_frame = landing_item["frame"]
-
-    return landing_frame
+    return int(pose_sequence.frames[landing_index])
 
 # release.py
 """
 出手那一幀
 """
 def detect_release_frame(pose_sequence):
-    candidate_frames = []
-
-    for item in pose_sequence:
-        frame_idx = item["frame"]
-        keypoints = item["keypoints"]
-        if keypoints.shape[0] < 17:
-            continue
-
-        rs = COCO_KEYPOINTS["right_shoulder"]
-        re = COCO_KEYPOINTS["right_elbow"]
-        rw = COCO_KEYPOINTS["right_wrist"]
-
-        right_shoulder = keypoints[rs]
-        right_elbow = keypoints[re]
-        right_wrist = keypoints[rw]
-
-        # 1. 手腕高於肩膀（Y 軸）
-        wrist_above_shoulder = right_wrist[1] < right_shoulder[1]
-        # 2. 手肘在手腕後方（X 軸）
-        elbow_behind_wrist = right_elbow[0] < right_wrist[0]
-        # 3. 肘角
-        elbow_angle = calculate_pixel_angle_from_points(
-            right_wrist[:2], right_elbow[:2], right_shoulder[:2]
-        )
-        # 4. 手臂長度（wrist→elbow + elbow→shoulder）
-        arm_length = np.linalg.norm(right_wrist - right_elbow) + np.linalg.norm(right_elbow - right_shoulder)
-
-        if wrist_above_shoulder and elbow_behind_wrist:
-            candidate_frames.append({
-                "frame": frame_idx,
-                "elbow_angle": elbow_angle,
-                "arm_length": arm_length
-            })
-
-    if not candidate_frames:
+    pose_sequence = as_pose_sequence(pose_sequence)
+    keypoints = pose_sequence.keypoints
+
+    right_shoulder = keypoints[:, COCO_KEYPOINTS["right_shoulder"]]
+    right_elbow = keypoints[:, COCO_KEYPOINTS["right_elbow"]]
+    right_wrist = keypoints[:, COCO_KEYPOINTS["right_wrist"]]
+
+    # 1. 手腕高於肩膀（Y 軸）
+    wrist_above_shoulder = right_wrist[:, 1] < right_shoulder[:, 1]
+    # 2. 手肘在手腕後方（X 軸）
+    elbow_behind_wrist = right_elbow[:, 0] < right_wrist[:, 0]
+    # 3. 肘角
+    elbow_angle = calculate_pixel_angles(right_wrist[:, :2], right_elbow[:, :2], right_shoulder[:, :2])
+    # 4. 手臂長度（wrist→elbow + elbow→shoulder）
+    arm_length = (np.linalg.norm(right_wrist - right_elbow, axis=-1)
+                  + np.linalg.norm(right_elbow - right_shoulder, axis=-1))
+
+    candidates = (pose_sequence.num_keypoints >= 17) & wrist_above_shoulder & elbow_behind_wrist
+    if not candidates.any():
         print("⚠️ 沒有符合條件的出手幀")
         return None
 
     # 🔍 先挑肘角最大，再用臂長決勝負（肘角差距容忍 5 度內）
-    max_angle = max(f["elbow_angle"] for f in candidate_frames)
-    top_angle_candidates = [f for f in candidate_frames if abs(f["elbow_angle"] - max_angle) < 5]
-    best_frame = max(top_angle_candidates, key=lambda f: f["arm_length"])
+    candidate_angles = np.where(candidates, elbow_angle, np.nan)
+    if np.isnan(candidate_angles).all():
+        print("⚠️ 沒有符合條件的出手幀")
+        return None
+    max_angle = np.nanmax(candidate_angles)
+    top_angle_candidates = np.abs(candidate_angles - max_angle) < 5
+    best_row = np.argmax(np.where(top_angle_candidates, arm_length, -np.inf))
 
-    return best_frame["frame"]
+    return int(pose_sequence.frames[best_row])
 
 # shoulder.py
 """
@@ -92,54 +132,45 @@ def detect_shoulder_frame(pose_sequence, release_frame):
 
     return: shoulder_frame 編號（int）或 None
     """
-    candidate_list = []
-    start_found = False
+    pose_sequence = as_pose_sequence(pose_sequence)
+    keypoints = pose_sequence.keypoints
 
     LEFT_SHOULDER = COCO_KEYPOINTS["left_shoulder"]
     RIGHT_SHOULDER = COCO_KEYPOINTS["right_shoulder"]
     LEFT_HIP = COCO_KEYPOINTS["left_hip"]
     RIGHT_WRIST = COCO_KEYPOINTS["right_wrist"]
 
-    for item in pose_sequence:
-        frame_idx = item["frame"]
-        if frame_idx > release_frame:
-            break
-
-        keypoints = item["keypoints"]
-        if np.min(keypoints[[LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_HIP, RIGHT_WRIST], 2]) < 0.3:
-            continue
+    # 只看到第一個超過出手幀的影格為止
+    before_release = np.cumsum(pose_sequence.frames > release_frame) == 0
+    confident = np.min(keypoints[:, [LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_HIP, RIGHT_WRIST], 2], axis=1) >= 0.3
+    usable = before_release & confident
 
-        l_sh = keypoints[LEFT_SHOULDER][:2]
-        r_sh = keypoints[RIGHT_SHOULDER][:2]
-        l_hip = keypoints[LEFT_HIP][:2]
-        r_wr = keypoints[RIGHT_WRIST][:2]
+    l_sh = keypoints[:, LEFT_SHOULDER, :2]
+    r_sh = keypoints[:, RIGHT_SHOULDER, :2]
+    l_hip = keypoints[:, LEFT_HIP, :2]
+    r_wr = keypoints[:, RIGHT_WRIST, :2]
 
-        # 起始條件：右手腕高於右肩
-        if not start_found:
-            if r_wr[1] < r_sh[1]:
-                start_found = True
-            else:
-                continue
-
-        # 排除：右手腕落下 或 手腕已超過肩膀
-        if r_wr[0] > r_sh[0] or r_wr[1] >= r_sh[1]:
-            continue
+    # 起始條件：右手腕高於右肩 (第一次成立之後的影格都算已啟動)
+    wrist_above_shoulder = r_wr[:, 1] < r_sh[:, 1]
+    started = np.logical_or.accumulate(usable & wrist_above_shoulder)
 
-        # 肩膀開啟角度（l_sh - r_sh - l_hip）
-        angle = calculate_pixel_angle_from_points(l_sh, r_sh, l_hip)
-        shoulder_distance = abs(r_sh[0] - l_sh[0])
-        candidate_list.append((angle, shoulder_distance, frame_idx))
+    # 排除：右手腕落下 或 手腕已超過肩膀
+    excluded = (r_wr[:, 0] > r_sh[:, 0]) | (r_wr[:, 1] >= r_sh[:, 1])
+    candidate_rows = np.flatnonzero(usable & started & ~excluded)
 
-    if not candidate_list:
+    if len(candidate_rows) == 0:
         print("❌ 無法找到符合條件的肩膀開啟幀")
         return None
 
+    # 肩膀開啟角度（l_sh - r_sh - l_hip）
+    angles = calculate_pixel_angles(l_sh[candidate_rows], r_sh[candidate_rows], l_hip[candidate_rows])
+    shoulder_distance = np.abs(r_sh[candidate_rows, 0] - l_sh[candidate_rows, 0])
+
     # 取肩膀 X 軸距離最大的前三名 → 選角度最大者
-    top3 = sorted(candidate_list, key=lambda x: -x[1])[:3]
-    best = max(top3, key=lambda x: x[0])
-    shoulder_frame = best[2]
+    top3 = np.argsort(-shoulder_distance, kind="stable")[:3]
+    best = top3[np.argmax(np.nan_to_num(angles[top3], nan=-np.inf))]
 
-    return shoulder_frame
+    return int(pose_sequence.frames[candidate_rows[best]])
 
 """
 取特徵
@@ -165,12 +196,24 @@ COCO_KEYPOINTS = {
 }
 
 
+def trunk_flexion_series(keypoints):
+    """
+    每幀的肩膀中心 Y 與髖部中心 Y 的差值。
+    keypoints: np.ndarray(..., 17, 3)，回傳 np.ndarray(...)
+    """
+    ls, rs = COCO_KEYPOINTS["left_shoulder"], COCO_KEYPOINTS["right_shoulder"]
+    lh, rh = COCO_KEYPOINTS["left_hip"], COCO_KEYPOINTS["right_hip"]
+    shoulder_y = (keypoints[..., ls, 1] + keypoints[..., rs, 1]) / 2
+    hip_y = (keypoints[..., lh, 1] + keypoints[..., rh, 1]) / 2
+    return shoulder_y - hip_y
+
+
 def feature2kinematic(pose_sequence, release_frame, landing_frame, shoulder_frame=None):
     """
     從姿勢序列與關鍵幀中提取基本 2D 力學特徵
 
     輸入：
-        pose_sequence: list of {"frame": int, "keypoints": np.ndarray(17, 3)}
+        pose_sequence: PoseSequence (或舊格式 list of {"frame": int, "keypoints": np.ndarray(17, 3)})
         release_frame: 出手幀編號
         landing_frame: 踏地幀編號
         shoulder_frame: 肩膀展開幀（暫未使用，可預留）
@@ -184,19 +227,13 @@ def feature2kinematic(pose_sequence, release_frame, landing_frame, shoulder_fram
         - Trunk_flexion_at_BR
         - Trunk_lateral_flexion_at_HS
     """
+    pose_sequence = as_pose_sequence(pose_sequence)
     kinematic = {}
 
     # === Trunk flexion excursion（軀幹前彎動作幅度）===
     # 透過每幀的肩膀中心 Y 與髖部中心 Y 的差值，計算最大與最小值差，代表整體前傾變化範圍
-    trunk_flexions = []
-    for item in pose_sequence:
-        keypoints = item["keypoints"]
-        ls, rs = COCO_KEYPOINTS["left_shoulder"], COCO_KEYPOINTS["right_shoulder"]
-        lh, rh = COCO_KEYPOINTS["left_hip"], COCO_KEYPOINTS["right_hip"]
-        shoulder_y = (keypoints[ls][1] + keypoints[rs][1]) / 2
-        hip_y = (keypoints[lh][1] + keypoints[rh][1]) / 2
-        trunk_flexions.append(shoulder_y - hip_y)
-    kinematic["Trunk_flexion_excursion"] = max(trunk_flexions) - min(trunk_flexions)
+    trunk_flexions = trunk_flexion_series(pose_sequence.keypoints)
+    kinematic["Trunk_flexion_excursion"] = float(np.nanmax(trunk_flexions) - np.nanmin(trunk_flexions))
 
     # === Pelvis obliquity at FC（踏地瞬間的骨盆傾斜角）===
     # 用左髖與右髖的 Y 值差代表骨盆左右傾斜，Y 差越大表示傾斜越明顯
@@ -204,7 +241,7 @@ def feature2kinematic(pose_sequence, release_frame, landing_frame, shoulder_fram
     if keypoints_fc is not None:
         lh, rh = COCO_KEYPOINTS["left_hip"], COCO_KEYPOINTS["right_hip"]
         pelvis_obliquity = keypoints_fc[lh][1] - keypoints_fc[rh][1]
-        kinematic["Pelvis_obliquity_at_FC"] = pelvis_obliquity
+        kinematic["Pelvis_obliquity_at_FC"] = float(pelvis_obliquity)
 
     # === Trunk rotation at BR（釋球瞬間的軀幹旋轉角）===
     # 取左右肩的 X 向量差並轉為角度，表示橫向旋轉程度（水平旋轉角）
@@ -213,48 +250,43 @@ def feature2kinematic(pose_sequence, release_frame, landing_frame, shoulder_fram
         ls, rs = COCO_KEYPOINTS["left_shoulder"], COCO_KEYPOINTS["right_shoulder"]
         shoulder_vec = keypoints_br[ls][:2] - keypoints_br[rs][:2]
         trunk_rotation = np.arctan2(shoulder_vec[1], shoulder_vec[0]) * 180 / np.pi
-        kinematic["Trunk_rotation_at_BR"] = trunk_rotation
+        kinematic["Trunk_rotation_at_BR"] = float(trunk_rotation)
 
         # === Shoulder abduction at BR（肩部外展角）===
         # 以「右手腕–右手肘–右肩膀」三點形成的角度表示肩膀抬起程度（右投）
         re = COCO_KEYPOINTS["right_elbow"]
         rw = COCO_KEYPOINTS["right_wrist"]
-        rs = COCO_KEYPOINTS["right_shoulder"]
         shoulder_abduction = calculate_pixel_angle_from_points(
             keypoints_br[rw][:2], keypoints_br[re][:2], keypoints_br[rs][:2]
         )
-        kinematic["Shoulder_abduction_at_BR"] = shoulder_abduction
+        kinematic["Shoulder_abduction_at_BR"] = None if shoulder_abduction is None else float(shoulder_abduction)
 
         # === Trunk flexion at BR（釋球瞬間的軀幹前傾角）===
         # 釋球幀的肩膀中心 Y 與骨盆中心 Y 差值，數值越大表示向前傾越多
-        lh, rh = COCO_KEYPOINTS["left_hip"], COCO_KEYPOINTS["right_hip"]
-        shoulder_y = (keypoints_br[ls][1] + keypoints_br[rs][1]) / 2
-        hip_y = (keypoints_br[lh][1] + keypoints_br[rh][1]) / 2
-        kinematic["Trunk_flexion_at_BR"] = shoulder_y - hip_y
+        kinematic["Trunk_flexion_at_BR"] = float(trunk_flexion_series(keypoints_br))
 
     # === Trunk lateral flexion at HS（起投瞬間的軀幹側彎角）===
     # 起投幀左右肩膀的 Y 軸差異，表示是否側向一側（正值：左肩低於右肩）
-    keypoints_hs = get_keypoints_at(pose_sequence, pose_sequence[0]["frame"])
-    if keypoints_hs is not None:
-        ls, rs = COCO_KEYPOINTS["left_shoulder"], COCO_KEYPOINTS["right_shoulder"]
-        kinematic["Trunk_lateral_flexion_at_HS"] = keypoints_hs[ls][1] - keypoints_hs[rs][1]
+    keypoints_hs = pose_sequence.keypoints[0]
+    ls, rs = COCO_KEYPOINTS["left_shoulder"], COCO_KEYPOINTS["right_shoulder"]
+    kinematic["Trunk_lateral_flexion_at_HS"] = float(keypoints_hs[ls][1] - keypoints_hs[rs][1])
 
     return kinematic
 
 def extract_pitching_biomechanics(result):
     """
-    接收已處理好的 pose_sequence，偵測出手、落地、肩膀展開幀。
+    接收 POSE API 回傳的 JSON (或已轉好的 PoseSequence)，偵測出手、落地、肩膀展開幀並計算特徵。
     Args:
-        pose_sequence: list[dict]，每個元素為 {"frame": int, "keypoints": np.ndarray(17, 3)}
+        result: POSE API 回傳的 dict，或 PoseSequence
 
     Returns:
         dict: 包含 release、landing、shoulder 三幀與總長度
     """
 
-    # ✅ 先手動轉成 pose_sequence
-    pose_sequence = load_pose_from_response(result)
-    
-    if not pose_sequence:
+    # ✅ 先轉成 PoseSequence (T, 17, 3)
+    pose_sequence = result if isinstance(result, PoseSequence) else load_pose_from_response(result)
+
+    if not len(pose_sequence):
         print("❌ pose_sequence 為空")
         return {}
 
@@ -286,48 +318,160 @@ def extract_pitching_biomechanics(result):
 }
 
 
-# utils.py
+# batch.py
 """
-通用函式：讀取 pose_sequence、計算角度等
+批次計算：一次處理多段骨架序列，輸出特徵表
 """
-def load_pose_from_response(result_json):
+# 批次輸出的欄位順序；影格欄位找不到時為 -1，特徵欄位找不到時為 NaN
+BIOMECHANICS_FRAME_FIELDS = ("release_frame", "landing_frame", "shoulder_frame", "total_frames")
+BIOMECHANICS_FEATURE_FIELDS = (
+    "Trunk_flexion_excursion",
+    "Pelvis_obliquity_at_FC",
+    "Trunk_rotation_at_BR",
+    "Shoulder_abduction_at_BR",
+    "Trunk_flexion_at_BR",
+    "Trunk_lateral_flexion_at_HS",
+)
+BIOMECHANICS_DTYPE = np.dtype(
+    [(name, np.int64) for name in BIOMECHANICS_FRAME_FIELDS]
+    + [(name, np.float64) for name in BIOMECHANICS_FEATURE_FIELDS]
+)
+
+
+def iter_pose_sequences(poses, lengths=None, offsets=None):
     """
-    從 FastAPI 回傳的 JSON 解析出 pose_sequence 格式
-    - result_json: API 回傳的 dict
-    - 回傳: list[{"frame": int, "keypoints": np.ndarray(17, 3)}]
+    把三種批次輸入格式逐一轉成 PoseSequence：
+    - ragged: list，元素可為 PoseSequence、POSE API 回傳的 dict，或 np.ndarray(T_i, 17, 2 或 3)
+    - padded: np.ndarray(N, T_max, 17, C) 搭配 lengths (N,)，每段只取前 lengths[i] 幀
+    - packed: np.ndarray(sum(T_i), 17, C) 搭配 offsets (N+1,)，第 i 段為 offsets[i]:offsets[i+1]
+    陣列輸入的影格編號視為 0..T_i-1。
     """
-    pose_sequence = []
+    if offsets is not None:
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            yield _array_to_pose_sequence(poses[start:end])
+    elif lengths is not None:
+        for padded, length in zip(poses, lengths):
+            yield _array_to_pose_sequence(padded[:length])
+    else:
+        for item in poses:
+            if isinstance(item, PoseSequence):
+                yield item
+            elif isinstance(item, dict):
+                yield load_pose_from_response(item)
+            else:
+                yield _array_to_pose_sequence(item)
+
+
+def _array_to_pose_sequence(keypoints):
+    keypoints = np.asarray(keypoints, dtype=np.float64)
+    if keypoints.shape[-1] == 2:
+        keypoints = np.concatenate([keypoints, np.ones(keypoints.shape[:-1] + (1,))], axis=-1)
+    return PoseSequence(keypoints, np.arange(len(keypoints)))
+
 
-    for frame in result_json["frames"]:
-        if not frame["predictions"]:
-            continue
+def biomechanics_to_row(biomechanics):
+    """把 extract_pitching_biomechanics 的結果轉成一列 (tuple)，順序同 BIOMECHANICS_DTYPE。"""
+    frames = tuple(-1 if biomechanics.get(name) is None else biomechanics[name] for name in BIOMECHANICS_FRAME_FIELDS)
+    features = tuple(np.nan if biomechanics.get(name) is None else biomechanics[name] for name in BIOMECHANICS_FEATURE_FIELDS)
+    return frames + features
 
-        keypoints = np.array(frame["predictions"][0]["keypoints"])  # shape: (17, 2 or 3)
 
-        if keypoints.shape[1] == 2:
-            conf = np.ones((17, 1), dtype=np.float32)
-            keypoints = np.concatenate([keypoints, conf], axis=-1)
+def _extract_row(pose_sequence):
+    return biomechanics_to_row(extract_pitching_biomechanics(pose_sequence))
 
-        pose_sequence.append({
-            "frame": frame["frame_idx"],
-            "keypoints": keypoints
-        })
 
-    return pose_sequence
+def extract_pitching_biomechanics_batch(poses, lengths=None, offsets=None, n_jobs=1, chunksize=16, as_dataframe=False):
+    """
+    批次計算多段骨架序列的生物力學特徵。
+    Args:
+        poses, lengths, offsets: 見 iter_pose_sequences (ragged / padded / packed 三種格式)
+        n_jobs: 大於 1 時以行程池平行計算
+        chunksize: 每次送進子行程的序列數量
+        as_dataframe: True 時回傳 pandas.DataFrame，否則回傳 NumPy 結構化陣列
+    Returns:
+        每段序列一列的特徵表，欄位見 BIOMECHANICS_DTYPE
+    """
+    sequences = iter_pose_sequences(poses, lengths, offsets)
+    if n_jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            rows = list(pool.map(_extract_row, sequences, chunksize=chunksize))
+    else:
+        rows = [_extract_row(sequence) for sequence in sequences]
+
+    table = np.array(rows, dtype=BIOMECHANICS_DTYPE)
+    if as_dataframe:
+        import pandas as pd
+        return pd.DataFrame.from_records(table)
+    return table
+
+
+# utils.py
+"""
+通用函式：讀取 pose_sequence、計算角度等
+"""
+def load_pose_from_response(result_json):
+    """
+    從 FastAPI 回傳的 JSON 解析出 PoseSequence
+    - result_json: API 回傳的 dict
+    - 回傳: PoseSequence，keypoints 為 np.ndarray(T, 17, 3)；只有 (x, y) 時信心分數補 1
+    """
+    detected = [frame for frame in result_json["frames"] if frame["predictions"]]
+    frames = np.fromiter((frame["frame_idx"] for frame in detected), dtype=np.int64, count=len(detected))
+    raw_keypoints = [frame["predictions"][0]["keypoints"] for frame in detected]
+
+    try:
+        # 常見情況：每幀都是同樣形狀 (17, 2) 或 (17, 3)，一次轉成陣列
+        stacked = np.asarray(raw_keypoints, dtype=np.float64)
+    except ValueError:
+        stacked = None
+
+    if stacked is not None and stacked.ndim == 3 and stacked.shape[1] == 17:
+        keypoints = np.ones((len(detected), 17, 3))
+        keypoints[:, :, :stacked.shape[2]] = stacked[:, :, :3]
+        return PoseSequence(keypoints, frames)
+
+    # 各幀形狀不一致時逐幀填入，不足 17 點的部分以 NaN 補齊
+    keypoints = np.full((len(detected), 17, 3), np.nan)
+    num_keypoints = np.zeros(len(detected), dtype=np.int64)
+    for i, raw in enumerate(raw_keypoints):
+        kp = np.asarray(raw, dtype=np.float64)[:17]
+        keypoints[i, :kp.shape[0], :kp.shape[1]] = kp
+        if kp.shape[1] == 2:
+            keypoints[i, :kp.shape[0], 2] = 1.0
+        num_keypoints[i] = kp.shape[0]
+    return PoseSequence(keypoints, frames, num_keypoints)
 
 
 def get_keypoints_at(pose_sequence, frame_id):
     """
-    根據幀編號 frame_id 回傳該幀的 keypoints。
-    - pose_sequence: list of dict，格式為 [{"frame": int, "keypoints": np.ndarray(17, 3)}]
+    根據幀編號 frame_id 回傳該幀的 keypoints (O(1) 查表)。
+    - pose_sequence: PoseSequence
     - frame_id: int，欲查找的幀號
 
-    回傳：該幀的 keypoints，或 None 若找不到。
+    回傳：該幀的 keypoints np.ndarray(17, 3)，或 None 若找不到。
+    """
+    pose_sequence = as_pose_sequence(pose_sequence)
+    row = pose_sequence.row_of(frame_id)
+    if row is None:
+        return None
+    return pose_sequence.keypoints[row]
+
+
+def calculate_pixel_angles(a, b, c):
+    """
+    批次計算以點 b 為中心，夾在向量 ab 和 cb 之間的夾角（像素座標）
+    - a, b, c: np.ndarray(..., 2)
+    - 回傳: np.ndarray(...)，角度 (degrees)；向量長度為 0 時為 NaN
     """
-    for item in pose_sequence:
-        if item["frame"] == frame_id:
-            return item["keypoints"]
-    return None
+    ab = a - b
+    cb = c - b
+
+    norm_product = np.linalg.norm(ab, axis=-1) * np.linalg.norm(cb, axis=-1)
+    dot = np.einsum("...i,...i->...", ab, cb)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cosine_angle = np.where(norm_product > 0, dot / norm_product, np.nan)
+    return np.degrees(np.arccos(np.clip(cosine_angle, -1.0, 1.0)))
 
 
 def calculate_pixel_angle(a, b, c):
@@ -354,4 +498,3 @@ def calculate_pixel_angle_from_points(a, b, c):
     舊版本相容函式，輸入為 list 或 tuple（自動轉 np.array）
     """
     return calculate_pixel_angle(np.array(a), np.array(b), np.array(c))
-
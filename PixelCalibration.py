@@ -0,0 +1,104 @@
+# 檔案: PixelCalibration.py
+# 職責: 由 POSE API 的骨架自動估算像素換算公尺的比例 (pixel_to_meter)，取代固定的 0.04。
+#       以身高乘上人體測量比例 (Winter, Biomechanics and Motor Control of Human Movement) 得到
+#       軀幹、大腿、小腿的實際長度，再與畫面中的像素長度比較。
+#       這些肢段長度在整段投球動作中不變，只會因為轉身而在畫面上變短 (透視縮短)，
+#       所以每個肢段取各幀長度的高分位數作為「正面」長度，再以各肢段估計值的中位數作為結果。
+
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# COCO 17 關節點：5/6 肩、11/12 髖、13/14 膝、15/16 踝
+# 肢段：(起點關節, 終點關節, 佔身高的比例)；起點 / 終點為多個關節時取中點
+BODY_SEGMENTS = {
+    "trunk": ((5, 6), (11, 12), 0.288),       # 肩峰中點 -> 髖關節中點
+    "left_thigh": ((11,), (13,), 0.245),
+    "right_thigh": ((12,), (14,), 0.245),
+    "left_shin": ((13,), (15,), 0.246),
+    "right_shin": ((14,), (16,), 0.246),
+}
+NUM_KEYPOINTS = 17
+
+
+class CalibrationResult(NamedTuple):
+    pixel_to_meter: float
+    height_cm: float
+    sample_count: int          # 參與估算的 (幀, 肢段) 組數
+    segments: Dict[str, Dict]  # 肢段名稱 -> {"length_px", "samples", "pixel_to_meter"}
+
+    def to_dict(self) -> Dict:
+        return {
+            "pixel_to_meter": self.pixel_to_meter,
+            "height_cm": self.height_cm,
+            "sample_count": self.sample_count,
+            "segments": self.segments,
+        }
+
+
+def pose_keypoint_arrays(pose_json: dict) -> Tuple[np.ndarray, np.ndarray]:
+    """取出每幀第一個人 (投手) 的關節點 (F, 17, 2) 與信心分數 (F, 17)，格式不符的幀略過。"""
+    keypoints, scores = [], []
+    for frame in pose_json.get('frames', []):
+        predictions = frame.get('predictions', [])
+        if not predictions:
+            continue
+        frame_keypoints = np.asarray(predictions[0].get('keypoints') or [], dtype=np.float64)
+        frame_scores = np.asarray(predictions[0].get('keypoint_scores') or [], dtype=np.float64)
+        if frame_keypoints.shape != (NUM_KEYPOINTS, 2) or frame_scores.shape != (NUM_KEYPOINTS,):
+            continue
+        keypoints.append(frame_keypoints)
+        scores.append(frame_scores)
+    if not keypoints:
+        return np.zeros((0, NUM_KEYPOINTS, 2)), np.zeros((0, NUM_KEYPOINTS))
+    return np.stack(keypoints), np.stack(scores)
+
+
+def estimate_pixel_to_meter(keypoints: np.ndarray,
+                            scores: np.ndarray,
+                            height_cm: float,
+                            kpt_thr: float = 0.5,
+                            min_frames: int = 5,
+                            percentile: float = 90) -> Optional[CalibrationResult]:
+    """
+    以所有幀一次計算各肢段的像素長度，回傳 CalibrationResult；
+    沒有任何肢段有 min_frames 幀以上的可靠關節點時回傳 None (呼叫端改用預設比例)。
+    percentile 取高分位數而不是最大值，避免少數幀的關節點誤判造成肢段過長。
+    """
+    if len(keypoints) == 0 or not height_cm or height_cm <= 0:
+        return None
+    height_m = height_cm / 100.0
+
+    segments = {}
+    for name, (start, end, ratio) in BODY_SEGMENTS.items():
+        start_points = keypoints[:, start, :].mean(axis=1)
+        end_points = keypoints[:, end, :].mean(axis=1)
+        lengths = np.hypot(*(end_points - start_points).T)
+        reliable = (scores[:, start + end].min(axis=1) >= kpt_thr) & (lengths > 0)
+        samples = int(reliable.sum())
+        if samples < min_frames:
+            continue
+        length_px = float(np.percentile(lengths[reliable], percentile))
+        segments[name] = {
+            "length_px": round(length_px, 2),
+            "samples": samples,
+            "pixel_to_meter": ratio * height_m / length_px,
+        }
+
+    if not segments:
+        return None
+    estimates = np.asarray([segment["pixel_to_meter"] for segment in segments.values()])
+    for segment in segments.values():
+        segment["pixel_to_meter"] = round(segment["pixel_to_meter"], 6)
+    return CalibrationResult(
+        pixel_to_meter=round(float(np.median(estimates)), 6),
+        height_cm=float(height_cm),
+        sample_count=sum(segment["samples"] for segment in segments.values()),
+        segments=segments,
+    )
+
+
+def estimate_pixel_to_meter_from_pose(pose_json: dict, height_cm: float, **options) -> Optional[CalibrationResult]:
+    """直接由 POSE API 的回傳結果估算，options 同 estimate_pixel_to_meter。"""
+    keypoints, scores = pose_keypoint_arrays(pose_json)
+    return estimate_pixel_to_meter(keypoints, scores, height_cm, **options)
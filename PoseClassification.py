@@ -1,4 +1,138 @@
-from typing import Dict, Tuple
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+
+class ProfileMatrix(NamedTuple):
+    """
+    編譯好的多個基準模型：每個模型一列、每個特徵一欄 (只包含小寫的特徵名稱)。
+    模型沒有某個特徵、或該特徵缺少平均值/標準差時，mean 與 std 為 NaN。
+    """
+    names: Tuple[str, ...]
+    features: Tuple[str, ...]
+    mean: np.ndarray   # (P, F)
+    std: np.ndarray    # (P, F)
+
+    @property
+    def feature_index(self) -> Dict[str, int]:
+        return {feature: i for i, feature in enumerate(self.features)}
+
+
+class ScoreMatrix(NamedTuple):
+    """
+    score_feature_matrix 的結果，N 為特徵向量數、P 為模型數、F 為特徵數。
+    沒有比較到的 (特徵缺少或模型沒有該特徵) 位置為 NaN；overall 在沒有任何特徵被比較時為 0。
+    """
+    z_scores: np.ndarray        # (N, P, F)
+    feature_scores: np.ndarray  # (N, P, F)
+    overall: np.ndarray         # (N, P) int
+    compared: np.ndarray        # (N, P) 被比較的特徵數
+
+
+def compile_profiles(profiles: Sequence[Tuple[str, dict]]) -> ProfileMatrix:
+    """
+    把多個 (模型名稱, profile_data) 編譯成平均值與標準差矩陣，只需做一次，之後可以對任意多筆特徵計分。
+    特徵欄位為所有模型特徵的聯集 (依第一次出現的順序)。
+    """
+    # 使用者特徵名稱轉小寫後以模型的特徵名稱精確查詢 (與逐一比較的舊版相同)，
+    # 因此只有小寫的模型特徵名稱會被比對到，含大寫的名稱不列入欄位
+    features: Dict[str, int] = {}
+    for _, profile_data in profiles:
+        for key in (profile_data or {}):
+            if key == key.lower():
+                features.setdefault(key, len(features))
+
+    mean = np.full((len(profiles), len(features)), np.nan)
+    std = np.full((len(profiles), len(features)), np.nan)
+    for row, (_, profile_data) in enumerate(profiles):
+        for key, profile_stats in (profile_data or {}).items():
+            column = features.get(key)
+            if column is None or not profile_stats or profile_stats.get('mean') is None or profile_stats.get('std') is None:
+                continue
+            mean[row, column] = profile_stats['mean']
+            std[row, column] = profile_stats['std']
+
+    return ProfileMatrix(tuple(name for name, _ in profiles), tuple(features), mean, std)
+
+
+def encode_features(features_list: Sequence[dict], compiled: ProfileMatrix) -> np.ndarray:
+    """把多筆使用者特徵 (dict) 依 compiled 的特徵欄位轉成 (N, F) 陣列，缺少或非數值的特徵為 NaN。"""
+    index = compiled.feature_index
+    values = np.full((len(features_list), len(compiled.features)), np.nan)
+    for row, features in enumerate(features_list):
+        for key, user_value in features.items():
+            column = index.get(key.lower())
+            if column is not None and isinstance(user_value, (int, float)) and not isinstance(user_value, bool):
+                values[row, column] = user_value
+    return values
+
+
+def score_feature_matrix(values: np.ndarray, compiled: ProfileMatrix) -> ScoreMatrix:
+    """
+    一次計算 N 筆特徵向量 (N, F) 對 P 個模型的分數。
+
+    每個特徵的 Z-score 為 |使用者數值 - 平均值| / 標準差 (標準差為 0 時為 0)，
+    分數在 Z-score 為 0 時為 100，隨著 Z-score 增加而線性下降，在 Z-score=4 時降至 0；
+    整體分數為被比較到的特徵分數的平均值 (取整數)。
+    """
+    diff = values[:, None, :] - compiled.mean[None, :, :]
+    std = np.broadcast_to(compiled.std[None, :, :], diff.shape)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z_scores = np.where(std == 0, 0.0, np.abs(diff / std))
+    # 使用者沒有該特徵或模型沒有該特徵時不比較
+    z_scores[np.isnan(diff) | np.isnan(std)] = np.nan
+    feature_scores = np.maximum(0.0, 100.0 - z_scores * 25)
+
+    compared = (~np.isnan(feature_scores)).sum(axis=2)
+    totals = np.nansum(feature_scores, axis=2)
+    # 沒有比較到任何特徵時 totals 為 0，整體分數為 0
+    overall = np.trunc(totals / np.maximum(compared, 1)).astype(np.int64)
+    return ScoreMatrix(z_scores, feature_scores, overall, compared)
+
+
+def _comparison_details(features: dict, compiled: ProfileMatrix, scores: ScoreMatrix,
+                        row: int, profile: int) -> Dict:
+    """組出與 calculate_score_from_comparison 相同格式的每個特徵比較結果 (依使用者特徵的順序)。"""
+    index = compiled.feature_index
+    details = {}
+    for key, user_value in features.items():
+        column = index.get(key.lower())
+        if column is None or np.isnan(scores.feature_scores[row, profile, column]):
+            continue
+        details[key] = {
+            "user_value": user_value,
+            "mean": float(compiled.mean[profile, column]),
+            "std": float(compiled.std[profile, column]),
+            "z_score": float(scores.z_scores[row, profile, column]),
+            "score": int(scores.feature_scores[row, profile, column])
+        }
+    return details
+
+
+def score_features_batch(features_list: Sequence[dict], compiled: ProfileMatrix,
+                         with_details: bool = True) -> List[List[Tuple[int, Dict]]]:
+    """
+    多筆特徵對多個模型計分 (一次 NumPy 運算)，回傳 results[i][p] = (整體分數, 每個特徵的比較結果)。
+    只需要整體分數時 (例如批次重新計分) 可以關閉 with_details。
+    """
+    scores = score_feature_matrix(encode_features(features_list, compiled), compiled)
+    results = []
+    for row, features in enumerate(features_list):
+        row_results = []
+        for profile in range(len(compiled.names)):
+            if scores.compared[row, profile] == 0:
+                row_results.append((0, {}))
+                continue
+            details = _comparison_details(features, compiled, scores, row, profile) if with_details else {}
+            row_results.append((int(scores.overall[row, profile]), details))
+        results.append(row_results)
+    return results
+
+
+def calculate_scores(features: dict, compiled: ProfileMatrix) -> List[Tuple[int, Dict]]:
+    """一筆特徵對 compiled 中每個模型計分，回傳每個模型的 (整體分數, 每個特徵的比較結果)。"""
+    return score_features_batch([features], compiled)[0]
+
 
 def calculate_score_from_comparison(features: dict, profile_data: dict) -> Tuple[int, Dict]:
     """
@@ -18,53 +152,4 @@ def calculate_score_from_comparison(features: dict, profile_data: dict) -> Tuple
     """
     if not profile_data:
         return 0, {}
-
-    total_score = 0
-    feature_count = 0
-    comparison_details = {}
-
-    for key, user_value in features.items():
-        # 在 profile_data 中尋找對應的鍵 (轉為小寫以確保匹配)
-        profile_stats = profile_data.get(key.lower())
-        
-        # 如果模型中沒有這個特徵或使用者沒有此數值，則跳過
-        if not profile_stats or user_value is None:
-            continue
-
-        mean = profile_stats.get('mean')
-        std = profile_stats.get('std')
-
-        # 如果缺乏平均值或標準差，則無法比較
-        if mean is None or std is None:
-            continue
-            
-        # 計算 Z-score，處理標準差為 0 的情況
-        if std == 0:
-            z_score = 0.0
-        else:
-            # Z-score 反映了用戶數值偏離平均值的標準差倍數
-            z_score = abs((user_value - mean) / std)
-
-        # 分數在 Z-score 為 0 時為 100，隨著 Z-score 增加而線性下降，在 Z-score=4 時降至 0
-        feature_score = max(0, 100 - z_score * 25)
-
-        total_score += feature_score
-        feature_count += 1
-        
-        # 儲存每個特徵的詳細比較結果
-        comparison_details[key] = {
-            "user_value": user_value,
-            "mean": mean,
-            "std": std,
-            "z_score": z_score,
-            "score": int(feature_score)
-        }
-
-    # 如果沒有任何特徵被成功比較，則回傳 0
-    if feature_count == 0:
-        return 0, {}
-
-    # 最終分數是所有特徵分數的平均值
-    final_score = int(total_score / feature_count)
-    
-    return final_score, comparison_details
\ No newline at end of file
+    return calculate_scores(features, compile_profiles([("", profile_data)]))[0]
@@ -0,0 +1,169 @@
+# 檔案: PoseCodec.py
+# 職責: 骨架序列的二進位格式，取代以 JSON 儲存的巢狀列表 (pitch_record.keypoints_blob)。
+#
+# 格式 (little-endian)：
+#   header 16 bytes：b"BPOS" + version (uint8) + dtype (uint8，1=float16、2=float32) + flags (uint8，bit0=zstd)
+#                    + 保留 (uint8) + 幀數 T (uint32) + 關節點數 K (uint16) + 通道數 C (uint16)
+#   body：影格編號 int32[T] + 關節點 dtype[T, K, C] (缺少的關節點為 NaN)
+#         C=3 為 x, y, 分數；由 POSE API 回傳結果編碼時 C=4，前三個通道與 load_pose_from_response 完全相同
+#         (關節點只有 x, y 時分數為 1.0，生物力學計算由 blob 或 JSON 讀取結果一致)，
+#         第四個通道為 API 原始的 keypoint_scores，只給 pose_to_response 還原使用。
+#   flags 的 bit0 為 1 時 body 整段以 zstd 壓縮。
+# 未壓縮時以 np.frombuffer 直接建立唯讀的陣列視圖，不複製資料。
+#
+# float16 的有效位數約 3 位，座標超過 1024 像素時解析度為 0.5~1 像素；需要完整精度時使用 float32。
+
+import struct
+from typing import Tuple, Union
+
+import numpy as np
+
+from KinematicsModule import PoseSequence, load_pose_from_response
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b"BPOS"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sBBBBIHH")
+
+DTYPE_CODES = {"float16": 1, "float32": 2}
+CODE_DTYPES = {1: np.dtype("<f2"), 2: np.dtype("<f4")}
+FLAG_ZSTD = 0x01
+
+
+def is_pose_blob(data) -> bool:
+    return isinstance(data, (bytes, bytearray, memoryview)) and bytes(data[:4]) == MAGIC
+
+
+def default_compression() -> str:
+    """有安裝 zstandard 時使用 zstd，否則不壓縮。"""
+    return "zstd" if zstandard is not None else "none"
+
+
+def encode_pose_arrays(frames: np.ndarray, keypoints: np.ndarray, dtype: str = "float32",
+                       compression: str = "none", level: int = 3) -> bytes:
+    """
+    把影格編號 (T,) 與關節點 (T, K, C) 編碼成二進位格式。
+    compression 為 none、zstd 或 auto (見 default_compression)。
+    """
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"不支援的骨架儲存型別: {dtype}")
+    if compression == "auto":
+        compression = default_compression()
+    if compression not in ("none", "zstd"):
+        raise ValueError(f"不支援的壓縮方式: {compression}")
+    if compression == "zstd" and zstandard is None:
+        raise RuntimeError("使用 zstd 壓縮需要安裝 zstandard 套件")
+
+    frames = np.asarray(frames).reshape(-1)
+    keypoints = np.asarray(keypoints)
+    if keypoints.ndim != 3 or len(keypoints) != len(frames):
+        raise ValueError(f"關節點陣列形狀不符: {keypoints.shape}，幀數 {len(frames)}")
+
+    body = (np.ascontiguousarray(frames, dtype="<i4").tobytes()
+            + np.ascontiguousarray(keypoints, dtype=CODE_DTYPES[DTYPE_CODES[dtype]]).tobytes())
+    flags = 0
+    if compression == "zstd":
+        body = zstandard.ZstdCompressor(level=level).compress(body)
+        flags |= FLAG_ZSTD
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, DTYPE_CODES[dtype], flags, 0,
+                         len(frames), keypoints.shape[1], keypoints.shape[2])
+    return header + body
+
+
+def _response_arrays(response: dict) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    POSE API 回傳結果 → (影格編號, 關節點 (T, 17, 4))：前三個通道為 load_pose_from_response 的結果，
+    第四個通道為 API 原始的 keypoint_scores (沒有時沿用第三個通道)。
+    """
+    pose = load_pose_from_response(response)
+    raw_scores = pose.keypoints[:, :, 2].copy()
+    detected = [frame for frame in response["frames"] if frame["predictions"]]
+    for row, frame in enumerate(detected):
+        scores = frame["predictions"][0].get("keypoint_scores")
+        if scores:
+            count = min(len(scores), int(pose.num_keypoints[row]))
+            raw_scores[row, :count] = np.asarray(scores[:count], dtype=np.float64)
+    return pose.frames, np.concatenate([pose.keypoints, raw_scores[:, :, None]], axis=2)
+
+
+def encode_pose(pose: Union[PoseSequence, dict], dtype: str = "float32",
+                compression: str = "none", level: int = 3) -> bytes:
+    """
+    編碼 PoseSequence 或 POSE API 的回傳結果 (只保留每幀第一個人的關節點)。
+    API 回傳結果另外保存原始的 keypoint_scores (第四個通道)，decode_pose 的結果與 load_pose_from_response 相同。
+    """
+    if isinstance(pose, dict):
+        frames, keypoints = _response_arrays(pose)
+        return encode_pose_arrays(frames, keypoints, dtype, compression, level)
+    return encode_pose_arrays(pose.frames, pose.keypoints, dtype, compression, level)
+
+
+def encode_keypoints_data(keypoints_data, dtype: str = "float32", compression: str = "none", level: int = 3) -> bytes:
+    """
+    把 pitch_record.keypoints_data (JSON) 轉成二進位格式。keypoints_data 可能是 POSE API 原始回傳
+    ({"frames": [...]})、影格列表，或 (T, 17, C) 的巢狀列表 (影格編號視為 0..T-1，只有 x, y 時信心分數補 1)。
+    """
+    if isinstance(keypoints_data, dict):
+        return encode_pose(keypoints_data, dtype, compression, level)
+    if keypoints_data and isinstance(keypoints_data[0], dict):
+        return encode_pose({"frames": keypoints_data}, dtype, compression, level)
+    if not keypoints_data:
+        return encode_pose_arrays(np.zeros(0), np.zeros((0, 17, 3)), dtype, compression, level)
+    keypoints = np.asarray(keypoints_data, dtype=np.float64)
+    keypoints = keypoints.reshape(-1, 17, keypoints.shape[-1])
+    if keypoints.shape[-1] == 2:
+        keypoints = np.concatenate([keypoints, np.ones(keypoints.shape[:-1] + (1,))], axis=-1)
+    return encode_pose_arrays(np.arange(len(keypoints)), keypoints, dtype, compression, level)
+
+
+def decode_pose_arrays(data: Union[bytes, memoryview]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    解碼成 (影格編號 int32 (T,), 關節點 float16/float32 (T, K, C))。
+    未壓縮時兩個陣列都是指向 data 的唯讀視圖 (零複製)；壓縮時只複製一次 (解壓縮的輸出)。
+    """
+    magic, version, dtype_code, flags, _, frame_count, num_keypoints, channels = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("不是骨架二進位格式 (magic 不符)")
+    if version != FORMAT_VERSION or dtype_code not in CODE_DTYPES:
+        raise ValueError(f"不支援的骨架格式版本 {version} / 型別 {dtype_code}")
+
+    body = memoryview(data)[HEADER.size:]
+    if flags & FLAG_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("解碼 zstd 壓縮的骨架需要安裝 zstandard 套件")
+        body = zstandard.ZstdDecompressor().decompress(body)
+
+    dtype = CODE_DTYPES[dtype_code]
+    frames = np.frombuffer(body, dtype="<i4", count=frame_count)
+    keypoints = np.frombuffer(body, dtype=dtype, count=frame_count * num_keypoints * channels,
+                              offset=frame_count * 4).reshape(frame_count, num_keypoints, channels)
+    return frames, keypoints
+
+
+def decode_pose(data: Union[bytes, memoryview]) -> PoseSequence:
+    """解碼成 PoseSequence (轉成 float64 供生物力學計算使用，只取 x, y, 分數三個通道)。"""
+    frames, keypoints = decode_pose_arrays(data)
+    keypoints = keypoints[:, :, :3]
+    # 不足 17 點的幀在編碼時以 NaN 補齊，以此還原原始的關節點數量
+    num_keypoints = (~np.isnan(keypoints).any(axis=2)).sum(axis=1)
+    return PoseSequence(keypoints, frames, num_keypoints)
+
+
+def pose_to_response(data: Union[bytes, memoryview]) -> dict:
+    """轉回 POSE API 的回傳格式 ({"frames": [...]})，供舊程式或資料庫降版使用。"""
+    frames, keypoints = decode_pose_arrays(data)
+    keypoints = keypoints.astype(np.float64)
+    result_frames = []
+    for frame_idx, frame_keypoints in zip(frames.tolist(), keypoints):
+        valid = ~np.isnan(frame_keypoints).any(axis=1)
+        prediction = {"keypoints": frame_keypoints[valid, :2].tolist()}
+        if frame_keypoints.shape[1] > 2:
+            # 有第四個通道時為 API 原始的 keypoint_scores
+            prediction["keypoint_scores"] = frame_keypoints[valid, min(frame_keypoints.shape[1], 4) - 1].tolist()
+        result_frames.append({"frame_idx": frame_idx, "predictions": [prediction]})
+    return {"frames": result_frames}
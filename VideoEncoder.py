@@ -0,0 +1,139 @@
+# 檔案: VideoEncoder.py
+# 職責: 渲染影片的輸出編碼器 (FramePipeline 的最後一個 consumer)，可替換後端：
+#       - opencv: cv2.VideoWriter (原本的作法)
+#       - ffmpeg: 把原始 BGR 影格經由 pipe 餵給 ffmpeg 子行程，以 libx264 編碼，可調整 preset / CRF，
+#                 並輸出 faststart MP4 (moov 在檔頭，前端不必等整個檔案下載完就能開始播放)
+#       兩者都支援輸出縮小解析度與降低影格率 (每 fps_divisor 幀取 1 幀) 做預覽用途。
+
+import os
+import shutil
+import subprocess
+from typing import NamedTuple, Optional
+
+import cv2
+
+from FramePipeline import FrameConsumer, VideoMeta
+
+
+class EncoderOptions(NamedTuple):
+    preset: str = "veryfast"   # libx264 preset (只有 ffmpeg 後端使用)
+    crf: int = 23              # libx264 CRF，越小畫質越好、檔案越大 (只有 ffmpeg 後端使用)
+    scale_width: int = 0       # 輸出寬度，0 代表維持原始解析度 (高度依比例計算)
+    fps_divisor: int = 1       # 每幾幀輸出 1 幀，1 代表不降低影格率
+    faststart: bool = True     # moov atom 移到檔頭 (只有 ffmpeg 後端使用)
+
+
+class FFmpegEncodeError(RuntimeError):
+    """ffmpeg 子行程結束碼不為 0。"""
+
+
+def _output_size(meta: VideoMeta, scale_width: int):
+    # libx264 + yuv420p 需要偶數的寬高，不縮放時也要把奇數的寬高往下取偶數 (例如 641x361 → 640x360)
+    if not scale_width or scale_width >= meta.width:
+        return max(2, meta.width - meta.width % 2), max(2, meta.height - meta.height % 2)
+    width = scale_width - scale_width % 2
+    height = max(2, round(meta.height * width / meta.width / 2) * 2)
+    return width, height
+
+
+class OpenCVEncoder(FrameConsumer):
+    """以 cv2.VideoWriter 寫入輸出影片。"""
+    def __init__(self, output_video_path: str, options: EncoderOptions = EncoderOptions(), fourcc: str = 'avc1'):
+        self.output_video_path = output_video_path
+        self.options = options
+        self.fourcc = fourcc
+        self.out = None
+        self.size = None
+
+    def on_start(self, meta: VideoMeta) -> None:
+        os.makedirs(os.path.dirname(self.output_video_path) or ".", exist_ok=True)
+        #fourcc = cv2.VideoWriter_fourcc(*'X264')
+        fourcc = cv2.VideoWriter_fourcc(*self.fourcc)
+        self.size = _output_size(meta, self.options.scale_width)
+        fps = meta.fps / max(1, self.options.fps_divisor)
+        self.out = cv2.VideoWriter(self.output_video_path, fourcc, fps, self.size)
+
+    def on_frame(self, frame_idx: int, frame) -> None:
+        if frame_idx % max(1, self.options.fps_divisor):
+            return
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        self.out.write(frame)
+
+    def on_end(self) -> None:
+        if self.out is not None:
+            self.out.release()
+
+
+class FFmpegPipeEncoder(FrameConsumer):
+    """
+    以 ffmpeg 子行程編碼：影格以 rawvideo (bgr24) 寫入 stdin，縮放與編碼都在 ffmpeg 內完成。
+    ffmpeg 結束碼不為 0 時在 on_end 拋出 FFmpegEncodeError。
+    """
+    def __init__(self, output_video_path: str, options: EncoderOptions = EncoderOptions(), ffmpeg_binary: str = "ffmpeg"):
+        self.output_video_path = output_video_path
+        self.options = options
+        self.ffmpeg_binary = ffmpeg_binary
+        self.process = None
+
+    def _command(self, meta: VideoMeta):
+        width, height = _output_size(meta, self.options.scale_width)
+        fps = meta.fps / max(1, self.options.fps_divisor)
+        command = [
+            self.ffmpeg_binary, "-y", "-nostats", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{meta.width}x{meta.height}", "-r", f"{fps:.6f}",
+            "-i", "-",
+            "-an", "-vf", f"scale={width}:{height}:flags=area",
+            "-c:v", "libx264", "-preset", self.options.preset, "-crf", str(self.options.crf),
+            "-pix_fmt", "yuv420p",
+        ]
+        if self.options.faststart:
+            command += ["-movflags", "+faststart"]
+        return command + [self.output_video_path]
+
+    def on_start(self, meta: VideoMeta) -> None:
+        os.makedirs(os.path.dirname(self.output_video_path) or ".", exist_ok=True)
+        self.process = subprocess.Popen(
+            self._command(meta), stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+
+    def on_frame(self, frame_idx: int, frame) -> None:
+        if frame_idx % max(1, self.options.fps_divisor):
+            return
+        try:
+            self.process.stdin.write(frame.tobytes())
+        except BrokenPipeError:
+            # ffmpeg 已經提前結束，錯誤訊息在 on_end 一併回報
+            pass
+
+    def on_end(self) -> None:
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        stderr = self.process.stderr.read().decode("utf-8", errors="replace")
+        returncode = self.process.wait()
+        if returncode != 0:
+            raise FFmpegEncodeError(f"ffmpeg 編碼失敗 (exit {returncode}): {stderr.strip()}")
+
+
+def ffmpeg_available(ffmpeg_binary: str = "ffmpeg") -> bool:
+    return shutil.which(ffmpeg_binary) is not None
+
+
+def create_video_encoder(output_video_path: str, backend: str = "opencv",
+                         options: Optional[EncoderOptions] = None, ffmpeg_binary: str = "ffmpeg") -> FrameConsumer:
+    """
+    依名稱建立編碼器：opencv、ffmpeg，或 auto (找得到 ffmpeg 執行檔就用 ffmpeg，否則用 opencv)。
+    ffmpeg 編碼失敗時由呼叫端 (見 Drawingfunction.render_video_and_key_frames) 改用 opencv 重新輸出。
+    """
+    options = options or EncoderOptions()
+    if backend == "auto":
+        backend = "ffmpeg" if ffmpeg_available(ffmpeg_binary) else "opencv"
+    if backend == "ffmpeg":
+        return FFmpegPipeEncoder(output_video_path, options, ffmpeg_binary)
+    if backend == "opencv":
+        return OpenCVEncoder(output_video_path, options)
+    raise ValueError(f"未知的影片編碼器: {backend}")
@@ -0,0 +1,30 @@
+"""Add analysis_job.claimed_by / heartbeat_at so only jobs with an expired lease are requeued
+
+Revision ID: 2b8f6c1d9e47
+Revises: 9f2c4d7e1a86
+Create Date: 2026-10-19 15:42:08.913375
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2b8f6c1d9e47'
+down_revision: Union[str, Sequence[str], None] = '9f2c4d7e1a86'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('analysis_job', sa.Column('claimed_by', sa.String(), nullable=True))
+    op.add_column('analysis_job', sa.Column('heartbeat_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('analysis_job', 'heartbeat_at')
+    op.drop_column('analysis_job', 'claimed_by')
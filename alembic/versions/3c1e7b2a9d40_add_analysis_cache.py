@@ -0,0 +1,44 @@
+"""Add analysis_cache table
+
+Revision ID: 3c1e7b2a9d40
+Revises: fe8a1a363574
+Create Date: 2026-10-18 13:05:11.402917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1e7b2a9d40'
+down_revision: Union[str, Sequence[str], None] = 'fe8a1a363574'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('analysis_cache',
+    sa.Column('video_hash', sa.String(length=64), nullable=False),
+    sa.Column('pose_data', sa.JSON(), nullable=False),
+    sa.Column('ball_data', sa.JSON(), nullable=False),
+    sa.Column('biomechanics_features', sa.JSON(), nullable=True),
+    sa.Column('max_speed_kmh', sa.Float(), nullable=True),
+    sa.Column('ball_score', sa.Float(), nullable=True),
+    sa.Column('output_video_url', sa.String(), nullable=True),
+    sa.Column('release_frame_url', sa.String(), nullable=True),
+    sa.Column('landing_frame_url', sa.String(), nullable=True),
+    sa.Column('shoulder_frame_url', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('last_accessed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('video_hash')
+    )
+    op.create_index(op.f('ix_analysis_cache_last_accessed_at'), 'analysis_cache', ['last_accessed_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_analysis_cache_last_accessed_at'), table_name='analysis_cache')
+    op.drop_table('analysis_cache')
@@ -0,0 +1,28 @@
+"""Add (player_name, id) index to pitch_analyses
+
+Revision ID: 4e9b1c7a2f63
+Revises: d2f48a6b0e15
+Create Date: 2026-10-18 15:31:47.902118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4e9b1c7a2f63'
+down_revision: Union[str, Sequence[str], None] = 'd2f48a6b0e15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_pitch_analyses_player_name_id', 'pitch_analyses', ['player_name', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_pitch_analyses_player_name_id', table_name='pitch_analyses')
@@ -0,0 +1,28 @@
+"""Add analysis_cache.ball_speed for the standalone ball speed estimate
+
+Revision ID: 5d0a8e3f7c19
+Revises: c81a6f2e5d37
+Create Date: 2026-10-18 17:42:08.311526
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d0a8e3f7c19'
+down_revision: Union[str, Sequence[str], None] = 'c81a6f2e5d37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('analysis_cache', sa.Column('ball_speed', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('analysis_cache', 'ball_speed')
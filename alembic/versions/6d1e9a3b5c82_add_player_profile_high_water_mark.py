@@ -0,0 +1,32 @@
+"""Add player_profile.last_analysis_id / analysis_count so analyses are counted exactly once
+
+Revision ID: 6d1e9a3b5c82
+Revises: 2b8f6c1d9e47
+Create Date: 2026-10-19 16:20:47.201934
+
+既有的統計不知道計入了哪些紀錄，升級時一律標記為過期，下次讀取時重建。
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6d1e9a3b5c82'
+down_revision: Union[str, Sequence[str], None] = '2b8f6c1d9e47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('player_profile', sa.Column('last_analysis_id', sa.Integer(), nullable=True))
+    op.add_column('player_profile', sa.Column('analysis_count', sa.Integer(), nullable=True))
+    op.execute(sa.text("UPDATE player_profile SET is_stale = :stale").bindparams(stale=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('player_profile', 'analysis_count')
+    op.drop_column('player_profile', 'last_analysis_id')
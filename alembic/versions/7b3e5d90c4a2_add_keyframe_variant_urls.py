@@ -0,0 +1,28 @@
+"""Add keyframe_variant_urls to analysis_cache
+
+Revision ID: 7b3e5d90c4a2
+Revises: 4e9b1c7a2f63
+Create Date: 2026-10-18 16:12:09.518734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b3e5d90c4a2'
+down_revision: Union[str, Sequence[str], None] = '4e9b1c7a2f63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('analysis_cache', sa.Column('keyframe_variant_urls', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('analysis_cache', 'keyframe_variant_urls')
@@ -0,0 +1,50 @@
+"""Add analysis_job table
+
+Revision ID: 8a4d2f61c7e3
+Revises: 3c1e7b2a9d40
+Create Date: 2026-10-18 13:41:27.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a4d2f61c7e3'
+down_revision: Union[str, Sequence[str], None] = '3c1e7b2a9d40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('analysis_job',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('stage', sa.String(), nullable=True),
+    sa.Column('progress', sa.Float(), nullable=True),
+    sa.Column('player_name', sa.String(), nullable=True),
+    sa.Column('benchmark_name', sa.String(), nullable=True),
+    sa.Column('compare_average', sa.Boolean(), nullable=True),
+    sa.Column('video_path', sa.String(), nullable=True),
+    sa.Column('video_filename', sa.String(), nullable=True),
+    sa.Column('video_hash', sa.String(length=64), nullable=True),
+    sa.Column('result', sa.JSON(), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_analysis_job_status'), 'analysis_job', ['status'], unique=False)
+    op.create_index(op.f('ix_analysis_job_player_name'), 'analysis_job', ['player_name'], unique=False)
+    op.create_index(op.f('ix_analysis_job_created_at'), 'analysis_job', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_analysis_job_created_at'), table_name='analysis_job')
+    op.drop_index(op.f('ix_analysis_job_player_name'), table_name='analysis_job')
+    op.drop_index(op.f('ix_analysis_job_status'), table_name='analysis_job')
+    op.drop_table('analysis_job')
@@ -0,0 +1,31 @@
+"""Add pitch_model.stats_state / last_kinematics_id for incremental backfill
+
+Revision ID: 8c5f3a1d7e24
+Revises: 6d1e9a3b5c82
+Create Date: 2026-10-20 10:42:15.583160
+
+既有的 tdigest 模型沒有累積狀態，下次執行 backfill_kinematics 時會整批重算一次。
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c5f3a1d7e24'
+down_revision: Union[str, Sequence[str], None] = '6d1e9a3b5c82'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('pitch_model', sa.Column('stats_state', sa.JSON(), nullable=True))
+    op.add_column('pitch_model', sa.Column('last_kinematics_id', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('pitch_model', 'last_kinematics_id')
+    op.drop_column('pitch_model', 'stats_state')
@@ -0,0 +1,30 @@
+"""Add analysis_job.owner_id so each instance only runs jobs whose spooled video it holds
+
+Revision ID: 9f2c4d7e1a86
+Revises: e3b7f05a9c21
+Create Date: 2026-10-19 10:12:31.504218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9f2c4d7e1a86'
+down_revision: Union[str, Sequence[str], None] = 'e3b7f05a9c21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('analysis_job', sa.Column('owner_id', sa.String(), nullable=True))
+    op.create_index(op.f('ix_analysis_job_owner_id'), 'analysis_job', ['owner_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_analysis_job_owner_id'), table_name='analysis_job')
+    op.drop_column('analysis_job', 'owner_id')
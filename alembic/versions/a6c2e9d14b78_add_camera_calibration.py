@@ -0,0 +1,44 @@
+"""Add camera_calibration table and pitcher height for pixel_to_meter calibration
+
+Revision ID: a6c2e9d14b78
+Revises: 5d0a8e3f7c19
+Create Date: 2026-10-18 18:25:47.902114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6c2e9d14b78'
+down_revision: Union[str, Sequence[str], None] = '5d0a8e3f7c19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('camera_calibration',
+    sa.Column('camera_session_id', sa.String(), nullable=False),
+    sa.Column('pixel_to_meter', sa.Float(), nullable=False),
+    sa.Column('height_cm', sa.Float(), nullable=True),
+    sa.Column('sample_count', sa.Integer(), nullable=True),
+    sa.Column('segments', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('camera_session_id')
+    )
+    op.add_column('player_profile', sa.Column('height_cm', sa.Float(), nullable=True))
+    op.add_column('analysis_job', sa.Column('height_cm', sa.Float(), nullable=True))
+    op.add_column('analysis_job', sa.Column('camera_session_id', sa.String(), nullable=True))
+    op.add_column('analysis_cache', sa.Column('calibration', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('analysis_cache', 'calibration')
+    op.drop_column('analysis_job', 'camera_session_id')
+    op.drop_column('analysis_job', 'height_cm')
+    op.drop_column('player_profile', 'height_cm')
+    op.drop_table('camera_calibration')
@@ -0,0 +1,42 @@
+"""Add player_profile table
+
+Revision ID: b57e0c93d1a8
+Revises: 8a4d2f61c7e3
+Create Date: 2026-10-18 14:22:40.631174
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b57e0c93d1a8'
+down_revision: Union[str, Sequence[str], None] = '8a4d2f61c7e3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 資料表建立後為空，每位投手的統計會在第一次讀取時由 pitch_analyses 重建
+    op.create_table('player_profile',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('player_name', sa.String(), nullable=False),
+    sa.Column('sample_count', sa.Integer(), nullable=True),
+    sa.Column('stats_state', sa.JSON(), nullable=True),
+    sa.Column('profile_data', sa.JSON(), nullable=True),
+    sa.Column('is_stale', sa.Boolean(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_player_profile_id'), 'player_profile', ['id'], unique=False)
+    op.create_index(op.f('ix_player_profile_player_name'), 'player_profile', ['player_name'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_player_profile_player_name'), table_name='player_profile')
+    op.drop_index(op.f('ix_player_profile_id'), table_name='player_profile')
+    op.drop_table('player_profile')
@@ -0,0 +1,32 @@
+"""Add annotation_url and analysis_job.render_mode for overlay rendering
+
+Revision ID: c81a6f2e5d37
+Revises: 7b3e5d90c4a2
+Create Date: 2026-10-18 16:54:21.604183
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c81a6f2e5d37'
+down_revision: Union[str, Sequence[str], None] = '7b3e5d90c4a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('pitch_analyses', sa.Column('annotation_url', sa.String(), nullable=True))
+    op.add_column('analysis_cache', sa.Column('annotation_url', sa.String(), nullable=True))
+    op.add_column('analysis_job', sa.Column('render_mode', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('analysis_job', 'render_mode')
+    op.drop_column('analysis_cache', 'annotation_url')
+    op.drop_column('pitch_analyses', 'annotation_url')
@@ -0,0 +1,28 @@
+"""Add updated_at to pitch_model
+
+Revision ID: d2f48a6b0e15
+Revises: b57e0c93d1a8
+Create Date: 2026-10-18 14:58:03.275410
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2f48a6b0e15'
+down_revision: Union[str, Sequence[str], None] = 'b57e0c93d1a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('pitch_model', sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('pitch_model', 'updated_at')
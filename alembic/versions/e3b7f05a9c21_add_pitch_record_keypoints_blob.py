@@ -0,0 +1,96 @@
+"""Store pitch_record poses in the PoseCodec binary format
+
+Revision ID: e3b7f05a9c21
+Revises: a6c2e9d14b78
+Create Date: 2026-10-18 19:08:33.417652
+
+升級時把既有的 keypoints_data (JSON) 分批轉成 keypoints_blob。二進位格式只保留每幀第一個人的關節點
+(與 backfill_kinematics 使用的資料相同)，轉換有損，因此保留原本的 JSON 不刪除；讀取端優先使用 keypoints_blob。
+降版時只把沒有 JSON 的列 (升級後新寫入、只有 keypoints_blob 的紀錄) 以 POSE API 的格式 ({"frames": [...]}) 寫回 keypoints_data。
+"""
+import logging
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from config import POSE_STORAGE_DTYPE, POSE_STORAGE_COMPRESSION
+from PoseCodec import encode_keypoints_data, pose_to_response
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3b7f05a9c21'
+down_revision: Union[str, Sequence[str], None] = 'a6c2e9d14b78'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+BATCH_SIZE = 500
+
+pitch_record = sa.table(
+    'pitch_record',
+    sa.column('id', sa.Integer),
+    sa.column('keypoints_data', sa.JSON),
+    sa.column('keypoints_blob', sa.LargeBinary),
+)
+
+
+def _iter_batches(connection, source_column, *conditions):
+    """以 id 分頁讀取 source_column 有值 (且符合 conditions) 的列，避免一次載入整張表。"""
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(pitch_record.c.id, source_column)
+            .where(pitch_record.c.id > last_id, source_column.isnot(None), *conditions)
+            .order_by(pitch_record.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield rows
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('pitch_record', sa.Column('keypoints_blob', sa.LargeBinary(), nullable=True))
+
+    connection = op.get_bind()
+    statement = (
+        pitch_record.update()
+        .where(pitch_record.c.id == sa.bindparam('record_id'))
+        .values(keypoints_blob=sa.bindparam('blob'))
+    )
+    converted = 0
+    for rows in _iter_batches(connection, pitch_record.c.keypoints_data):
+        updates = []
+        for record_id, keypoints_data in rows:
+            if keypoints_data is None:
+                continue
+            try:
+                blob = encode_keypoints_data(keypoints_data, POSE_STORAGE_DTYPE, POSE_STORAGE_COMPRESSION)
+            except (ValueError, TypeError, KeyError, IndexError) as e:
+                # 格式無法辨識的列只保留原本的 JSON
+                logger.warning(f"pitch_record {record_id} 的骨架無法轉換，只保留 JSON: {e}")
+                continue
+            updates.append({"record_id": record_id, "blob": blob})
+        if updates:
+            connection.execute(statement, updates)
+            converted += len(updates)
+    logger.info(f"已將 {converted} 筆 pitch_record 骨架轉成二進位格式")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    connection = op.get_bind()
+    statement = (
+        pitch_record.update()
+        .where(pitch_record.c.id == sa.bindparam('record_id'))
+        .values(keypoints_data=sa.bindparam('data'))
+    )
+    for rows in _iter_batches(connection, pitch_record.c.keypoints_blob, pitch_record.c.keypoints_data.is_(None)):
+        connection.execute(statement, [
+            {"record_id": record_id, "data": pose_to_response(blob)} for record_id, blob in rows
+        ])
+    op.drop_column('pitch_record', 'keypoints_blob')
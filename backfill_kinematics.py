@@ -0,0 +1,276 @@
+# 檔案: backfill_kinematics.py
+# 職責: 批次回填工具。從 pitch_record 串流讀取骨架資料，以多個行程平行計算生物力學特徵，
+#       大量寫入 kinematics，再依 球員 × 球種 彙整統計，建立 / 更新 PitchModel.profile_data。
+#
+# 用法:
+#   python backfill_kinematics.py                  # 計算尚未有 kinematics 的紀錄，並重建統計模型
+#   python backfill_kinematics.py --workers 8 --batch-size 1000 --copy
+#   python backfill_kinematics.py --skip-models    # 只回填 kinematics
+#   python backfill_kinematics.py --full-rebuild   # 統計模型不沿用已儲存的累積狀態，全部重算
+#
+# 中斷後重新執行即可繼續：已寫入 kinematics 的 pitch_record 會被略過 (每批各自 commit)。
+# 統計模型保存累積狀態，重新執行時只合併新寫入的 kinematics。
+
+import argparse
+import csv
+import io
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, List, Tuple
+
+import numpy as np
+from sqlalchemy import select, exists, insert
+
+from database import engine, PitchRecording, Kinematics, PitchModel
+from KinematicsModule import (
+    PoseSequence, extract_pitching_biomechanics_batch, load_pose_from_response,
+    BIOMECHANICS_FRAME_FIELDS, BIOMECHANICS_FEATURE_FIELDS,
+)
+from PoseCodec import decode_pose
+from running_stats import FeatureProfileAccumulator
+import model_cache
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# kinematics 資料表的欄位 (特徵名稱轉小寫即為欄位名稱)
+KINEMATICS_COLUMNS = ["pitch_record_id"] + list(BIOMECHANICS_FRAME_FIELDS) + [name.lower() for name in BIOMECHANICS_FEATURE_FIELDS]
+PROFILE_FEATURES = [name.lower() for name in BIOMECHANICS_FEATURE_FIELDS]
+EMPTY_POSE = PoseSequence(np.zeros((0, 17, 3)), np.zeros(0))
+
+
+def pose_from_keypoints_data(keypoints_data) -> PoseSequence:
+    """
+    pitch_record.keypoints_data 可能是 POSE API 原始回傳 ({"frames": [...]})、影格列表，
+    或已經是 (T, 17, C) 的巢狀列表；統一轉成 PoseSequence。格式不符時拋出例外。
+    """
+    if isinstance(keypoints_data, dict):
+        return load_pose_from_response(keypoints_data)
+    if keypoints_data and isinstance(keypoints_data[0], dict):
+        return load_pose_from_response({"frames": keypoints_data})
+    keypoints = np.asarray(keypoints_data, dtype=np.float64)
+    keypoints = keypoints.reshape(-1, 17, keypoints.shape[-1])
+    if keypoints.shape[-1] == 2:
+        keypoints = np.concatenate([keypoints, np.ones(keypoints.shape[:-1] + (1,))], axis=-1)
+    return PoseSequence(keypoints[:, :, :3], np.arange(len(keypoints)))
+
+
+def compute_batch(batch: List[Tuple[int, object, object]]) -> List[Dict]:
+    """在子行程中計算一批紀錄的特徵，回傳可直接寫入 kinematics 的 dict 列表。"""
+    record_ids, poses = [], []
+    for record_id, keypoints_blob, keypoints_data in batch:
+        record_ids.append(record_id)
+        try:
+            if keypoints_blob:
+                # 二進位格式直接 np.frombuffer，不必解析 JSON
+                poses.append(decode_pose(keypoints_blob))
+            elif keypoints_data:
+                # 在這裡就轉成 PoseSequence：格式錯誤的紀錄只會得到空骨架，不會讓整批 (與整個回填) 失敗
+                poses.append(pose_from_keypoints_data(keypoints_data))
+            else:
+                poses.append(EMPTY_POSE)
+        except (ValueError, TypeError, KeyError, IndexError, AttributeError):
+            logger.warning(f"pitch_record {record_id} 的骨架資料格式錯誤，以空骨架計算")
+            poses.append(EMPTY_POSE)
+
+    table = extract_pitching_biomechanics_batch(poses)
+    rows = []
+    for record_id, values in zip(record_ids, table.tolist()):
+        row = {"pitch_record_id": record_id}
+        for column, value in zip(KINEMATICS_COLUMNS[1:], values):
+            # 計算不出來的欄位寫 NULL (仍會寫入一列，代表此紀錄已處理過，下次不再重算)
+            invalid = value == -1 if isinstance(value, int) else np.isnan(value)
+            row[column] = None if invalid else value
+        rows.append(row)
+    return rows
+
+
+def write_kinematics(rows: List[Dict], use_copy: bool) -> None:
+    """大量寫入 kinematics：PostgreSQL 可選用 COPY，其餘使用 executemany 的 INSERT。"""
+    if not rows:
+        return
+    if use_copy and engine.dialect.name == "postgresql":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(["" if row[column] is None else row[column] for column in KINEMATICS_COLUMNS])
+        buffer.seek(0)
+        raw_connection = engine.raw_connection()
+        try:
+            with raw_connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY kinematics ({', '.join(KINEMATICS_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer
+                )
+            raw_connection.commit()
+        finally:
+            raw_connection.close()
+    else:
+        with engine.begin() as connection:
+            connection.execute(insert(Kinematics), rows)
+
+
+def iter_pending_batches(batch_size: int):
+    """以伺服器端游標串流讀取尚未有 kinematics 的 pitch_record。"""
+    query = (
+        select(PitchRecording.id, PitchRecording.keypoints_blob, PitchRecording.keypoints_data)
+        .where(~exists().where(Kinematics.pitch_record_id == PitchRecording.id))
+        .order_by(PitchRecording.id)
+    )
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+        for partition in result.partitions():
+            yield [(row.id, row.keypoints_blob, row.keypoints_data) for row in partition]
+
+
+def backfill_kinematics(batch_size: int, workers: int, use_copy: bool) -> int:
+    """平行計算並寫入 kinematics，回傳處理的紀錄數。"""
+    started = time.perf_counter()
+    processed = 0
+    max_in_flight = max(1, workers) * 2
+
+    def report(rows):
+        nonlocal processed
+        write_kinematics(rows, use_copy)
+        processed += len(rows)
+        elapsed = time.perf_counter() - started
+        logger.info(f"已寫入 {processed} 筆 kinematics ({processed / elapsed:.1f} rows/sec)")
+
+    if workers <= 1:
+        for batch in iter_pending_batches(batch_size):
+            report(compute_batch(batch))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = set()
+            for batch in iter_pending_batches(batch_size):
+                in_flight.add(pool.submit(compute_batch, batch))
+                if len(in_flight) >= max_in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        report(future.result())
+            for future in in_flight:
+                report(future.result())
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"kinematics 回填完成：{processed} 筆，耗時 {elapsed:.1f} 秒 ({processed / max(elapsed, 1e-9):.1f} rows/sec)")
+    return processed
+
+
+def load_model_states(model_version: str, full_rebuild: bool) -> Dict[str, Tuple[FeatureProfileAccumulator, int]]:
+    """
+    讀取本工具先前建立的模型 (method="tdigest"，名稱以 _{model_version} 結尾)，回傳 model_name -> (累積統計, 已計入的最大 kinematics.id)。
+    沒有累積狀態的舊模型 (或 full_rebuild) 從空的統計開始，以已計入 id 為 0 重新計算。
+    """
+    query = (
+        select(PitchModel.model_name, PitchModel.stats_state, PitchModel.last_kinematics_id)
+        .where(PitchModel.method == "tdigest",
+               PitchModel.model_name.endswith(f"_{model_version}", autoescape=True))
+    )
+    states = {}
+    with engine.connect() as connection:
+        for row in connection.execute(query):
+            if full_rebuild or not row.stats_state or row.last_kinematics_id is None:
+                states[row.model_name] = (FeatureProfileAccumulator(), 0)
+            else:
+                states[row.model_name] = (FeatureProfileAccumulator.from_state(row.stats_state), row.last_kinematics_id)
+    return states
+
+
+def rebuild_pitch_models(batch_size: int, model_version: str, full_rebuild: bool = False) -> int:
+    """
+    串流讀取 kinematics (連同 pitch_record 的球員與球種)，合併進既有模型的累積統計，
+    產生 / 更新每位球員「各球種」與「全部球種 (all)」的 PitchModel。回傳寫入的模型數。
+
+    每個模型記錄已計入的最大 kinematics.id，只讀取比所有模型中最小的已計入 id 更新的 kinematics，
+    每一筆只加入尚未計入它的模型。kinematics 只由本工具依 id 遞增寫入，因此需在沒有其他回填同時寫入時執行。
+    只會修改本工具建立的模型 (method="tdigest")；同名但由其他方式建立的模型保持不變。
+    """
+    started = time.perf_counter()
+    states = load_model_states(model_version, full_rebuild)
+    start_id = min((last_id for _, last_id in states.values()), default=0)
+    accumulators: Dict[str, FeatureProfileAccumulator] = {name: accumulator for name, (accumulator, _) in states.items()}
+    changed = set()
+    query = (
+        select(Kinematics.id, PitchRecording.player_name, PitchRecording.pitch_type,
+               *[getattr(Kinematics, column) for column in PROFILE_FEATURES])
+        .join(Kinematics, Kinematics.pitch_record_id == PitchRecording.id)
+        .where(Kinematics.release_frame.isnot(None), Kinematics.id > start_id)
+        .order_by(Kinematics.id)
+    )
+    rows_seen = 0
+    max_id = start_id
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+        for row in result:
+            max_id = row.id
+            if not row.player_name:
+                continue
+            features = {column: getattr(row, column) for column in PROFILE_FEATURES if getattr(row, column) is not None}
+            for pitch_type in {row.pitch_type or "all", "all"}:
+                model_name = f"{row.player_name}_{pitch_type}_{model_version}"
+                if model_name in states and row.id <= states[model_name][1]:
+                    continue  # 此模型先前已計入這一筆
+                accumulators.setdefault(model_name, FeatureProfileAccumulator()).update(features)
+                changed.add(model_name)
+            rows_seen += 1
+
+    written = 0
+    with engine.begin() as connection:
+        for model_name in sorted(changed):
+            accumulator = accumulators[model_name]
+            values = {
+                "method": "tdigest",
+                "profile_data": accumulator.profile_data(),
+                "source_feature_count": accumulator.sample_count,
+                "stats_state": accumulator.to_state(),
+                "last_kinematics_id": max_id,
+            }
+            updated = connection.execute(
+                PitchModel.__table__.update()
+                .where(PitchModel.model_name == model_name, PitchModel.method == "tdigest")
+                .values(**values)
+            ).rowcount
+            if updated:
+                written += 1
+                continue
+            existing = connection.execute(
+                select(PitchModel.method).where(PitchModel.model_name == model_name)
+            ).first()
+            if existing is not None:
+                logger.warning(f"模型 {model_name} 已存在且不是由本工具建立 (method={existing.method})，略過")
+                continue
+            connection.execute(insert(PitchModel).values(model_name=model_name, **values))
+            written += 1
+        # 沒有新資料的模型只推進已計入的 id，下次不必再從它們的舊位置重新讀取
+        unchanged = [name for name in states if name not in changed]
+        if unchanged and max_id > start_id:
+            connection.execute(
+                PitchModel.__table__.update()
+                .where(PitchModel.model_name.in_(unchanged), PitchModel.method == "tdigest")
+                .values(last_kinematics_id=max_id)
+            )
+    # 同一行程內的快取立即失效；API 伺服器則由背景檢查 pitch_model.updated_at 浮水印自動重新載入
+    model_cache.invalidate()
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"已由 {rows_seen} 筆新的 kinematics 更新 {written} 個統計模型 ({rows_seen / max(elapsed, 1e-9):.1f} rows/sec)")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="從 pitch_record 回填 kinematics 並重建 PitchModel 統計模型")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批讀取 / 計算 / 寫入的紀錄數")
+    parser.add_argument("--workers", type=int, default=4, help="平行計算的行程數 (1 代表不開行程池)")
+    parser.add_argument("--copy", action="store_true", help="PostgreSQL 使用 COPY 寫入 kinematics")
+    parser.add_argument("--skip-models", action="store_true", help="只回填 kinematics，不重建統計模型")
+    parser.add_argument("--model-version", default="v1", help="統計模型名稱的版本後綴")
+    parser.add_argument("--full-rebuild", action="store_true", help="忽略已儲存的累積統計，由所有 kinematics 重新計算模型")
+    args = parser.parse_args()
+
+    backfill_kinematics(args.batch_size, args.workers, args.copy)
+    if not args.skip_models:
+        rebuild_pitch_models(args.batch_size, args.model_version, args.full_rebuild)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# 檔案: bench_encoders.py
+# 職責: 比較渲染影片的編碼後端 (VideoEncoder.py) 的編碼速度與輸出檔案大小。
+#       影片先完整解碼到記憶體，只計算編碼所花的時間。
+#
+# 用法:
+#   python bench_encoders.py input.mp4
+#   python bench_encoders.py input.mp4 --presets ultrafast veryfast --crf 23 28 --scale-width 0 640 --fps-divisor 1 2
+
+import argparse
+import os
+import tempfile
+import time
+
+import cv2
+
+from FramePipeline import read_video_meta
+from VideoEncoder import EncoderOptions, OpenCVEncoder, create_video_encoder, ffmpeg_available
+
+
+def load_frames(input_video_path: str, max_frames: int):
+    cap = cv2.VideoCapture(input_video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"無法開啟影片：{input_video_path}")
+    meta = read_video_meta(cap)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return meta, frames
+
+
+def encode_once(encoder, meta, frames, output_path: str):
+    """把所有影格交給編碼器，回傳 (編碼耗時秒數, 輸出檔案大小 bytes)。"""
+    started = time.perf_counter()
+    encoder.on_start(meta)
+    try:
+        for frame_idx, frame in enumerate(frames):
+            encoder.on_frame(frame_idx, frame)
+    finally:
+        encoder.on_end()
+    elapsed = time.perf_counter() - started
+    size = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+    return elapsed, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較渲染影片編碼後端的速度與輸出大小")
+    parser.add_argument("input_video", help="測試用影片")
+    parser.add_argument("--max-frames", type=int, default=600, help="最多讀取幾幀")
+    parser.add_argument("--ffmpeg-binary", default="ffmpeg")
+    parser.add_argument("--fourcc", default="avc1", help="opencv 後端使用的 fourcc")
+    parser.add_argument("--presets", nargs="+", default=["ultrafast", "veryfast", "medium"])
+    parser.add_argument("--crf", nargs="+", type=int, default=[23])
+    parser.add_argument("--scale-width", nargs="+", type=int, default=[0])
+    parser.add_argument("--fps-divisor", nargs="+", type=int, default=[1])
+    args = parser.parse_args()
+
+    meta, frames = load_frames(args.input_video, args.max_frames)
+    print(f"影片: {args.input_video} ({meta.width}x{meta.height} @ {meta.fps:.2f} fps)，讀取 {len(frames)} 幀\n")
+
+    cases = []
+    for scale_width in args.scale_width:
+        for fps_divisor in args.fps_divisor:
+            cases.append(("opencv", EncoderOptions(scale_width=scale_width, fps_divisor=fps_divisor)))
+            if ffmpeg_available(args.ffmpeg_binary):
+                for preset in args.presets:
+                    for crf in args.crf:
+                        cases.append(("ffmpeg", EncoderOptions(preset=preset, crf=crf, scale_width=scale_width,
+                                                               fps_divisor=fps_divisor)))
+    if not ffmpeg_available(args.ffmpeg_binary):
+        print(f"找不到 {args.ffmpeg_binary}，只測試 opencv 後端\n")
+
+    print(f"{'backend':<8} {'preset':<10} {'crf':>4} {'width':>6} {'fps/n':>5} {'encode fps':>11} {'size (KB)':>10}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for index, (backend, options) in enumerate(cases):
+            output_path = os.path.join(temp_dir, f"bench_{index}.mp4")
+            try:
+                if backend == "opencv":
+                    encoder = OpenCVEncoder(output_path, options, fourcc=args.fourcc)
+                else:
+                    encoder = create_video_encoder(output_path, backend, options, args.ffmpeg_binary)
+                elapsed, size = encode_once(encoder, meta, frames, output_path)
+            except Exception as e:
+                print(f"{backend:<8} {options.preset if backend == 'ffmpeg' else '-':<10} 失敗: {e}")
+                continue
+            print(f"{backend:<8} {options.preset if backend == 'ffmpeg' else '-':<10} "
+                  f"{options.crf if backend == 'ffmpeg' else '-':>4} {options.scale_width or meta.width:>6} "
+                  f"{options.fps_divisor:>5} {len(frames) / max(elapsed, 1e-9):>11.1f} {size / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
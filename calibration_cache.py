@@ -0,0 +1,67 @@
+# 檔案: calibration_cache.py
+# 職責: 每個攝影機架設 (camera_session_id) 的 pixel_to_meter 快取。
+#       同一個 session 第一次分析時由骨架估算 (PixelCalibration.py) 並寫入 camera_calibration 資料表，
+#       之後的影片 (包括重新分析) 直接讀取行程內快取，行程重啟後則從資料庫讀回一次。
+
+import logging
+import threading
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+
+import crud
+from PixelCalibration import CalibrationResult
+
+logger = logging.getLogger(__name__)
+
+_calibrations: Dict[str, Dict] = {}
+_lock = threading.Lock()
+
+
+def _to_dict(entry) -> Dict:
+    return {
+        "pixel_to_meter": entry.pixel_to_meter,
+        "height_cm": entry.height_cm,
+        "sample_count": entry.sample_count,
+        "segments": entry.segments,
+    }
+
+
+def get_calibration(db: Session, camera_session_id: Optional[str]) -> Optional[Dict]:
+    """回傳該 session 的校正結果 (CalibrationResult.to_dict() 格式)，尚未校正時回傳 None。"""
+    if not camera_session_id:
+        return None
+    calibration = _calibrations.get(camera_session_id)
+    if calibration is not None:
+        return calibration
+    entry = crud.get_camera_calibration(db, camera_session_id)
+    if entry is None:
+        return None
+    calibration = _to_dict(entry)
+    with _lock:
+        _calibrations[camera_session_id] = calibration
+    return calibration
+
+
+def store_calibration(db: Session, camera_session_id: Optional[str], result: CalibrationResult) -> None:
+    """寫入行程內快取與資料庫。寫入資料庫失敗只記錄警告，不影響分析。"""
+    if not camera_session_id:
+        return
+    calibration = result.to_dict()
+    with _lock:
+        _calibrations[camera_session_id] = calibration
+    try:
+        crud.upsert_camera_calibration(db, camera_session_id, calibration)
+        logger.info(f"校正快取：session '{camera_session_id}' pixel_to_meter={result.pixel_to_meter}")
+    except Exception as e:
+        logger.warning(f"寫入攝影機校正失敗: {e}", exc_info=True)
+        db.rollback()
+
+
+def invalidate(camera_session_id: Optional[str] = None) -> None:
+    """丟棄單一 session (或全部) 的行程內快取。"""
+    with _lock:
+        if camera_session_id is None:
+            _calibrations.clear()
+        else:
+            _calibrations.pop(camera_session_id, None)
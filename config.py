@@ -2,6 +2,7 @@ import os
 
 # GCS 設定
 GCS_BUCKET_NAME = "baseball_cloud_storage"
+GCS_PROJECT = os.environ.get("GCS_PROJECT", "jojo-463304")
 
 # 外部 API 端點
 POSE_API_URL = "https://mmpose-api-new-1069614647348.us-central1.run.app/pose_video"
@@ -16,3 +17,136 @@ DATABASE_URL = os.environ.get("DATABASE_URL", "postgresql://baseball_0623_postgr
 # LemonAPI
 # POSE_API_URL = "http://localhost:8000/pose_video"
 # BALL_API_URL = "http://localhost:8080/predict"
+
+# 執行緒池 / 行程池設定 (阻塞工作不在 event loop 上執行)
+# IO_POOL_SIZE: GCS 上傳、資料庫存取、檔案讀寫
+# CPU_POOL_SIZE: 影片渲染、骨架特徵計算、球路分類；設為 0 代表改用 IO 執行緒池執行
+IO_POOL_SIZE = int(os.environ.get("IO_POOL_SIZE", "8"))
+CPU_POOL_SIZE = int(os.environ.get("CPU_POOL_SIZE", str(os.cpu_count() or 1)))
+CPU_POOL_START_METHOD = os.environ.get("CPU_POOL_START_METHOD", "spawn")
+# 每個 worker 最多允許排隊的工作數量，超過時呼叫端會等待 (背壓)
+EXECUTOR_QUEUE_FACTOR = int(os.environ.get("EXECUTOR_QUEUE_FACTOR", "2"))
+
+# 球路好壞球分類模型
+BALL_MODEL_PATH = os.environ.get("BALL_MODEL_PATH", "random_forest_model.pkl")
+# 有設定時改從版本目錄載入 (見 model_registry.py)，BALL_MODEL_PATH 不再使用
+BALL_MODEL_DIR = os.environ.get("BALL_MODEL_DIR", "")
+# 模型登錄表：以記憶體對應載入、每幾秒檢查一次新版本 (0 代表不檢查)、啟動時是否預先載入
+MODEL_MMAP = os.environ.get("MODEL_MMAP", "true").lower() in ("1", "true", "yes")
+MODEL_RELOAD_INTERVAL = float(os.environ.get("MODEL_RELOAD_INTERVAL", "60"))
+MODEL_PRELOAD = os.environ.get("MODEL_PRELOAD", "true").lower() in ("1", "true", "yes")
+# MODEL_MMAP 時隨機森林攤平後的陣列存放目錄 (所有行程以記憶體對應共用，見 model_registry.py)
+MODEL_PACK_DIR = os.environ.get("MODEL_PACK_DIR", "model_packs")
+
+# 冷啟動：是否記錄啟動期間每個模組的 import 耗時 (GET /startup-profile)、啟動耗時超過幾秒時記錄警告 (0 代表不檢查)、
+# 是否等背景預熱 (import cv2 等重量級模組、載入分類模型) 完成才開始接受請求
+STARTUP_PROFILE = os.environ.get("STARTUP_PROFILE", "true").lower() in ("1", "true", "yes")
+STARTUP_BUDGET_SECONDS = float(os.environ.get("STARTUP_BUDGET_SECONDS", "5"))
+WARMUP_BLOCKING = os.environ.get("WARMUP_BLOCKING", "false").lower() in ("1", "true", "yes")
+# 預熱每個步驟最多等待幾秒、是否預先連線 POSE / BALL API (見 startup.py；/readyz 在預熱完成後才回報就緒)
+WARMUP_STEP_TIMEOUT = float(os.environ.get("WARMUP_STEP_TIMEOUT", "60"))
+WARMUP_UPSTREAMS = os.environ.get("WARMUP_UPSTREAMS", "true").lower() in ("1", "true", "yes")
+
+# 呼叫 POSE / BALL API 的 HTTP 連線池設定 (每個上游各自一個長駐的 httpx client)
+API_TIMEOUT = float(os.environ.get("API_TIMEOUT", "300"))
+API_CONNECT_TIMEOUT = float(os.environ.get("API_CONNECT_TIMEOUT", "10"))
+API_KEEPALIVE_EXPIRY = float(os.environ.get("API_KEEPALIVE_EXPIRY", "120"))
+UPSTREAM_LIMITS = {
+    "pose": {
+        "max_connections": int(os.environ.get("POSE_API_MAX_CONNECTIONS", "8")),
+        "max_keepalive_connections": int(os.environ.get("POSE_API_MAX_KEEPALIVE", "4")),
+    },
+    "ball": {
+        "max_connections": int(os.environ.get("BALL_API_MAX_CONNECTIONS", "8")),
+        "max_keepalive_connections": int(os.environ.get("BALL_API_MAX_KEEPALIVE", "4")),
+    },
+}
+
+# 上傳影片暫存到磁碟時每次複製的區塊大小 (bytes)
+SPOOL_CHUNK_SIZE = int(os.environ.get("SPOOL_CHUNK_SIZE", str(1024 * 1024)))
+
+# 分析結果快取 (以影片 SHA-256 為鍵)：本機磁碟層 + 資料庫層，皆以最久未使用 (LRU) 淘汰
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "1") == "1"
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "result_cache")
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+RESULT_CACHE_MAX_ROWS = int(os.environ.get("RESULT_CACHE_MAX_ROWS", "5000"))
+
+# 非同步分析任務 (POST /analyze-pitch/ 的任務模式)
+# JOB_WORKERS: 每個服務實例同時執行的分析任務數；JOB_SPOOL_DIR: 任務暫存影片的目錄
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "2"))
+JOB_EVENT_INTERVAL = float(os.environ.get("JOB_EVENT_INTERVAL", "1"))
+JOB_SPOOL_DIR = os.environ.get("JOB_SPOOL_DIR", "job_spool")
+# 任務擁有者 (實例) ID：有設定時使用，否則在 JOB_SPOOL_DIR 中產生並保存一個 (同一個暫存目錄 = 同一個擁有者)；
+# 同一個實例上的各個行程共用這個 ID，執行中的任務另外記錄行程 ID 與租約
+JOB_INSTANCE_ID = os.environ.get("JOB_INSTANCE_ID", "")
+# 執行中任務的租約：執行的行程每 JOB_HEARTBEAT_INTERVAL 秒更新一次 heartbeat_at，
+# 超過 JOB_LEASE_SECONDS 沒有更新 (行程已結束) 的任務才會被同一個實例上的其他行程重新排隊
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "60"))
+JOB_HEARTBEAT_INTERVAL = float(os.environ.get("JOB_HEARTBEAT_INTERVAL", "15"))
+
+# PitchModel 記憶體快取：背景每隔幾秒檢查一次資料表浮水印 (筆數 / 最大 id / 最後修改時間)，有變化才重新載入
+MODEL_CACHE_REFRESH_INTERVAL = float(os.environ.get("MODEL_CACHE_REFRESH_INTERVAL", "30"))
+
+# 資料庫連線池 (同步 engine 與 asyncpg 非同步 engine 共用這組設定)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+# 遠端 Render / Cloud SQL 會關閉閒置連線：借出前先 ping，並定期回收舊連線
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+# 非同步 engine 的連線字串；未設定時由 DATABASE_URL 推導 (postgresql -> postgresql+asyncpg)
+ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL")
+
+# 物件儲存：gcs (正式環境) 或 local (本機開發 / 測試，檔案寫入 LOCAL_STORAGE_DIR 並由 /storage 提供下載)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "gcs")
+LOCAL_STORAGE_DIR = os.environ.get("LOCAL_STORAGE_DIR", "local_storage")
+LOCAL_STORAGE_BASE_URL = os.environ.get("LOCAL_STORAGE_BASE_URL", "/storage")
+# 超過門檻的檔案 (渲染後的影片) 使用可續傳的分塊上傳；分塊大小必須是 256 KiB 的倍數
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+UPLOAD_RESUMABLE_THRESHOLD = int(os.environ.get("UPLOAD_RESUMABLE_THRESHOLD", str(8 * 1024 * 1024)))
+UPLOAD_TIMEOUT = float(os.environ.get("UPLOAD_TIMEOUT", "120"))
+# 暫時性錯誤 (429 / 5xx / 連線中斷) 以指數退避重試，超過 UPLOAD_RETRY_DEADLINE 秒後放棄
+UPLOAD_RETRY_INITIAL = float(os.environ.get("UPLOAD_RETRY_INITIAL", "1"))
+UPLOAD_RETRY_MAXIMUM = float(os.environ.get("UPLOAD_RETRY_MAXIMUM", "16"))
+UPLOAD_RETRY_DEADLINE = float(os.environ.get("UPLOAD_RETRY_DEADLINE", "300"))
+
+# 關鍵影格：在記憶體中編碼後直接上傳。WebP 與縮圖為選用的額外版本
+KEYFRAME_JPEG_QUALITY = int(os.environ.get("KEYFRAME_JPEG_QUALITY", "95"))
+KEYFRAME_WEBP_ENABLED = os.environ.get("KEYFRAME_WEBP_ENABLED", "false").lower() in ("1", "true", "yes")
+KEYFRAME_WEBP_QUALITY = int(os.environ.get("KEYFRAME_WEBP_QUALITY", "80"))
+KEYFRAME_THUMBNAIL_WIDTH = int(os.environ.get("KEYFRAME_THUMBNAIL_WIDTH", "0"))  # 0 代表不產生縮圖
+
+# 渲染影片的編碼器：auto (有 ffmpeg 執行檔就用 ffmpeg，否則 opencv)、ffmpeg、opencv
+VIDEO_ENCODER = os.environ.get("VIDEO_ENCODER", "auto")
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+VIDEO_ENCODER_PRESET = os.environ.get("VIDEO_ENCODER_PRESET", "veryfast")
+VIDEO_ENCODER_CRF = int(os.environ.get("VIDEO_ENCODER_CRF", "23"))
+VIDEO_FASTSTART = os.environ.get("VIDEO_FASTSTART", "true").lower() in ("1", "true", "yes")
+# 預覽用：輸出寬度 (0 代表原始解析度) 與每幾幀輸出 1 幀 (1 代表原始影格率)
+RENDER_SCALE_WIDTH = int(os.environ.get("RENDER_SCALE_WIDTH", "0"))
+RENDER_FPS_DIVISOR = int(os.environ.get("RENDER_FPS_DIVISOR", "1"))
+
+# 球速估算 (BallSpeed.py)：像素換算公尺的比例、合理球速範圍，以及離群值剔除方式 (none 或 mad)
+BALL_PIXEL_TO_METER = float(os.environ.get("BALL_PIXEL_TO_METER", "0.04"))
+BALL_MIN_VALID_SPEED_KMH = float(os.environ.get("BALL_MIN_VALID_SPEED_KMH", "30"))
+BALL_MAX_VALID_SPEED_KMH = float(os.environ.get("BALL_MAX_VALID_SPEED_KMH", "200"))
+BALL_SPEED_OUTLIER_REJECTION = os.environ.get("BALL_SPEED_OUTLIER_REJECTION", "none")
+BALL_SPEED_OUTLIER_THRESHOLD = float(os.environ.get("BALL_SPEED_OUTLIER_THRESHOLD", "3.5"))
+
+# 由骨架自動估算 pixel_to_meter (PixelCalibration.py)：auto 或 fixed (一律使用 BALL_PIXEL_TO_METER)
+# 預設 fixed：auto 在沒有身高時假設 DEFAULT_PITCHER_HEIGHT_CM，會改變 max_speed_kmh，需明確開啟
+PIXEL_CALIBRATION_MODE = os.environ.get("PIXEL_CALIBRATION_MODE", "fixed")
+DEFAULT_PITCHER_HEIGHT_CM = float(os.environ.get("DEFAULT_PITCHER_HEIGHT_CM", "185"))  # 前端與投手資料都沒有身高時使用
+CALIBRATION_KPT_THR = float(os.environ.get("CALIBRATION_KPT_THR", "0.5"))
+CALIBRATION_MIN_FRAMES = int(os.environ.get("CALIBRATION_MIN_FRAMES", "5"))
+
+# pitch_record 骨架的二進位儲存格式 (PoseCodec.py)：float16 / float32，壓縮為 auto (有 zstandard 就用 zstd)、zstd、none
+POSE_STORAGE_DTYPE = os.environ.get("POSE_STORAGE_DTYPE", "float32")
+POSE_STORAGE_COMPRESSION = os.environ.get("POSE_STORAGE_COMPRESSION", "auto")
+
+# 渲染模式：video (畫上骨架後重新編碼影片) 或 overlay (上傳原始影片與標註軌，由前端繪製)
+RENDER_MODES = ("video", "overlay")
+DEFAULT_RENDER_MODE = os.environ.get("DEFAULT_RENDER_MODE", "video")
+# overlay 模式的標註軌格式：json (差分後的 JSON) 或 binary
+ANNOTATION_FORMAT = os.environ.get("ANNOTATION_FORMAT", "json")
@@ -1,15 +1,20 @@
 # 檔案: crud.py
 # 職責: 作為資料庫的唯一接口 (數據庫管家)，提供所有資料的增刪改查功能。
 
-import numpy as np
+import logging
+
+from sqlalchemy import func, inspect, or_, select
 from sqlalchemy.orm import Session
-from typing import Optional, List, Dict, Any
-from collections import defaultdict
+from typing import Optional, List, Dict, Any, Tuple
 from types import SimpleNamespace
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
-from database import PitchAnalyses, PitchModel
+from database import PitchAnalyses, PitchModel, PitchRecording, AnalysisCache, AnalysisJob, PlayerProfile, CameraCalibration
+from running_stats import FeatureProfileAccumulator
 from models import PitchAnalysisUpdate
+from config import POSE_STORAGE_DTYPE, POSE_STORAGE_COMPRESSION
+
+logger = logging.getLogger(__name__)
 
 
 # --- 針對 PitchAnalyses (單次測試結果) 的操作 ---
@@ -33,11 +38,30 @@ def get_pitch_analyses(db: Session, player_name: Optional[str] = None, end_date:
         
     return query.offset(skip).limit(limit).all()
 
-def create_pitch_analysis(db: Session, analysis_data: Dict[str, Any]) -> PitchAnalyses:
+# /history/ 列表的欄位投影：summary 不含 biomechanics_features (JSON 較大且列表不顯示)，full 則包含
+HISTORY_SUMMARY_COLUMNS = (
+    PitchAnalyses.id, PitchAnalyses.video_path, PitchAnalyses.max_speed_kmh, PitchAnalyses.pose_score,
+    PitchAnalyses.ball_score, PitchAnalyses.player_name, PitchAnalyses.created_at, PitchAnalyses.pose_score_message,
+    PitchAnalyses.release_frame_url, PitchAnalyses.landing_frame_url, PitchAnalyses.shoulder_frame_url,
+    PitchAnalyses.annotation_url,
+)
+HISTORY_FULL_COLUMNS = HISTORY_SUMMARY_COLUMNS + (PitchAnalyses.biomechanics_features,)
+
+def _history_statement(columns, player_name: Optional[str], before_id: Optional[int]):
     """
-    根據傳入的字典，建立一筆新的分析紀錄。
+    以 keyset (id 由新到舊) 分頁：指定投手時走 (player_name, id) 複合索引，
+    不論翻到第幾頁都只需要從游標位置往後讀，不會有 OFFSET 深翻頁的全掃描。
     """
-    db_analysis = PitchAnalyses(
+    stmt = select(*columns).order_by(PitchAnalyses.id.desc())
+    if player_name:
+        stmt = stmt.where(PitchAnalyses.player_name == player_name)
+    if before_id is not None:
+        stmt = stmt.where(PitchAnalyses.id < before_id)
+    return stmt
+
+def _new_pitch_analysis(analysis_data: Dict[str, Any]) -> PitchAnalyses:
+    """把服務層組好的扁平字典轉成 PitchAnalyses 物件 (同步與非同步版本共用)。"""
+    return PitchAnalyses(
         video_path=analysis_data.get("output_video_url"),
         player_name=analysis_data.get("player_name"), # 【修改點】
         max_speed_kmh=analysis_data.get("max_speed_kmh"),
@@ -47,11 +71,29 @@ def create_pitch_analysis(db: Session, analysis_data: Dict[str, Any]) -> PitchAn
         release_frame_url=analysis_data.get("release_frame_url"),
         landing_frame_url=analysis_data.get("landing_frame_url"),
         shoulder_frame_url=analysis_data.get("shoulder_frame_url"),
+        annotation_url=analysis_data.get("annotation_url"),
         pose_score_message=analysis_data.get("pose_score_message", "分析成功")
     )
+
+def create_pitch_analysis(db: Session, analysis_data: Dict[str, Any]) -> PitchAnalyses:
+    """
+    根據傳入的字典，建立一筆新的分析紀錄。
+    """
+    db_analysis = _new_pitch_analysis(analysis_data)
     db.add(db_analysis)
     db.commit()
     db.refresh(db_analysis)
+    try:
+        apply_analysis_to_player_profile(db, db_analysis)
+    except Exception as e:
+        # 分析紀錄已經寫入，統計更新失敗不影響建立結果；標記過期，下次讀取時整批重建
+        logger.warning(f"增量更新投手統計失敗 ({db_analysis.player_name}): {e}")
+        db.rollback()
+        try:
+            mark_player_profile_stale(db, db_analysis.player_name)
+        except Exception:
+            db.rollback()
+        db.refresh(db_analysis)
     return db_analysis
 
 def update_pitch_analysis(db: Session, analysis_id: int, updated_data: PitchAnalysisUpdate) -> Optional[PitchAnalyses]:
@@ -62,9 +104,21 @@ def update_pitch_analysis(db: Session, analysis_id: int, updated_data: PitchAnal
         for key, value in updated_data.dict(exclude_unset=True).items():
             setattr(db_analysis, key, value)
         db.commit()
+        mark_player_profile_stale(db, db_analysis.player_name)
         db.refresh(db_analysis)
     return db_analysis
 
+def delete_pitch_analysis(db: Session, analysis_id: int) -> bool:
+    """刪除指定的分析紀錄，找不到時回傳 False。"""
+    db_analysis = get_pitch_analysis(db, analysis_id)
+    if not db_analysis:
+        return False
+    player_name = db_analysis.player_name
+    db.delete(db_analysis)
+    db.commit()
+    mark_player_profile_stale(db, player_name)
+    return True
+
 
 # --- 針對 PitchModel (統計模型) 的操作 ---
 
@@ -82,45 +136,419 @@ def get_pitch_model_by_name(db: Session, model_name: str) -> Optional[PitchModel
 
 def calculate_user_average_profile(db: Session, player_name: str, end_date: Optional[datetime] = None) -> Optional[SimpleNamespace]:
     """
-    即時計算指定投手在某個時間點之前的歷史平均數據。
+    取得指定投手在某個時間點之前的歷史平均數據，統計範圍為該投手所有的分析紀錄。
+    (以前只取最近 100 筆；物化統計以 Welford / t-digest 增量更新，無法移除最舊的紀錄，因此改為完整歷史。)
+    優先讀取物化的 player_profile (一次索引查詢)；只有在 end_date 早於該統計最後更新時間時，
+    才改為串流讀取 end_date 之前的所有紀錄即時計算 (統計方式與物化統計相同)。
     """
-    # 1. 獲取該選手在指定時間點之前的歷史分析紀錄
-    history_records = get_pitch_analyses(db, player_name=player_name, end_date=end_date)
+    profile = get_player_profile(db, player_name)
+    if profile is not None and (end_date is None or _as_utc(end_date) >= _as_utc(profile.updated_at)):
+        if not profile.sample_count or not profile.profile_data:
+            return None
+        return SimpleNamespace(
+            model_name=f"{player_name} 個人歷史平均",
+            display_name=f"{player_name} 個人歷史平均",
+            profile_data=profile.profile_data
+        )
 
-    if not history_records or len(history_records) < 1:
-        return None
+    # 串流讀取該選手在指定時間點之前的所有分析紀錄，以與物化統計相同的方式計算
+    accumulator = FeatureProfileAccumulator()
+    query = db.query(PitchAnalyses.biomechanics_features).filter(PitchAnalyses.player_name == player_name)
+    if end_date:
+        query = query.filter(PitchAnalyses.created_at < end_date)
+    for row in query.yield_per(500):
+        if row.biomechanics_features:
+            accumulator.update(row.biomechanics_features)
 
-    # 2. 收集每個生物力學特徵的所有歷史數值
-    feature_values: Dict[str, List[float]] = defaultdict(list)
-    
-    for record in history_records:
-        if record.biomechanics_features:
-            for key, value in record.biomechanics_features.items():
-                if isinstance(value, (int, float)):
-                    feature_values[key].append(value)
-    
-    if not feature_values:
+    profile_data = accumulator.profile_data()
+    if not profile_data:
         return None
 
-    # 3. 計算統計數據
-    profile_data = {}
-    for feature, values in feature_values.items():
-        np_values = np.array(values)
-        profile_data[feature.lower()] = {
-            "mean": np.mean(np_values),
-            "std": np.std(np_values),
-            "min": float(np.min(np_values)),
-            "max": float(np.max(np_values)),
-            "p10": float(np.percentile(np_values, 10)),
-            "p50_median": float(np.median(np_values)),
-            "p90": float(np.percentile(np_values, 90)),
-        }
-
-    # 4. 打包成臨時模型物件
     user_average_model = SimpleNamespace(
         model_name=f"{player_name} 個人歷史平均",
         display_name=f"{player_name} 個人歷史平均",
         profile_data=profile_data
     )
 
-    return user_average_model
\ No newline at end of file
+    return user_average_model
+
+
+
+# --- 針對 PitchRecording (訓練用的原始投球紀錄) 的操作 ---
+
+def encode_pitch_recording_pose(pose) -> bytes:
+    """
+    把骨架編碼成 pitch_record.keypoints_blob 的二進位格式 (型別與壓縮見 POSE_STORAGE_DTYPE / POSE_STORAGE_COMPRESSION)。
+    pose 可以是 PoseSequence、POSE API 的回傳結果 ({"frames": [...]})，或舊的 keypoints_data JSON。
+    """
+    # PoseCodec 會載入 KinematicsModule，寫入訓練資料時才 import，不拖慢服務啟動
+    from PoseCodec import encode_pose, encode_keypoints_data
+    if isinstance(pose, (dict, list)):
+        return encode_keypoints_data(pose, POSE_STORAGE_DTYPE, POSE_STORAGE_COMPRESSION)
+    return encode_pose(pose, POSE_STORAGE_DTYPE, POSE_STORAGE_COMPRESSION)
+
+def create_pitch_recording(db: Session, recording_data: Dict[str, Any]) -> PitchRecording:
+    """
+    建立一筆訓練用投球紀錄。骨架 (recording_data["pose"]) 只以二進位格式寫入 keypoints_blob，不再寫入 JSON。
+    """
+    pose = recording_data.get("pose")
+    db_recording = PitchRecording(
+        player_name=recording_data.get("player_name"),
+        pitch_type=recording_data.get("pitch_type"),
+        video_filename=recording_data.get("video_filename"),
+        description=recording_data.get("description"),
+        source_csv=recording_data.get("source_csv"),
+        keypoints_blob=encode_pitch_recording_pose(pose) if pose is not None else None
+    )
+    db.add(db_recording)
+    db.commit()
+    db.refresh(db_recording)
+    return db_recording
+
+def update_pitch_recording_pose(db: Session, recording_id: int, pose) -> Optional[PitchRecording]:
+    """以新的骨架覆寫指定紀錄的 keypoints_blob (舊的 JSON 一併清除，避免兩份資料不一致)，找不到時回傳 None。"""
+    db_recording = db.query(PitchRecording).filter(PitchRecording.id == recording_id).first()
+    if db_recording is None:
+        return None
+    db_recording.keypoints_blob = encode_pitch_recording_pose(pose)
+    db_recording.keypoints_data = None
+    db.commit()
+    return db_recording
+
+# --- 針對 PlayerProfile (每位投手的物化歷史統計) 的操作 ---
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite 取回的時間沒有時區資訊，一律視為 UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def _save_player_profile(db: Session, profile: PlayerProfile, accumulator: FeatureProfileAccumulator) -> None:
+    profile.sample_count = accumulator.sample_count
+    profile.stats_state = accumulator.to_state()
+    profile.profile_data = accumulator.profile_data()
+    profile.is_stale = False
+    profile.updated_at = datetime.now(timezone.utc)
+
+def _lock_player_profile(db: Session, player_name: str) -> Optional[PlayerProfile]:
+    # 以 SELECT ... FOR UPDATE 鎖住該列，避免同一投手同時新增兩筆分析時互相覆蓋
+    return (db.query(PlayerProfile)
+            .filter(PlayerProfile.player_name == player_name)
+            .with_for_update()
+            .first())
+
+def _ensure_player_profile(db: Session, player_name: str, **defaults) -> PlayerProfile:
+    """
+    取得並鎖住投手資料，沒有時先建立。以 INSERT ... ON CONFLICT DO NOTHING 建立再 SELECT ... FOR UPDATE，
+    兩個請求同時建立同一位投手時不會違反 player_name 的唯一索引。
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        insert = None
+    if insert is not None:
+        db.execute(insert(PlayerProfile)
+                   .values(player_name=player_name, **defaults)
+                   .on_conflict_do_nothing(index_elements=[PlayerProfile.player_name]))
+    profile = _lock_player_profile(db, player_name)
+    if profile is None:
+        # 不支援 ON CONFLICT 的資料庫
+        profile = PlayerProfile(player_name=player_name, **defaults)
+        db.add(profile)
+    return profile
+
+def _apply_pending_analyses(db: Session, profile: PlayerProfile, accumulator: FeatureProfileAccumulator) -> None:
+    """
+    把 id 大於 last_analysis_id (已計入的最大 id) 的分析紀錄依序加入統計，並推進 last_analysis_id 與 analysis_count。
+    必須在鎖住 profile 之後呼叫：同一筆紀錄只會被計入一次。
+    """
+    rows = (db.query(PitchAnalyses.id, PitchAnalyses.biomechanics_features)
+            .filter(PitchAnalyses.player_name == profile.player_name,
+                    PitchAnalyses.id > (profile.last_analysis_id or 0))
+            .order_by(PitchAnalyses.id)
+            .yield_per(500))
+    for row in rows:
+        if row.biomechanics_features:
+            accumulator.update(row.biomechanics_features)
+        profile.last_analysis_id = row.id
+        profile.analysis_count = (profile.analysis_count or 0) + 1
+
+def _recompute_player_profile(db: Session, profile: PlayerProfile) -> None:
+    profile.last_analysis_id, profile.analysis_count = 0, 0
+    accumulator = FeatureProfileAccumulator()
+    _apply_pending_analyses(db, profile, accumulator)
+    _save_player_profile(db, profile, accumulator)
+
+def rebuild_player_profile(db: Session, player_name: str) -> PlayerProfile:
+    """串流讀取該投手所有分析紀錄的特徵，重新建立統計。"""
+    profile = _ensure_player_profile(db, player_name, is_stale=True)
+    _recompute_player_profile(db, profile)
+    db.commit()
+    return profile
+
+def get_player_profile(db: Session, player_name: str) -> Optional[PlayerProfile]:
+    """讀取投手的物化統計；尚未建立或已標記過期時先重建。player_name 為空時回傳 None。"""
+    if not player_name:
+        return None
+    profile = db.query(PlayerProfile).filter(PlayerProfile.player_name == player_name).first()
+    if profile is None or profile.is_stale or profile.updated_at is None:
+        profile = rebuild_player_profile(db, player_name)
+    return profile
+
+def apply_analysis_to_player_profile(db: Session, analysis: PitchAnalyses) -> None:
+    """
+    新增分析紀錄後，以 Welford / t-digest 增量更新該投手的統計。
+    統計尚未建立或已過期時不處理，留給下次讀取時整批重建。
+
+    不只加入 analysis 本身，而是加入所有 id 大於 last_analysis_id 的紀錄：
+    若同時有重建已經讀到這筆紀錄，它的 id 不大於 last_analysis_id，不會重複計入。
+    交易提交順序與 id 順序不同時 (較小的 id 較晚提交)，較小的 id 會落在 last_analysis_id 之下而漏算，
+    因此再以 analysis_count 比對實際筆數，不一致時整批重建。
+    """
+    if not analysis.player_name:
+        return
+    profile = _lock_player_profile(db, analysis.player_name)
+    if profile is None or profile.is_stale or not profile.stats_state or profile.last_analysis_id is None:
+        db.rollback()
+        return
+    accumulator = FeatureProfileAccumulator.from_state(profile.stats_state)
+    _apply_pending_analyses(db, profile, accumulator)
+    counted = (db.query(func.count(PitchAnalyses.id))
+               .filter(PitchAnalyses.player_name == profile.player_name,
+                       PitchAnalyses.id <= profile.last_analysis_id)
+               .scalar())
+    if counted != profile.analysis_count:
+        _recompute_player_profile(db, profile)
+    else:
+        _save_player_profile(db, profile, accumulator)
+    db.commit()
+
+def mark_player_profile_stale(db: Session, player_name: Optional[str]) -> None:
+    """分析紀錄被修改或刪除時呼叫，讓下次讀取時重建統計。"""
+    if not player_name:
+        return
+    db.query(PlayerProfile).filter(PlayerProfile.player_name == player_name).update(
+        {"is_stale": True}, synchronize_session=False
+    )
+    db.commit()
+
+def resolve_player_height(db: Session, player_name: Optional[str], height_cm: Optional[float] = None) -> Optional[float]:
+    """
+    有傳入身高時寫入投手資料並回傳；否則回傳投手資料中記錄的身高 (沒有時為 None)。
+    投手資料尚未建立時先建立一筆過期的紀錄，統計留給下次讀取時重建。
+    """
+    if not player_name:
+        return height_cm
+    profile = db.query(PlayerProfile).filter(PlayerProfile.player_name == player_name).first()
+    if height_cm is None:
+        return profile.height_cm if profile is not None else None
+    if profile is None:
+        # 與 rebuild_player_profile 相同以 ON CONFLICT DO NOTHING 建立，同時上傳的請求不會互相衝突
+        profile = _ensure_player_profile(db, player_name, is_stale=True)
+    if profile.height_cm != height_cm:
+        profile.height_cm = height_cm
+        db.commit()
+    return height_cm
+
+# --- 針對 CameraCalibration (攝影機架設的像素換算比例) 的操作 ---
+
+def get_camera_calibration(db: Session, camera_session_id: str) -> Optional[CameraCalibration]:
+    return db.query(CameraCalibration).filter(CameraCalibration.camera_session_id == camera_session_id).first()
+
+def upsert_camera_calibration(db: Session, camera_session_id: str, calibration_data: Dict[str, Any]) -> CameraCalibration:
+    entry = get_camera_calibration(db, camera_session_id)
+    if entry is None:
+        entry = CameraCalibration(camera_session_id=camera_session_id)
+        db.add(entry)
+    for key, value in calibration_data.items():
+        setattr(entry, key, value)
+    db.commit()
+    db.refresh(entry)
+    return entry
+
+# --- 針對 AnalysisCache (影片內容快取) 的操作 ---
+
+ANALYSIS_CACHE_FIELDS = (
+    "pose_data", "ball_data", "biomechanics_features", "max_speed_kmh", "ball_score",
+    "output_video_url", "release_frame_url", "landing_frame_url", "shoulder_frame_url", "keyframe_variant_urls",
+    "annotation_url", "ball_speed", "calibration",
+)
+
+def get_analysis_cache(db: Session, video_hash: str) -> Optional[Dict[str, Any]]:
+    """根據影片 SHA-256 取得快取的分析結果，並更新最後存取時間。"""
+    entry = db.query(AnalysisCache).filter(AnalysisCache.video_hash == video_hash).first()
+    if not entry:
+        return None
+    entry.last_accessed_at = datetime.now(timezone.utc)
+    db.commit()
+    return {field: getattr(entry, field) for field in ANALYSIS_CACHE_FIELDS}
+
+def upsert_analysis_cache(db: Session, video_hash: str, payload: Dict[str, Any], max_rows: int) -> None:
+    """
+    寫入 (或覆蓋) 一筆快取，並在超過 max_rows 時刪除最久未使用的紀錄。
+    """
+    entry = db.query(AnalysisCache).filter(AnalysisCache.video_hash == video_hash).first()
+    if entry is None:
+        entry = AnalysisCache(video_hash=video_hash)
+        db.add(entry)
+    for field in ANALYSIS_CACHE_FIELDS:
+        setattr(entry, field, payload.get(field))
+    entry.last_accessed_at = datetime.now(timezone.utc)
+    db.commit()
+
+    overflow = db.query(AnalysisCache).count() - max_rows
+    if overflow > 0:
+        stale_hashes = [
+            row.video_hash for row in
+            db.query(AnalysisCache.video_hash).order_by(AnalysisCache.last_accessed_at.asc()).limit(overflow)
+        ]
+        db.query(AnalysisCache).filter(AnalysisCache.video_hash.in_(stale_hashes)).delete(synchronize_session=False)
+        db.commit()
+
+
+# --- 針對 AnalysisJob (非同步分析任務) 的操作 ---
+
+def create_analysis_job(db: Session, job_data: Dict[str, Any]) -> AnalysisJob:
+    """建立一筆排隊中的分析任務。"""
+    db_job = AnalysisJob(status="queued", stage="queued", progress=0.0, **job_data)
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+def get_analysis_job(db: Session, job_id: str) -> Optional[AnalysisJob]:
+    """根據 ID 獲取單筆分析任務。"""
+    return db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
+
+def get_queued_job_ids(db: Session, owner_id: str, limit: int = 10) -> List[str]:
+    """依建立時間取出屬於 owner_id 的排隊中任務 ID (暫存影片只在建立任務的實例上)。"""
+    rows = (db.query(AnalysisJob.id)
+            .filter(AnalysisJob.status == "queued", AnalysisJob.owner_id == owner_id)
+            .order_by(AnalysisJob.created_at)
+            .limit(limit)
+            .all())
+    return [row.id for row in rows]
+
+def claim_analysis_job(db: Session, job_id: str, owner_id: str, claimed_by: str) -> bool:
+    """
+    以條件式 UPDATE 把任務從 queued 改成 running (只搶屬於 owner_id 的任務)，並記錄執行的行程與租約開始時間。
+    多個 worker 同時搶同一筆任務時，只有一個會成功。
+    """
+    claimed = (db.query(AnalysisJob)
+               .filter(AnalysisJob.id == job_id, AnalysisJob.status == "queued", AnalysisJob.owner_id == owner_id)
+               .update({"status": "running", "stage": "starting", "claimed_by": claimed_by,
+                        "heartbeat_at": datetime.now(timezone.utc)}, synchronize_session=False))
+    db.commit()
+    return claimed == 1
+
+def update_analysis_job(db: Session, job_id: str, claimed_by: Optional[str] = None, **fields) -> bool:
+    """
+    更新任務的狀態、階段、進度、結果或錯誤訊息。
+    有傳入 claimed_by 時只在任務仍由該行程執行時更新 (租約過期被重新排隊後不覆蓋新的執行結果)，
+    回傳是否有更新。
+    """
+    query = db.query(AnalysisJob).filter(AnalysisJob.id == job_id)
+    if claimed_by is not None:
+        query = query.filter(AnalysisJob.claimed_by == claimed_by)
+    updated = query.update(fields, synchronize_session=False)
+    db.commit()
+    return updated == 1
+
+def renew_job_leases(db: Session, job_ids: List[str], claimed_by: str) -> None:
+    """更新 claimed_by 執行中任務的 heartbeat_at (續約)。"""
+    if not job_ids:
+        return
+    (db.query(AnalysisJob)
+     .filter(AnalysisJob.id.in_(job_ids), AnalysisJob.status == "running", AnalysisJob.claimed_by == claimed_by)
+     .update({"heartbeat_at": datetime.now(timezone.utc)}, synchronize_session=False))
+    db.commit()
+
+def requeue_expired_jobs(db: Session, owner_id: str, lease_seconds: float, video_exists) -> int:
+    """
+    處理 owner_id 的 running 任務中租約已過期的 (執行的行程已結束)：暫存影片還在就重新排隊，否則標記為失敗。
+    租約仍有效的任務可能正由同一個實例上的其他行程執行，不處理；其他實例的任務也不處理。
+    沒有擁有者的舊任務若暫存影片在本機，改由本實例接手。回傳重新排隊的數量。
+    """
+    for job in (db.query(AnalysisJob)
+                .filter(AnalysisJob.status.in_(("queued", "running")), AnalysisJob.owner_id.is_(None))
+                .all()):
+        if job.video_path and video_exists(job.video_path):
+            job.owner_id = owner_id
+    db.flush()
+
+    requeued = 0
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=lease_seconds)
+    for job in (db.query(AnalysisJob)
+                .filter(AnalysisJob.status == "running", AnalysisJob.owner_id == owner_id,
+                        or_(AnalysisJob.heartbeat_at.is_(None), AnalysisJob.heartbeat_at < cutoff))
+                .with_for_update()
+                .all()):
+        job.claimed_by, job.heartbeat_at = None, None
+        if job.video_path and video_exists(job.video_path):
+            job.status, job.stage, job.progress = "queued", "queued", 0.0
+            requeued += 1
+        else:
+            job.status, job.error = "failed", "執行任務的行程中斷，暫存影片已不存在"
+    db.commit()
+    return requeued
+
+
+# --- 非同步版本 ---
+# 給 async 路由使用 (db 來自 database.get_async_db 或 database.new_async_session)。
+# 查詢以 select() 組成後 await db.execute(...)：等待資料庫回應時事件迴圈可以處理其他請求，不佔用執行緒。
+# 投手統計的增量更新 (Welford / t-digest 與列鎖) 邏輯較長，仍與同步版本共用，透過 run_sync 在同一條連線上執行。
+
+async def get_pitch_analysis_history_async(db, player_name: Optional[str] = None, before_id: Optional[int] = None,
+                                           limit: int = 100, include_features: bool = True) -> Tuple[List[Any], Optional[int]]:
+    """
+    依游標讀取一頁歷史紀錄 (只查詢需要的欄位)，回傳 (Row 的列表, 下一頁的游標)。
+    多讀一筆 (limit + 1) 判斷是否還有下一頁：游標 (本頁最後一筆的 id) 與本頁內容來自同一個查詢，
+    兩次查詢之間有紀錄新增或刪除時也不會跳過或重複；剛好 limit 筆時為最後一頁，游標為 None。
+    """
+    columns = HISTORY_FULL_COLUMNS if include_features else HISTORY_SUMMARY_COLUMNS
+    result = await db.execute(_history_statement(columns, player_name, before_id).limit(limit + 1))
+    rows = result.all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1].id
+    return rows, None
+
+async def create_pitch_analysis_async(db, analysis_data: Dict[str, Any]) -> PitchAnalyses:
+    """create_pitch_analysis 的非同步版本。"""
+    db_analysis = _new_pitch_analysis(analysis_data)
+    db.add(db_analysis)
+    await db.commit()
+    await db.refresh(db_analysis)
+    try:
+        await db.run_sync(apply_analysis_to_player_profile, db_analysis)
+    except Exception as e:
+        # 分析紀錄已經寫入，統計更新失敗不影響建立結果；標記過期，下次讀取時整批重建
+        logger.warning(f"增量更新投手統計失敗 ({db_analysis.player_name}): {e}")
+        await db.rollback()
+        try:
+            await db.run_sync(mark_player_profile_stale, db_analysis.player_name)
+        except Exception:
+            await db.rollback()
+    if inspect(db_analysis).expired_attributes:
+        # rollback (包含統計不需要增量更新時釋放列鎖的 rollback) 會讓物件過期；
+        # 非同步 session 不能延遲載入，回傳前先重新讀取
+        await db.refresh(db_analysis)
+    return db_analysis
+
+async def get_all_pitch_models_async(db) -> List[PitchModel]:
+    result = await db.execute(select(PitchModel).order_by(PitchModel.model_name))
+    return result.scalars().all()
+
+async def get_pitch_model_by_name_async(db, model_name: str) -> Optional[PitchModel]:
+    result = await db.execute(select(PitchModel).where(PitchModel.model_name == model_name).limit(1))
+    return result.scalars().first()
+
+async def update_pitch_analysis_async(db, analysis_id: int, updated_data: PitchAnalysisUpdate) -> Optional[PitchAnalyses]:
+    return await db.run_sync(update_pitch_analysis, analysis_id, updated_data)
+
+async def delete_pitch_analysis_async(db, analysis_id: int) -> bool:
+    return await db.run_sync(delete_pitch_analysis, analysis_id)
+
+async def calculate_user_average_profile_async(db, player_name: str, end_date: Optional[datetime] = None) -> Optional[SimpleNamespace]:
+    return await db.run_sync(calculate_user_average_profile, player_name, end_date)
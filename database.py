@@ -1,16 +1,62 @@
 import os
+import logging
 from sqlalchemy import (create_engine, Column, Integer, String, Float, JSON,
-                        DateTime, ForeignKey)
-from sqlalchemy.orm import sessionmaker, relationship, declarative_base
+                        DateTime, ForeignKey, Boolean, Index, LargeBinary)
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker, relationship, declarative_base, deferred
 from sqlalchemy.sql import func
 from sqlalchemy.exc import SQLAlchemyError
 
-from config import DATABASE_URL
+from config import (DATABASE_URL, ASYNC_DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+                    DB_POOL_PRE_PING, DB_POOL_RECYCLE)
+
+logger = logging.getLogger(__name__)
+
+
+def _pool_options(url: str) -> dict:
+    """連線池設定。SQLite (本機開發) 沿用 SQLAlchemy 預設的連線池，不套用大小限制。"""
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+
+
+def _async_url(url: str) -> str:
+    """由同步連線字串推導非同步驅動的連線字串 (asyncpg / aiosqlite)。"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "postgresql":
+        query = dict(parsed.query)
+        # asyncpg 不認得 libpq 的 sslmode 參數，改用 ssl
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        parsed = parsed.set(drivername="postgresql+asyncpg", query=query)
+    elif backend == "sqlite":
+        parsed = parsed.set(drivername="sqlite+aiosqlite")
+    return parsed.render_as_string(hide_password=False)
+
 
 Base = declarative_base()
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **_pool_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 非同步 engine：查詢在事件迴圈上等待資料庫回應，不佔用執行緒，多個請求的資料庫延遲可以重疊。
+# 未安裝對應驅動 (asyncpg / aiosqlite) 時為 None，get_async_db 改為在 IO 執行緒池中使用同步 session。
+try:
+    _async_database_url = ASYNC_DATABASE_URL or _async_url(DATABASE_URL)
+    async_engine = create_async_engine(_async_database_url, **_pool_options(_async_database_url))
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+except ImportError as e:
+    logger.warning(f"未安裝非同步資料庫驅動，改用執行緒池執行同步查詢: {e}")
+    async_engine = None
+    AsyncSessionLocal = None
+
 # --- 最終的四表架構模型定義 ---
 
 # 表一：儲存「訓練用」的原始投球紀錄
@@ -23,7 +69,8 @@ class PitchRecording(Base):
     video_filename = Column(String, unique=True, index=True)
     description = Column(String)
     source_csv = Column(String)
-    keypoints_data = Column(JSON, nullable=True)
+    keypoints_data = Column(JSON, nullable=True)   # 舊格式 (升級前的紀錄保留原始 JSON；新紀錄只寫 keypoints_blob)
+    keypoints_blob = Column(LargeBinary, nullable=True)  # PoseCodec 二進位格式 (float16/float32，可選 zstd 壓縮)，見 crud.create_pitch_recording
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     kinematics = relationship("Kinematics", back_populates="pitch_recording", cascade="all, delete-orphan")
@@ -62,8 +109,14 @@ class PitchAnalyses(Base):
     release_frame_url = Column(String, index=True)
     landing_frame_url = Column(String, index=True)
     shoulder_frame_url = Column(String, index=True)
+    annotation_url = Column(String, nullable=True)  # overlay 模式的標註軌網址 (video_path 為原始影片)
     pose_score_message = Column(String, default="分析成功")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # /history/ 以 (player_name, id) 做 keyset 分頁
+    __table_args__ = (
+        Index("ix_pitch_analyses_player_name_id", "player_name", "id"),
+    )
     
 # 表四：儲存計算後的統計模型
 class PitchModel(Base):
@@ -75,6 +128,84 @@ class PitchModel(Base):
     profile_data = Column(JSON, nullable=False)
     source_feature_count = Column(Integer)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # 每次修改都會更新，作為記憶體快取 (model_cache.py) 判斷是否需要重新載入的浮水印
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # backfill_kinematics 建立的模型 (method="tdigest") 的累積統計狀態與已計入的最大 kinematics.id，
+    # 下次回填只需合併新的 kinematics；狀態較大，查詢模型時預設不載入
+    stats_state = deferred(Column(JSON, nullable=True))
+    last_kinematics_id = Column(Integer, nullable=True)
+
+# 表七：每位投手的歷史統計 (PitchAnalyses 的物化彙總，新增分析時增量更新)
+class PlayerProfile(Base):
+    __tablename__ = 'player_profile'
+
+    id = Column(Integer, primary_key=True, index=True)
+    player_name = Column(String, unique=True, index=True, nullable=False)
+    sample_count = Column(Integer, default=0)
+    stats_state = Column(JSON)     # running_stats.FeatureProfileAccumulator 的狀態
+    profile_data = Column(JSON)    # 與 PitchModel.profile_data 相同格式
+    is_stale = Column(Boolean, default=False)  # 分析紀錄被修改 / 刪除後設為 True，下次讀取時重建
+    updated_at = Column(DateTime(timezone=True))
+    height_cm = Column(Float, nullable=True)  # 投手身高，用於由骨架估算 pixel_to_meter
+    last_analysis_id = Column(Integer, nullable=True)  # 已計入統計的最大 PitchAnalyses.id (避免同一筆紀錄重複計入)
+    analysis_count = Column(Integer, nullable=True)    # id 不大於 last_analysis_id 的已計入紀錄數 (偵測漏算)
+
+# 表五：以影片內容 SHA-256 為鍵的分析結果快取 (重複上傳同一支影片時跳過推論、渲染與上傳)
+class AnalysisCache(Base):
+    __tablename__ = 'analysis_cache'
+
+    video_hash = Column(String(64), primary_key=True)
+    pose_data = Column(JSON, nullable=False)
+    ball_data = Column(JSON, nullable=False)
+    biomechanics_features = Column(JSON)
+    max_speed_kmh = Column(Float)
+    ball_score = Column(Float)
+    output_video_url = Column(String)
+    release_frame_url = Column(String)
+    landing_frame_url = Column(String)
+    shoulder_frame_url = Column(String)
+    keyframe_variant_urls = Column(JSON, nullable=True)  # 關鍵影格的 WebP / 縮圖網址
+    annotation_url = Column(String, nullable=True)
+    ball_speed = Column(JSON, nullable=True)  # BallSpeedEstimate.to_dict()：中位數球速與逐段速度
+    calibration = Column(JSON, nullable=True)  # 本次使用的 pixel_to_meter 與其來源 (session / pose / fixed)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_accessed_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+# 表六：非同步分析任務佇列 (POST /analyze-pitch/ 的任務模式)
+class AnalysisJob(Base):
+    __tablename__ = 'analysis_job'
+
+    id = Column(String(32), primary_key=True)
+    status = Column(String, nullable=False, default='queued', index=True)  # queued / running / succeeded / failed
+    stage = Column(String, default='queued')
+    progress = Column(Float, default=0.0)
+    player_name = Column(String, index=True)
+    benchmark_name = Column(String)
+    compare_average = Column(Boolean, default=False)
+    render_mode = Column(String, default='video')  # video / overlay
+    height_cm = Column(Float, nullable=True)
+    camera_session_id = Column(String, nullable=True)
+    video_path = Column(String)  # 暫存影片路徑 (任務結束後刪除)
+    owner_id = Column(String, nullable=True, index=True)  # 暫存影片所在的服務實例 (見 jobs.instance_id)，只有它能執行這筆任務
+    claimed_by = Column(String, nullable=True)  # 正在執行的行程 (見 jobs.process_id)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)  # 執行中任務的租約，過期才會重新排隊
+    video_filename = Column(String)
+    video_hash = Column(String(64))
+    result = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+# 表七：每個攝影機架設 (camera session) 的像素換算比例，同一個 session 的影片直接沿用
+class CameraCalibration(Base):
+    __tablename__ = 'camera_calibration'
+
+    camera_session_id = Column(String, primary_key=True)
+    pixel_to_meter = Column(Float, nullable=False)
+    height_cm = Column(Float)              # 估算時使用的投手身高
+    sample_count = Column(Integer)
+    segments = Column(JSON)                # PixelCalibration.CalibrationResult.segments
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 # --- 3. 執行資料庫操作的函式 ---
 
@@ -88,6 +219,68 @@ def get_db():
     finally:
         db.close()
 
+class ThreadedSession:
+    """
+    沒有非同步驅動時 get_async_db 提供的替代品：只實作 crud 的 async 函式用到的 AsyncSession 介面
+    (execute / add / commit / rollback / refresh / run_sync / close)，
+    需要連線資料庫的操作交給 IO 執行緒池執行，事件迴圈同樣不會被卡住。
+    """
+
+    def __init__(self):
+        self._session = SessionLocal()
+
+    async def _run(self, fn, *args, **kwargs):
+        from executors import run_io
+        return await run_io(fn, *args, **kwargs)
+
+    async def execute(self, statement):
+        # 在執行緒內把結果全部讀出 (freeze)，回到事件迴圈後 .all() / .scalars() 不會再碰連線
+        return (await self._run(lambda: self._session.execute(statement).freeze()))()
+
+    def add(self, instance):
+        self._session.add(instance)
+
+    async def commit(self):
+        await self._run(self._session.commit)
+
+    async def rollback(self):
+        await self._run(self._session.rollback)
+
+    async def refresh(self, instance):
+        await self._run(self._session.refresh, instance)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await self._run(fn, self._session, *args, **kwargs)
+
+    async def close(self):
+        self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+def new_async_session():
+    """
+    建立一個非同步 session (沒有非同步驅動時為 ThreadedSession)，給路由以外的地方使用：
+    async with new_async_session() as db: ...
+    """
+    return AsyncSessionLocal() if AsyncSessionLocal is not None else ThreadedSession()
+
+
+async def get_async_db():
+    """
+    非同步版本的 get_db。回傳的物件支援 await db.execute(select(...)) 與 await db.run_sync(fn, ...)，
+    crud 的 async 函式都透過它執行。
+    """
+    db = new_async_session()
+    try:
+        yield db
+    finally:
+        await db.close()
+
 def reset_database():
     """
     先刪除所有已知的資料表，然後再根據上面的模型全部重建。
@@ -0,0 +1,68 @@
+# 檔案: executors.py
+# 職責: 管理阻塞工作的執行緒池 (IO) 與行程池 (CV/ML)，讓 event loop 只負責協調。
+
+import asyncio
+import functools
+import logging
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+from config import IO_POOL_SIZE, CPU_POOL_SIZE, CPU_POOL_START_METHOD, EXECUTOR_QUEUE_FACTOR
+
+logger = logging.getLogger(__name__)
+
+_io_pool: Optional[ThreadPoolExecutor] = None
+_cpu_pool: Optional[ProcessPoolExecutor] = None
+_io_slots: Optional[asyncio.Semaphore] = None
+_cpu_slots: Optional[asyncio.Semaphore] = None
+
+
+def start_executors() -> None:
+    """建立執行緒池與行程池，於 FastAPI 啟動時呼叫一次。"""
+    global _io_pool, _cpu_pool, _io_slots, _cpu_slots
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=IO_POOL_SIZE, thread_name_prefix="io")
+        _io_slots = asyncio.Semaphore(IO_POOL_SIZE * EXECUTOR_QUEUE_FACTOR)
+    if _cpu_pool is None and CPU_POOL_SIZE > 0:
+        # 預設用 spawn：uvicorn 已經有多條執行緒，fork 之後子行程可能卡在被複製的鎖上
+        context = multiprocessing.get_context(CPU_POOL_START_METHOD)
+        _cpu_pool = ProcessPoolExecutor(max_workers=CPU_POOL_SIZE, mp_context=context)
+        _cpu_slots = asyncio.Semaphore(CPU_POOL_SIZE * EXECUTOR_QUEUE_FACTOR)
+    logger.info(f"執行器已啟動: IO 執行緒 {IO_POOL_SIZE} 條, CPU 行程 {CPU_POOL_SIZE} 個")
+
+
+def shutdown_executors() -> None:
+    """關閉所有池，於 FastAPI 關閉時呼叫。"""
+    global _io_pool, _cpu_pool, _io_slots, _cpu_slots
+    if _cpu_pool is not None:
+        _cpu_pool.shutdown(wait=True, cancel_futures=True)
+        _cpu_pool = None
+        _cpu_slots = None
+    if _io_pool is not None:
+        _io_pool.shutdown(wait=True, cancel_futures=True)
+        _io_pool = None
+        _io_slots = None
+
+
+async def run_io(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """在 IO 執行緒池中執行阻塞的 IO 工作 (GCS、資料庫、檔案)。"""
+    if _io_pool is None:
+        start_executors()
+    async with _io_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_io_pool, functools.partial(func, *args, **kwargs))
+
+
+async def run_cpu(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    在行程池中執行 CPU 密集的工作 (影片渲染、特徵計算、模型推論)。
+    func 與參數必須可以被 pickle (模組層級的函式)。CPU_POOL_SIZE=0 時改在 IO 執行緒池執行。
+    """
+    if _io_pool is None:
+        start_executors()
+    if _cpu_pool is None:
+        return await run_io(func, *args, **kwargs)
+    async with _cpu_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_cpu_pool, functools.partial(func, *args, **kwargs))
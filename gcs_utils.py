@@ -1,24 +1,173 @@
-from google.cloud import storage
+# 檔案: gcs_utils.py
+# 職責: 物件儲存上傳。整個行程共用一個 storage.Client (連線池)，大檔案使用可續傳的分塊上傳，
+#       暫時性錯誤以指數退避重試；多個檔案可並行上傳，總耗時接近最大的單一檔案。
+#       STORAGE_BACKEND=local 時改寫入本機目錄，供開發與測試使用。
+
+import asyncio
+import logging
+import mimetypes
+import os
+import shutil
+import threading
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+from config import (GCS_BUCKET_NAME, GCS_PROJECT, STORAGE_BACKEND, LOCAL_STORAGE_DIR, LOCAL_STORAGE_BASE_URL,
+                    UPLOAD_CHUNK_SIZE, UPLOAD_RESUMABLE_THRESHOLD, UPLOAD_TIMEOUT,
+                    UPLOAD_RETRY_INITIAL, UPLOAD_RETRY_MAXIMUM, UPLOAD_RETRY_DEADLINE)
+from executors import run_io
+
+if TYPE_CHECKING:
+    from google.cloud import storage
+
+logger = logging.getLogger(__name__)
+
+# 可續傳上傳的分塊大小必須是 256 KiB 的倍數
+_CHUNK_ALIGNMENT = 256 * 1024
+
+
+
+@lru_cache(maxsize=1)
+def upload_retry():
+    # google-cloud-storage 的 import 約需 0.2 秒，延到第一次上傳 (或背景預熱) 時才載入，縮短冷啟動時間
+    from google.cloud.storage.retry import DEFAULT_RETRY
+    return DEFAULT_RETRY.with_delay(
+        initial=UPLOAD_RETRY_INITIAL, maximum=UPLOAD_RETRY_MAXIMUM, multiplier=2.0
+    ).with_deadline(UPLOAD_RETRY_DEADLINE)
+
+
+def _guess_content_type(blob_name: str) -> str:
+    return mimetypes.guess_type(blob_name)[0] or "application/octet-stream"
+
+
+class GCSStorage:
+    """上傳到 Google Cloud Storage，回傳物件的公開網址。"""
+
+    def __init__(self, bucket_name: str, project: str, client: Optional["storage.Client"] = None):
+        self.bucket_name = bucket_name
+        self.project = project
+        self._client = client
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> "storage.Client":
+        # 第一次上傳時才建立；之後所有執行緒共用同一個 client 與底層的 HTTP 連線池
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from google.cloud import storage
+                    # 本地端使用金鑰
+                    # self._client = storage.Client.from_service_account_json("bustling-joy-463213-u1-8cf4fd648779.json")
+                    # cloud run不需要金鑰
+                    self._client = storage.Client(project=self.project)
+        return self._client
+
+    def _blob(self, blob_name: str, size: int):
+        # chunk_size 有值時 google-cloud-storage 會使用可續傳上傳，每個分塊各自重試，不必整檔重傳
+        chunk_size = None
+        if size > UPLOAD_RESUMABLE_THRESHOLD:
+            chunk_size = max(_CHUNK_ALIGNMENT, UPLOAD_CHUNK_SIZE // _CHUNK_ALIGNMENT * _CHUNK_ALIGNMENT)
+        return self.client.bucket(self.bucket_name).blob(blob_name, chunk_size=chunk_size)
+
+    def upload_file(self, source_file_path: str, destination_blob_name: str, content_type: Optional[str] = None) -> str:
+        blob = self._blob(destination_blob_name, os.path.getsize(source_file_path))
+        blob.upload_from_filename(
+            source_file_path,
+            content_type=content_type or _guess_content_type(destination_blob_name),
+            timeout=UPLOAD_TIMEOUT,
+            retry=upload_retry(),
+        )
+        logger.info(f"已上傳至 gs://{self.bucket_name}/{destination_blob_name}")
+        return blob.public_url
+
+    def upload_bytes(self, data: bytes, destination_blob_name: str, content_type: Optional[str] = None) -> str:
+        blob = self._blob(destination_blob_name, len(data))
+        blob.upload_from_string(
+            data,
+            content_type=content_type or _guess_content_type(destination_blob_name),
+            timeout=UPLOAD_TIMEOUT,
+            retry=upload_retry(),
+        )
+        logger.info(f"已上傳至 gs://{self.bucket_name}/{destination_blob_name}")
+        return blob.public_url
+
+
+class LocalStorage:
+    """寫入本機目錄，網址為 LOCAL_STORAGE_BASE_URL/<物件名稱> (main.py 會把目錄掛在 /storage)。"""
+
+    def __init__(self, root_dir: str, base_url: str):
+        self.root_dir = root_dir
+        self.base_url = base_url.rstrip("/")
+
+    def _target_path(self, destination_blob_name: str) -> str:
+        # 物件名稱含有使用者上傳的檔名，拒絕 ../ 或絕對路徑等寫到 root_dir 以外的名稱
+        root = os.path.realpath(self.root_dir)
+        path = os.path.realpath(os.path.join(root, *destination_blob_name.split("/")))
+        if os.path.commonpath([root, path]) != root or path == root:
+            raise ValueError(f"不合法的物件名稱: {destination_blob_name}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def upload_file(self, source_file_path: str, destination_blob_name: str, content_type: Optional[str] = None) -> str:
+        shutil.copyfile(source_file_path, self._target_path(destination_blob_name))
+        return f"{self.base_url}/{destination_blob_name}"
+
+    def upload_bytes(self, data: bytes, destination_blob_name: str, content_type: Optional[str] = None) -> str:
+        with open(self._target_path(destination_blob_name), "wb") as f:
+            f.write(data)
+        return f"{self.base_url}/{destination_blob_name}"
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """回傳行程內共用的儲存後端 (依 STORAGE_BACKEND 決定)。"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if STORAGE_BACKEND == "local":
+                    _storage = LocalStorage(LOCAL_STORAGE_DIR, LOCAL_STORAGE_BASE_URL)
+                else:
+                    _storage = GCSStorage(GCS_BUCKET_NAME, GCS_PROJECT)
+    return _storage
+
 
 def upload_video_to_gcs(bucket_name, source_file_path, destination_blob_name):
-    # 初始化 GCS 客戶端
-    # 本地端使用金鑰
-    #client = storage.Client.from_service_account_json("bustling-joy-463213-u1-8cf4fd648779.json")
-    # cloud run不需要金鑰
-    client = storage.Client(project='jojo-463304')
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(destination_blob_name)
-
-    # 上傳影片
-    blob.upload_from_filename(source_file_path)
-    print(f"影片已上傳至 gs://{bucket_name}/{destination_blob_name}")
-
-    # 設定檔案為公開
-    # blob.make_public()
-    print("影片已設為公開")
-
-    # 回傳公開 URL
-    public_url = blob.public_url
-    print(f"公開網址：{public_url}")
-    return public_url
+    """舊介面：上傳單一檔案並回傳公開網址。bucket 與目前設定不同時另建一個 GCSStorage。"""
+    backend = get_storage()
+    if isinstance(backend, GCSStorage) and bucket_name != backend.bucket_name:
+        backend = GCSStorage(bucket_name, backend.project, client=backend.client)
+    return backend.upload_file(source_file_path, destination_blob_name)
+
+
+def upload_bytes(data: bytes, destination_blob_name: str, content_type: Optional[str] = None) -> str:
+    """上傳記憶體中的內容 (例如編碼後的圖片) 並回傳公開網址。"""
+    return get_storage().upload_bytes(data, destination_blob_name, content_type)
+
+
+async def upload_files(uploads: Dict[str, Tuple[str, str]]) -> Dict[str, str]:
+    """
+    並行上傳多個檔案。uploads 為 {鍵: (本機路徑, 物件名稱)}，回傳 {鍵: 公開網址}。
+    任一檔案上傳失敗 (重試後仍失敗) 時拋出該例外。
+    """
+    backend = get_storage()
+    keys = list(uploads)
+    urls = await asyncio.gather(*[
+        run_io(backend.upload_file, uploads[key][0], uploads[key][1]) for key in keys
+    ])
+    return dict(zip(keys, urls))
+
 
+async def upload_buffers(uploads: Dict[str, Tuple[bytes, str, Optional[str]]]) -> Dict[str, str]:
+    """
+    並行上傳多個記憶體中的內容。uploads 為 {鍵: (內容, 物件名稱, content_type)}，回傳 {鍵: 公開網址}。
+    """
+    backend = get_storage()
+    keys = list(uploads)
+    urls = await asyncio.gather(*[
+        run_io(backend.upload_bytes, *uploads[key]) for key in keys
+    ])
+    return dict(zip(keys, urls))
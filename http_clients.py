@@ -0,0 +1,58 @@
+# 檔案: http_clients.py
+# 職責: 管理呼叫上游模型 API (POSE / BALL) 的長駐 httpx client，重複使用 TLS 連線。
+
+import logging
+from typing import Dict
+
+import httpx
+
+from config import API_TIMEOUT, API_CONNECT_TIMEOUT, API_KEEPALIVE_EXPIRY, UPSTREAM_LIMITS
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401  有安裝 h2 才能啟用 HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _build_client(upstream: str) -> httpx.AsyncClient:
+    limits = UPSTREAM_LIMITS[upstream]
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        timeout=httpx.Timeout(API_TIMEOUT, connect=API_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=limits["max_connections"],
+            max_keepalive_connections=limits["max_keepalive_connections"],
+            keepalive_expiry=API_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def start_http_clients() -> None:
+    """為每個上游建立一個 client，於 FastAPI 啟動時呼叫。"""
+    for upstream in UPSTREAM_LIMITS:
+        if upstream not in _clients:
+            _clients[upstream] = _build_client(upstream)
+    logger.info(f"HTTP client 已建立: {list(_clients)} (HTTP/2: {HTTP2_AVAILABLE})")
+
+
+async def close_http_clients() -> None:
+    """關閉所有 client 與其連線，於 FastAPI 關閉時呼叫。"""
+    while _clients:
+        _, client = _clients.popitem()
+        await client.aclose()
+
+
+def get_http_client(upstream: str) -> httpx.AsyncClient:
+    """
+    取得指定上游 ("pose" 或 "ball") 的共用 client。
+    若尚未啟動 (例如在腳本中直接呼叫服務層)，會在第一次使用時建立。
+    """
+    client = _clients.get(upstream)
+    if client is None or client.is_closed:
+        client = _clients[upstream] = _build_client(upstream)
+    return client
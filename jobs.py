@@ -0,0 +1,251 @@
+# 檔案: jobs.py
+# 職責: 非同步分析任務。請求只負責暫存影片並建立任務，由 worker 依序執行 analyze_spooled_pitch，
+#       任務狀態與進度存於 analysis_job 資料表 (資料庫即佇列，重啟後可繼續)。
+#       暫存影片在建立任務的實例本機磁碟上，因此每筆任務記錄擁有者 (instance_id)，
+#       worker 只搶自己實例的任務，多個實例共用同一個資料庫時不會互相干擾。
+#       同一個實例上可能有多個行程 (uvicorn / gunicorn workers)，搶到任務的行程記錄在 claimed_by (process_id)，
+#       並定期更新 heartbeat_at (租約)；只有租約過期 (執行的行程已結束) 的任務才會被重新排隊，
+#       不會把其他行程正在執行的任務搶回來重跑。
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from fastapi.encoders import jsonable_encoder
+
+import crud
+import services
+from config import (JOB_WORKERS, JOB_POLL_INTERVAL, JOB_EVENT_INTERVAL, JOB_SPOOL_DIR, JOB_INSTANCE_ID,
+                    JOB_LEASE_SECONDS, JOB_HEARTBEAT_INTERVAL)
+from database import SessionLocal
+from executors import run_io
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+_workers: List[asyncio.Task] = []
+# 本實例新建立的任務 ID 會先放進這個佇列，讓閒置的 worker 立即接手；
+# 其餘任務 (重啟後重新排隊、其他實例建立的) 由 worker 定期輪詢資料庫取得
+_local_hints: Optional[asyncio.Queue] = None
+_instance_id: Optional[str] = None
+_process_id: Optional[str] = None
+# 本行程正在執行的任務，由 _lease_loop 定期續約
+_running_jobs: Set[str] = set()
+
+INSTANCE_ID_FILE = ".instance_id"
+
+
+def instance_id() -> str:
+    """
+    本實例的任務擁有者 ID。沒有設定 JOB_INSTANCE_ID 時保存在 JOB_SPOOL_DIR 中：
+    同一個暫存目錄 (例如重啟後的同一台主機) 沿用同一個 ID，看不到這些暫存影片的實例則是不同的 ID。
+    """
+    global _instance_id
+    if _instance_id is None:
+        if JOB_INSTANCE_ID:
+            _instance_id = JOB_INSTANCE_ID
+        else:
+            os.makedirs(JOB_SPOOL_DIR, exist_ok=True)
+            path = os.path.join(JOB_SPOOL_DIR, INSTANCE_ID_FILE)
+            try:
+                with open(path, "x", encoding="utf-8") as f:
+                    f.write(uuid.uuid4().hex)
+            except FileExistsError:
+                pass
+            with open(path, "r", encoding="utf-8") as f:
+                _instance_id = f.read().strip()
+    return _instance_id
+
+
+def process_id() -> str:
+    """本行程的 ID (記錄在搶到的任務上)：實例 ID + pid + 隨機值 (容器重啟後 pid 可能重複)。"""
+    global _process_id
+    if _process_id is None:
+        _process_id = f"{instance_id()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    return _process_id
+
+
+def _with_session(func, *args, **kwargs):
+    """在 IO 執行緒中開一個獨立的資料庫 session 執行 crud 函式。"""
+    db = SessionLocal()
+    try:
+        return func(db, *args, **kwargs)
+    finally:
+        db.close()
+
+
+async def submit_analysis_job(video_file, player_name: str, benchmark_name: str, compare_average: bool,
+                              render_mode: str = "video", camera_session_id: Optional[str] = None,
+                              height_cm: Optional[float] = None) -> str:
+    """暫存影片並建立排隊中的任務，回傳任務 ID。"""
+    os.makedirs(JOB_SPOOL_DIR, exist_ok=True)
+    temp_video_path, video_hash = await services.spool_video(video_file, JOB_SPOOL_DIR)
+
+    job_id = uuid.uuid4().hex
+    await run_io(_with_session, crud.create_analysis_job, {
+        "id": job_id,
+        "player_name": player_name,
+        "benchmark_name": benchmark_name,
+        "compare_average": compare_average,
+        "render_mode": render_mode,
+        "camera_session_id": camera_session_id,
+        "height_cm": height_cm,
+        "video_path": temp_video_path,
+        "video_filename": video_file.filename,
+        "video_hash": video_hash,
+        "owner_id": instance_id(),
+    })
+    if _local_hints is not None:
+        _local_hints.put_nowait(job_id)
+    logger.info(f"任務層：已建立分析任務 {job_id} (player_name='{player_name}')")
+    return job_id
+
+
+async def _next_job_id() -> Optional[str]:
+    """取得並搶下一筆排隊中的任務，沒有任務時回傳 None。"""
+    try:
+        candidates = [await asyncio.wait_for(_local_hints.get(), timeout=JOB_POLL_INTERVAL)]
+    except asyncio.TimeoutError:
+        candidates = await run_io(_with_session, crud.get_queued_job_ids, instance_id(), limit=JOB_WORKERS)
+
+    for job_id in candidates:
+        if await run_io(_with_session, crud.claim_analysis_job, job_id, instance_id(), process_id()):
+            return job_id
+    return None
+
+
+async def _run_job(job_id: str) -> None:
+    db = SessionLocal()
+    job = None
+    _running_jobs.add(job_id)
+    try:
+        job = await run_io(crud.get_analysis_job, db, job_id)
+
+        async def progress(stage: str, fraction: float) -> None:
+            await run_io(crud.update_analysis_job, db, job_id, claimed_by=process_id(), stage=stage, progress=fraction)
+
+        result = await services.analyze_spooled_pitch(
+            db=db,
+            temp_video_path=job.video_path,
+            filename=job.video_filename,
+            video_hash=job.video_hash,
+            player_name=job.player_name,
+            benchmark_name=job.benchmark_name,
+            compare_average=job.compare_average,
+            progress=progress,
+            render_mode=job.render_mode or "video",
+            camera_session_id=job.camera_session_id,
+            height_cm=job.height_cm
+        )
+        if await run_io(crud.update_analysis_job, db, job_id, claimed_by=process_id(),
+                        status="succeeded", stage="done", progress=1.0, result=jsonable_encoder(result)):
+            logger.info(f"任務層：分析任務 {job_id} 完成")
+        else:
+            logger.warning(f"任務層：分析任務 {job_id} 的租約已過期並被重新排隊，不寫入這次的結果")
+    except Exception as e:
+        logger.error(f"任務層：分析任務 {job_id} 失敗: {e}", exc_info=True)
+        db.rollback()
+        failed = await run_io(crud.update_analysis_job, db, job_id, claimed_by=process_id(), status="failed", error=str(e))
+        # 任務已被其他行程接手時，暫存影片留給它使用
+        if failed and job is not None and job.video_path and os.path.exists(job.video_path):
+            os.remove(job.video_path)
+    finally:
+        _running_jobs.discard(job_id)
+        db.close()
+
+
+async def _worker_loop(worker_id: int) -> None:
+    while True:
+        try:
+            job_id = await _next_job_id()
+            if job_id is not None:
+                logger.info(f"任務層：worker {worker_id} 開始執行任務 {job_id}")
+                await _run_job(job_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 資料庫暫時無法連線等狀況，稍後再試，不讓 worker 結束
+            logger.error(f"任務層：worker {worker_id} 發生錯誤: {e}", exc_info=True)
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+
+async def _requeue_expired_jobs() -> None:
+    try:
+        requeued = await run_io(_with_session, crud.requeue_expired_jobs, instance_id(), JOB_LEASE_SECONDS, os.path.exists)
+        if requeued:
+            logger.info(f"任務層：重新排隊 {requeued} 筆租約過期的任務")
+    except Exception as e:
+        logger.error(f"任務層：重新排隊租約過期的任務失敗: {e}", exc_info=True)
+
+
+async def _lease_loop() -> None:
+    """定期為本行程執行中的任務續約，並重新排隊本實例上租約過期 (執行的行程已結束) 的任務。"""
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+        try:
+            await run_io(_with_session, crud.renew_job_leases, list(_running_jobs), process_id())
+        except Exception as e:
+            logger.error(f"任務層：任務續約失敗: {e}", exc_info=True)
+        await _requeue_expired_jobs()
+
+
+async def start_job_workers() -> None:
+    """重新排隊租約已過期的任務並啟動 worker 與續約迴圈，於 FastAPI 啟動時呼叫。"""
+    global _local_hints
+    _local_hints = asyncio.Queue()
+    await _requeue_expired_jobs()
+    _workers.append(asyncio.create_task(_lease_loop()))
+    for worker_id in range(JOB_WORKERS):
+        _workers.append(asyncio.create_task(_worker_loop(worker_id)))
+
+
+async def stop_job_workers() -> None:
+    """停止所有 worker，於 FastAPI 關閉時呼叫。執行中的任務在租約過期後由本實例的行程重新排隊或標記失敗。"""
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+
+def _job_snapshot(db, job_id: str) -> Optional[Dict[str, Any]]:
+    job = crud.get_analysis_job(db, job_id)
+    if job is None:
+        return None
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "stage": job.stage,
+        "progress": job.progress,
+        "error": job.error,
+        "result": job.result if job.status == "succeeded" else None,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+    }
+
+
+async def get_job_snapshot(job_id: str) -> Optional[Dict[str, Any]]:
+    """回傳任務目前的狀態；任務不存在時回傳 None。"""
+    return await run_io(_with_session, _job_snapshot, job_id)
+
+
+async def job_event_stream(job_id: str) -> AsyncIterator[str]:
+    """
+    以 Server-Sent Events 格式推送任務進度，狀態或進度有變化時才送出，任務結束後關閉串流。
+    """
+    last_state = None
+    while True:
+        snapshot = await get_job_snapshot(job_id)
+        if snapshot is None:
+            yield f"event: error\ndata: {json.dumps({'detail': '任務不存在'}, ensure_ascii=False)}\n\n"
+            return
+        state = (snapshot["status"], snapshot["stage"], snapshot["progress"])
+        if state != last_state:
+            yield f"data: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+            last_state = state
+        if snapshot["status"] in TERMINAL_STATUSES:
+            return
+        await asyncio.sleep(JOB_EVENT_INTERVAL)
@@ -1,11 +1,17 @@
 # 檔案: mainV2.py
 # 職責: 作為 API 的入口點，接收請求並完全轉交給服務層處理。
 
+import startup
+startup.mark_import_started()
+
+import json
 import logging
+import os
+from contextlib import asynccontextmanager
 from typing import Optional, List
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Depends, Query, Body
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Depends, Query, Body, Request
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
@@ -18,8 +24,14 @@ import uvicorn
 from crud import create_pitch_analysis
 import crud
 import services
-from database import get_db, PitchAnalyses
+import jobs
+import model_cache
+from model_registry import collect_model_stats
+from database import get_db, get_async_db, async_engine, PitchAnalyses
 from models import PitchAnalysisUpdate
+from executors import start_executors, shutdown_executors
+from http_clients import start_http_clients, close_http_clients
+from config import STORAGE_BACKEND, LOCAL_STORAGE_DIR, RENDER_MODES, DEFAULT_RENDER_MODE, WARMUP_BLOCKING
 
 # --- 全域設定 ---
 logging.basicConfig(
@@ -29,7 +41,31 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 啟動：建立 IO 執行緒池與 CPU 行程池 (行程池的 worker 在第一次送出工作時才啟動)、呼叫上游 API 的共用 HTTP client，
+    # 之後在背景預熱 (見 startup.run_warmup)，不等預熱完成就開始接受請求 (WARMUP_BLOCKING=true 時等待)，
+    # 預熱完成前 /readyz 回 503，負載平衡器不會把分析請求送進來。
+    # 除了資料庫以外的預熱失敗不影響服務，模組、模型與連線會在第一次使用時再建立
+    start_executors()
+    start_http_clients()
+    model_cache.start_model_cache_refresher()
+    await jobs.start_job_workers()
+    warmup_task = startup.start_warmup()
+    if WARMUP_BLOCKING:
+        await warmup_task
+    startup.mark_startup_finished()
+    yield
+    # 關閉：等待進行中的工作結束後釋放池與連線
+    await startup.stop_warmup()
+    await jobs.stop_job_workers()
+    await model_cache.stop_model_cache_refresher()
+    await close_http_clients()
+    if async_engine is not None:
+        await async_engine.dispose()
+    shutdown_executors()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS 設置
 app.add_middleware(
@@ -38,8 +74,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],  # 讓前端讀得到分頁游標與模型列表的 ETag
 )
 
+@app.middleware("http")
+async def record_first_response(request: Request, call_next):
+    # 記錄啟動後第一個回應的時間 (GET /startup-profile 的 first_response_seconds)
+    response = await call_next(request)
+    startup.mark_response()
+    return response
+
+# 本機儲存後端 (STORAGE_BACKEND=local)：上傳的影片與關鍵影格由這裡提供下載
+if STORAGE_BACKEND == "local":
+    os.makedirs(LOCAL_STORAGE_DIR, exist_ok=True)
+    app.mount("/storage", StaticFiles(directory=LOCAL_STORAGE_DIR), name="storage")
+
 # --- API 路由 ---
 
 @app.post("/analyze-pitch/")
@@ -48,13 +97,46 @@ async def analyze_pitch(
     video_file: UploadFile = File(...), 
     player_name: str = Form(...),
     benchmark_name: str = Form(...),
-    compare_average: bool = Form(False)
+    compare_average: bool = Form(False),
+    async_job: bool = Form(False),
+    render_mode: str = Form(DEFAULT_RENDER_MODE),
+    camera_session_id: Optional[str] = Form(None),
+    height_cm: Optional[float] = Form(None)
 ):
     """
     接收前端請求，將所有工作轉交給服務層，並直接回傳服務層的結果。
+    async_job=True 時改為任務模式：立即回傳任務 ID，之後以 GET /jobs/{job_id} 查詢進度與結果。
+    render_mode="overlay" 時不輸出渲染影片，改為回傳原始影片與標註軌網址 (annotation_url)，由前端繪製骨架與棒球框。
+    camera_session_id 為同一次攝影機架設的識別碼：第一支影片由骨架估算 pixel_to_meter，之後的影片直接沿用。
+    height_cm 為投手身高 (會記錄到投手資料，之後可省略)，用於估算 pixel_to_meter。
     """
     if not video_file.filename:
         raise HTTPException(status_code=400, detail="未上傳影片檔案")
+    if render_mode not in RENDER_MODES:
+        raise HTTPException(status_code=400, detail=f"render_mode 必須是 {', '.join(RENDER_MODES)} 其中之一")
+    if height_cm is not None and not 100 <= height_cm <= 250:
+        raise HTTPException(status_code=400, detail="height_cm 必須介於 100 到 250 之間")
+
+    if async_job:
+        try:
+            job_id = await jobs.submit_analysis_job(
+                video_file=video_file,
+                player_name=player_name,
+                benchmark_name=benchmark_name,
+                compare_average=compare_average,
+                render_mode=render_mode,
+                camera_session_id=camera_session_id,
+                height_cm=height_cm
+            )
+        except Exception as e:
+            logger.error(f"建立分析任務失敗: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"建立分析任務失敗: {str(e)}")
+        return JSONResponse(status_code=202, content={
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/jobs/{job_id}",
+            "events_url": f"/jobs/{job_id}/events"
+        })
 
     try:
         final_response_package = await services.analyze_pitch_service(
@@ -62,7 +144,10 @@ async def analyze_pitch(
             video_file=video_file,
             player_name=player_name,
             benchmark_name=benchmark_name,
-            compare_average=compare_average 
+            compare_average=compare_average,
+            render_mode=render_mode,
+            camera_session_id=camera_session_id,
+            height_cm=height_cm
         )
         
         return final_response_package
@@ -74,87 +159,143 @@ async def analyze_pitch(
         raise HTTPException(status_code=500, detail=f"影片分析處理失敗: {str(e)}")
 
 
+@app.get("/jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    """
+    查詢分析任務的狀態 (queued / running / succeeded / failed)、目前階段與進度，
+    完成時 result 即為同步模式下 /analyze-pitch/ 的回傳內容。
+    """
+    try:
+        snapshot = await jobs.get_job_snapshot(job_id)
+    except SQLAlchemyError as e:
+        logger.error(f"無法獲取任務狀態: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"無法獲取任務狀態: {str(e)}")
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="任務未找到")
+    return snapshot
+
+@app.get("/jobs/{job_id}/events")
+async def stream_analysis_job_events(job_id: str):
+    """
+    以 Server-Sent Events 推送任務進度，任務結束 (成功或失敗) 後關閉串流。
+    """
+    return StreamingResponse(jobs.job_event_stream(job_id), media_type="text/event-stream")
+
+
+def _history_record_to_dict(record, include_features: bool) -> dict:
+    item = {
+        "id": record.id,
+        "video_path": record.video_path,
+        "max_speed_kmh": record.max_speed_kmh,
+        "pose_score": record.pose_score,
+        "ball_score": record.ball_score,
+        "player_name": record.player_name,
+        "created_at": record.created_at.isoformat() if record.created_at else None,
+        "pose_score_message": record.pose_score_message,
+        "keyframe_urls": {
+            "release_frame_url": record.release_frame_url or "",
+            "landing_frame_url": record.landing_frame_url or "",
+            "shoulder_frame_url": record.shoulder_frame_url or ""
+        },
+        "annotation_url": record.annotation_url
+    }
+    if include_features:
+        item["biomechanics_features"] = record.biomechanics_features
+    return item
+
+async def _stream_history(records, include_features: bool):
+    """逐筆輸出 JSON 陣列 (紀錄已經查詢完畢，這裡只負責序列化)。"""
+    yield "["
+    for index, record in enumerate(records):
+        yield ("," if index else "") + json.dumps(_history_record_to_dict(record, include_features), ensure_ascii=False)
+    yield "]"
+
 @app.get("/history/")
-async def get_history_analyses(player_name: str = None, db: Session = Depends(get_db)):
+async def get_history_analyses(
+    player_name: str = None,
+    cursor: Optional[int] = Query(None, description="上一頁回應標頭 X-Next-Cursor 的值，省略代表從最新一筆開始"),
+    limit: int = Query(100, ge=1, le=500),
+    fields: str = Query("full", pattern="^(summary|full)$", description="summary 不含 biomechanics_features"),
+    db = Depends(get_async_db)
+):
+    """
+    依 id 由新到舊回傳歷史紀錄 (keyset 分頁)。回應本體仍為紀錄的 JSON 陣列，
+    下一頁的游標放在 X-Next-Cursor 標頭 (沒有下一頁時不帶此標頭)。
+    """
+    include_features = (fields == "full")
     try:
-        history_records = crud.get_pitch_analyses(db, player_name)
-        return [
-            {
-                "id": record.id,
-                "video_path": record.video_path,
-                "max_speed_kmh": record.max_speed_kmh,
-                "pose_score": record.pose_score,
-                "ball_score": record.ball_score,
-                "biomechanics_features": record.biomechanics_features,
-                "player_name": record.player_name,
-                "created_at": record.created_at.isoformat() if record.created_at else None,
-                "pose_score_message": getattr(record, 'pose_score_message', '分析成功'),
-                "keyframe_urls": {
-                    "release_frame_url": record.release_frame_url or "",
-                    "landing_frame_url": record.landing_frame_url or "",
-                    "shoulder_frame_url": record.shoulder_frame_url or ""
-                }
-            }
-            for record in history_records
-        ]
+        # 標頭必須在本體之前送出，因此先讀完整頁 (含判斷下一頁的第 limit + 1 筆)，再串流序列化
+        records, next_cursor = await crud.get_pitch_analysis_history_async(db, player_name, cursor, limit, include_features)
     except SQLAlchemyError as e:
         logger.error(f"無法獲取歷史紀錄: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"無法獲取歷史紀錄: {str(e)}")
 
+    headers = {"X-Next-Cursor": str(next_cursor)} if next_cursor is not None else {}
+    return StreamingResponse(
+        _stream_history(records, include_features),
+        media_type="application/json",
+        headers=headers
+    )
+
 @app.get("/models/")
-async def get_available_models(db: Session = Depends(get_db)):
+async def get_available_models(request: Request, db = Depends(get_async_db)):
     """
     提供前端動態建立「比對標竿」下拉選單所需的所有菁英選手模型，
     並包含完整的 profile_data 供前端快取使用。
+    回應內容由 model_cache 預先序列化，並帶有 ETag；前端帶 If-None-Match 且模型未變動時回傳 304。
     """
     try:
-        models_from_db = crud.get_all_pitch_models(db)
-        
-        # 建立一個字典來翻譯球種縮寫
-        pitch_type_translator = {
-            "FS": "分指快速球 / 指叉球 (Splitter / Split-Finger Fastball)",
-            "FF": "四縫線快速球 (Four-Seam Fastball)",
-            "SL": "滑球 (Slider)",
-            "CU": "曲球 (Curveball)",
-            "CH": "變速球 (Changeup)",
-            "FO": "指叉球 (Forkball)",
-            "all": "通用"
-        }
-        
-        formatted_models = []
-        for model in models_from_db:
-            parts = model.model_name.split('_')
-            # 預期格式為 "姓, 名_球種縮寫_v1" 或 "名字_姓氏_球種縮寫_v1"
-            if len(parts) >= 2:
-                player_name = parts[0].replace(",", ", ")
-                pitch_type_abbr = parts[1] if len(parts) > 1 else "all"
-                
-                # 產生顯示用的名稱
-                pitch_type_display = pitch_type_translator.get(pitch_type_abbr, pitch_type_abbr)
-                display_name = f"{player_name} - {pitch_type_display}"
-            else:
-                display_name = model.model_name # 如果格式不符，使用原名
-            
-            formatted_models.append({
-                "model_name": model.model_name,      # 後端比對時需要的原始名稱
-                "display_name": display_name,        # 前端顯示用的乾淨名稱
-                "profile_data": model.profile_data   # 【重點】將完整的 profile_data 一併回傳
-            })
-            
-        return formatted_models
+        snapshot = await model_cache.get_snapshot_async(db)
+        headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+        if_none_match = request.headers.get("if-none-match", "")
+        if snapshot.etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+        return Response(content=snapshot.models_json, media_type="application/json", headers=headers)
         
     except SQLAlchemyError as e:
         logger.error(f"無法獲取模型列表: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"無法獲取模型列表: {str(e)}")
 
+@app.get("/ml-models/")
+async def get_ml_model_stats():
+    """
+    回傳分類模型登錄表狀態：版本、載入方式、載入耗時、檔案大小與估計的記憶體用量。
+    api 為 API 行程本身，workers 為行程池中回應查詢的各個 worker (依 pid 區分)。
+    """
+    return await collect_model_stats()
+
+@app.get("/healthz")
+async def healthz():
+    """存活檢查：行程能回應就回 200，不檢查任何相依服務。"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """
+    就緒檢查：背景預熱 (資料庫連線、統計模型、分類模型、上游預先連線、假推論) 完成且資料庫可用時回 200，
+    否則回 503。回應內容為每個預熱步驟的結果與耗時。
+    """
+    ready, warmup = await startup.check_readiness()
+    return JSONResponse(status_code=200 if ready else 503,
+                        content={"status": "ready" if ready else "not_ready", **warmup})
+
+@app.get("/startup-profile")
+async def get_startup_profile(limit: int = Query(30, ge=1, le=500)):
+    """
+    回傳本行程的冷啟動分析：import main、可接受請求與第一個回應的耗時 (秒，自 import main 開始計算)、
+    背景預熱的狀態與各模組耗時，以及啟動期間自身 import 耗時最長的模組 (STARTUP_PROFILE 開啟時)。
+    """
+    return startup.startup_report(limit)
+
 @app.get("/user-average-profile/{player_name}")
-async def get_user_average_profile_endpoint(player_name: str, db: Session = Depends(get_db)):
+async def get_user_average_profile_endpoint(player_name: str, db = Depends(get_async_db)):
     """
-    即時計算並回傳指定投手的歷史平均模型。
+    回傳指定投手的歷史平均模型 (物化統計，新增分析紀錄時增量更新)。
+    統計範圍為該投手所有的分析紀錄，不再限於最近 100 筆；百分位數為 t-digest 近似值 (少量紀錄時與精確值相同)。
     """
     try:
         # 在這裡，我們不傳入 end_date，代表計算該投手的所有歷史資料平均
-        profile = crud.calculate_user_average_profile(db, player_name=player_name)
+        profile = await crud.calculate_user_average_profile_async(db, player_name=player_name)
         if not profile:
             raise HTTPException(status_code=404, detail="該投手歷史紀錄不足，無法產生平均模型")
         
@@ -169,9 +310,9 @@ async def get_user_average_profile_endpoint(player_name: str, db: Session = Depe
         raise HTTPException(status_code=500, detail=f"計算個人平均失敗: {str(e)}")
 
 @app.delete("/analyses/{analysis_id}")
-async def delete_analysis(analysis_id: int, db: Session = Depends(get_db)):
+async def delete_analysis(analysis_id: int, db = Depends(get_async_db)):
      try:
-         if not crud.delete_pitch_analysis(db, analysis_id):
+         if not await crud.delete_pitch_analysis_async(db, analysis_id):
              raise HTTPException(status_code=404, detail="分析紀錄未找到")
          logger.info(f"分析紀錄 ID: {analysis_id} 已成功刪除")
          return {"message": "分析紀錄已成功刪除"}
@@ -180,9 +321,9 @@ async def delete_analysis(analysis_id: int, db: Session = Depends(get_db)):
          raise HTTPException(status_code=500, detail=f"刪除分析紀錄失敗: {e}")
 
 @app.put("/analyses/{analysis_id}")
-async def update_analysis(analysis_id: int, updated_data: PitchAnalysisUpdate, db: Session = Depends(get_db)):
+async def update_analysis(analysis_id: int, updated_data: PitchAnalysisUpdate, db = Depends(get_async_db)):
      try:
-         analysis = crud.update_pitch_analysis(db, analysis_id, updated_data)
+         analysis = await crud.update_pitch_analysis_async(db, analysis_id, updated_data)
          if not analysis:
              raise HTTPException(status_code=404, detail="分析紀錄未找到")
          logger.info(f"分析紀錄 ID: {analysis_id} 已成功更新")
@@ -192,7 +333,8 @@ async def update_analysis(analysis_id: int, updated_data: PitchAnalysisUpdate, d
          raise HTTPException(status_code=500, detail=f"更新分析紀錄失敗: {e}")
 
 
+startup.mark_import_finished()
+
 if __name__ == "__main__":
-    import os
     port = int(os.environ.get("PORT", 8080)) # 建議使用一個新的埠號
     uvicorn.run("main:app", host="0.0.0.0", port=port)
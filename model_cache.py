@@ -0,0 +1,198 @@
+# 檔案: model_cache.py
+# 職責: PitchModel (比對標竿統計模型) 的行程內快取。
+#       模型幾乎不會變動，因此整張表載入記憶體成為一份「快照」，並預先序列化好 /models/ 的回應內容與 ETag；
+#       分析流程查詢模型時只讀記憶體，不再連線資料庫。
+#       快照以資料表浮水印 (筆數、最大 id、最後修改時間) 作為版本，背景定期檢查浮水印，有變化才重新載入；
+#       同一行程內修改模型後也可呼叫 invalidate() 立即重新載入。
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import crud
+from config import MODEL_CACHE_REFRESH_INTERVAL
+from database import PitchModel, new_async_session
+
+logger = logging.getLogger(__name__)
+
+# 建立一個字典來翻譯球種縮寫
+PITCH_TYPE_TRANSLATOR = {
+    "FS": "分指快速球 / 指叉球 (Splitter / Split-Finger Fastball)",
+    "FF": "四縫線快速球 (Four-Seam Fastball)",
+    "SL": "滑球 (Slider)",
+    "CU": "曲球 (Curveball)",
+    "CH": "變速球 (Changeup)",
+    "FO": "指叉球 (Forkball)",
+    "all": "通用"
+}
+
+
+class ModelSnapshot(NamedTuple):
+    version: Tuple                       # 載入時的資料表浮水印
+    models: Dict[str, SimpleNamespace]   # model_name -> 模型 (唯讀，呼叫端不可修改 profile_data)
+    models_json: bytes                   # /models/ 的完整回應內容
+    etag: str
+
+
+_snapshot: Optional[ModelSnapshot] = None
+_refresh_lock = threading.Lock()
+_refresher: Optional[asyncio.Task] = None
+
+
+def format_model_display_name(model_name: str) -> str:
+    """把 "姓, 名_球種縮寫_v1" 格式的模型名稱轉成前端顯示用的名稱。"""
+    parts = model_name.split('_')
+    # 預期格式為 "姓, 名_球種縮寫_v1" 或 "名字_姓氏_球種縮寫_v1"
+    if len(parts) >= 2:
+        player_name = parts[0].replace(",", ", ")
+        pitch_type_abbr = parts[1] if len(parts) > 1 else "all"
+        pitch_type_display = PITCH_TYPE_TRANSLATOR.get(pitch_type_abbr, pitch_type_abbr)
+        return f"{player_name} - {pitch_type_display}"
+    return model_name # 如果格式不符，使用原名
+
+
+def _watermark_statement():
+    """一次聚合查詢取得資料表浮水印；新增、刪除、修改任何一筆模型都會改變其中一個值。"""
+    return select(
+        func.count(PitchModel.id),
+        func.max(PitchModel.id),
+        func.max(func.coalesce(PitchModel.updated_at, PitchModel.created_at)),
+    )
+
+
+def _watermark_from_row(row) -> Tuple:
+    count, max_id, last_modified = row
+    return (count, max_id, last_modified.isoformat() if last_modified else None)
+
+
+def _read_watermark(db: Session) -> Tuple:
+    return _watermark_from_row(db.execute(_watermark_statement()).one())
+
+
+def _snapshot_from_rows(version: Tuple, rows) -> ModelSnapshot:
+    models = {}
+    formatted_models: List[Dict[str, Any]] = []
+    for row in rows:
+        models[row.model_name] = SimpleNamespace(
+            id=row.id,
+            model_name=row.model_name,
+            method=row.method,
+            profile_data=row.profile_data,
+            source_feature_count=row.source_feature_count,
+        )
+        formatted_models.append({
+            "model_name": row.model_name,                              # 後端比對時需要的原始名稱
+            "display_name": format_model_display_name(row.model_name), # 前端顯示用的乾淨名稱
+            "profile_data": row.profile_data                           # 完整的 profile_data 供前端快取使用
+        })
+
+    models_json = json.dumps(formatted_models, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = '"' + hashlib.sha1(models_json).hexdigest() + '"'
+    return ModelSnapshot(version=version, models=models, models_json=models_json, etag=etag)
+
+
+def _build_snapshot(db: Session) -> ModelSnapshot:
+    version = _read_watermark(db)
+    return _snapshot_from_rows(version, crud.get_all_pitch_models(db))
+
+
+def _install_snapshot(current: Optional[ModelSnapshot], snapshot: ModelSnapshot) -> ModelSnapshot:
+    global _snapshot
+    # 整份快照一次替換，讀取端不需要上鎖
+    _snapshot = snapshot
+    if current is None or snapshot.etag != current.etag:
+        logger.info(f"模型快取：已載入 {len(snapshot.models)} 個統計模型 (version={snapshot.version})")
+    return snapshot
+
+
+def refresh_if_changed(db: Session, force: bool = False) -> ModelSnapshot:
+    """浮水印與目前快照不同 (或 force) 時重新載入整張表，回傳最新的快照。"""
+    with _refresh_lock:
+        current = _snapshot
+        if current is not None and not force and _read_watermark(db) == current.version:
+            return current
+        return _install_snapshot(current, _build_snapshot(db))
+
+
+async def refresh_if_changed_async(db, force: bool = False) -> ModelSnapshot:
+    """
+    refresh_if_changed 的非同步版本 (db 為 AsyncSession)，查詢在事件迴圈上等待，不佔用執行緒。
+    不取得 _refresh_lock：同時重新載入只會得到內容相同的快照，後寫入的覆蓋先寫入的。
+    """
+    current = _snapshot
+    version = _watermark_from_row((await db.execute(_watermark_statement())).one())
+    if current is not None and not force and version == current.version:
+        return current
+    rows = await crud.get_all_pitch_models_async(db)
+    return _install_snapshot(current, _snapshot_from_rows(version, rows))
+
+
+def get_snapshot(db: Session) -> ModelSnapshot:
+    """回傳目前的快照；只有尚未載入 (或已失效) 時才會查詢資料庫。"""
+    snapshot = _snapshot
+    if snapshot is None:
+        snapshot = refresh_if_changed(db)
+    return snapshot
+
+
+async def get_snapshot_async(db) -> ModelSnapshot:
+    """get_snapshot 的非同步版本。"""
+    snapshot = _snapshot
+    if snapshot is None:
+        snapshot = await refresh_if_changed_async(db)
+    return snapshot
+
+
+def get_pitch_model(db: Session, model_name: str) -> Optional[SimpleNamespace]:
+    """crud.get_pitch_model_by_name 的快取版本。"""
+    return get_snapshot(db).models.get(model_name)
+
+
+async def get_pitch_model_async(db, model_name: str) -> Optional[SimpleNamespace]:
+    """crud.get_pitch_model_by_name_async 的快取版本。"""
+    return (await get_snapshot_async(db)).models.get(model_name)
+
+
+def invalidate() -> None:
+    """丟棄目前的快照，下一次查詢時重新載入。修改 PitchModel 的程式 (例如 backfill_kinematics) 完成後呼叫。"""
+    global _snapshot
+    with _refresh_lock:
+        _snapshot = None
+
+
+async def _refresh_with_session() -> None:
+    async with new_async_session() as db:
+        await refresh_if_changed_async(db)
+
+
+async def _refresh_loop() -> None:
+    while True:
+        try:
+            await _refresh_with_session()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 資料庫暫時無法連線時繼續使用舊快照
+            logger.error(f"模型快取：檢查更新失敗: {e}", exc_info=True)
+        await asyncio.sleep(MODEL_CACHE_REFRESH_INTERVAL)
+
+
+def start_model_cache_refresher() -> None:
+    """載入快照並啟動背景檢查，於 FastAPI 啟動時呼叫。"""
+    global _refresher
+    _refresher = asyncio.create_task(_refresh_loop())
+
+
+async def stop_model_cache_refresher() -> None:
+    global _refresher
+    if _refresher is not None:
+        _refresher.cancel()
+        await asyncio.gather(_refresher, return_exceptions=True)
+        _refresher = None
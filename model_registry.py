@@ -0,0 +1,346 @@
+# 檔案: model_registry.py
+# 職責: 機器學習模型 (目前為球路好壞球分類模型) 的登錄表。
+#       - 延遲載入：第一次使用 (或啟動時 preload) 才 joblib.load，之後同一行程共用
+#       - 版本化熱更新：單一檔案被替換時重新載入；模型來源為目錄時，每個檔案 (<版本>.pkl / <版本>.joblib) 是一個版本，
+#         目錄中的 CURRENT 檔指定使用的版本 (沒有時取檔名排序最後的版本)；
+#         每 MODEL_RELOAD_INTERVAL 秒 (於取用模型時) 檢查一次，有新版本就由一個請求載入，完成後一次替換，
+#         載入期間其他請求繼續使用舊版本；新版本載入失敗時保留舊版本
+#       - 記憶體對應 (MODEL_MMAP)：scikit-learn 的決策樹在反序列化時會把節點陣列複製到每個行程自己的記憶體，
+#         joblib 的 mmap_mode 對森林沒有效果。因此隨機森林 (RandomForest / ExtraTrees 分類器) 第一次載入時
+#         會被攤平成幾個 .npy 陣列 (所有樹的節點串接在一起，見 pack_forest) 存到 MODEL_PACK_DIR，
+#         之後每個行程 (API 行程與 spawn 出來的 CPU 行程池 worker) 都以 np.load(mmap_mode="r") 載入，
+#         以 NumPy 走訪樹 (PackedForest.predict_proba，結果與 scikit-learn 相同)，
+#         所有行程共用作業系統 page cache 中同一份權重，也不需要在 worker 中 import scikit-learn。
+#         其他模型仍以 joblib (mmap_mode="r") 載入
+#       - 每個模型記錄載入耗時、檔案大小與估計的記憶體用量；GET /ml-models/ 同時回報 API 行程與每個 worker
+
+import logging
+import os
+import pickle
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from config import BALL_MODEL_PATH, BALL_MODEL_DIR, MODEL_MMAP, MODEL_RELOAD_INTERVAL, MODEL_PACK_DIR, CPU_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE_EXTENSIONS = (".pkl", ".joblib")
+CURRENT_VERSION_FILE = "CURRENT"
+PACKED_FOREST_TYPES = ("RandomForestClassifier", "ExtraTreesClassifier")
+PACKED_ARRAYS = ("roots", "left", "right", "feature", "threshold", "missing_left", "proba", "classes")
+
+
+def pack_forest(model) -> Optional[Dict[str, np.ndarray]]:
+    """
+    把隨機森林分類器攤平成連續陣列：所有樹的節點串接在一起，子節點索引改成全域索引 (葉節點為 -1)，
+    proba 為每個節點正規化後的類別機率 (與 DecisionTreeClassifier.predict_proba 相同的計算)。
+    不是支援的模型時回傳 None。
+    """
+    if type(model).__name__ not in PACKED_FOREST_TYPES or getattr(model, "n_outputs_", 1) != 1:
+        return None
+    roots, lefts, rights, features, thresholds, missing_lefts, probas = [], [], [], [], [], [], []
+    offset = 0
+    for estimator in model.estimators_:
+        nodes = estimator.tree_.__getstate__()["nodes"]
+        value = estimator.tree_.value[:, 0, :len(model.classes_)]
+        normalizer = value.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0.0] = 1.0
+        roots.append(offset)
+        lefts.append(np.where(nodes["left_child"] == -1, -1, nodes["left_child"] + offset))
+        rights.append(np.where(nodes["right_child"] == -1, -1, nodes["right_child"] + offset))
+        features.append(nodes["feature"])
+        thresholds.append(nodes["threshold"])
+        missing_lefts.append(nodes["missing_go_to_left"] if "missing_go_to_left" in nodes.dtype.names
+                             else np.zeros(len(nodes), dtype=np.uint8))
+        probas.append(value / normalizer)
+        offset += len(nodes)
+    return {
+        "roots": np.asarray(roots, dtype=np.int64),
+        "left": np.concatenate(lefts).astype(np.int64),
+        "right": np.concatenate(rights).astype(np.int64),
+        "feature": np.concatenate(features).astype(np.int64),
+        "threshold": np.concatenate(thresholds).astype(np.float64),
+        "missing_left": np.concatenate(missing_lefts).astype(np.uint8),
+        "proba": np.ascontiguousarray(np.concatenate(probas), dtype=np.float64),
+        "classes": np.asarray(model.classes_),
+    }
+
+
+def save_packed_forest(directory: str, arrays: Dict[str, np.ndarray]) -> None:
+    """寫入暫存目錄後改名，多個行程同時寫入時只有一個生效，讀取端不會看到寫到一半的檔案。"""
+    parent = os.path.dirname(directory) or "."
+    os.makedirs(parent, exist_ok=True)
+    temp_directory = f"{directory}.tmp-{os.getpid()}-{threading.get_ident()}"
+    os.makedirs(temp_directory, exist_ok=True)
+    for name in PACKED_ARRAYS:
+        np.save(os.path.join(temp_directory, f"{name}.npy"), arrays[name], allow_pickle=False)
+    try:
+        os.rename(temp_directory, directory)
+    except OSError:
+        # 其他行程已經寫好了
+        shutil.rmtree(temp_directory, ignore_errors=True)
+        if not os.path.isdir(directory):
+            raise
+
+
+class PackedForest:
+    """以記憶體對應的陣列做隨機森林推論，predict_proba 的結果與 scikit-learn 相同。"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.roots = arrays["roots"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.missing_left = arrays["missing_left"]
+        self.proba = arrays["proba"]
+        self.classes_ = arrays["classes"]
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "PackedForest":
+        return cls({
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None, allow_pickle=False)
+            for name in PACKED_ARRAYS
+        })
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in PACKED_ARRAYS[:-1]) + self.classes_.nbytes
+
+    def predict_proba(self, X) -> np.ndarray:
+        # 與 scikit-learn 相同：輸入先轉成 float32 再與 float64 的門檻比較；NaN 依 missing_go_to_left 決定方向
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        while True:
+            left = self.left[nodes]
+            internal = left != -1
+            if not internal.any():
+                break
+            values = X[rows, np.where(internal, self.feature[nodes], 0)]
+            go_left = np.where(np.isnan(values), self.missing_left[nodes] == 1, values <= self.threshold[nodes])
+            nodes = np.where(internal, np.where(go_left, left, self.right[nodes]), nodes)
+
+        # 依樹的順序逐棵累加後平均 (與 scikit-learn 的累加順序相同，結果逐位元一致)
+        out = np.zeros((len(X), self.proba.shape[1]))
+        for tree in range(len(self.roots)):
+            out += self.proba[nodes[:, tree]]
+        out /= len(self.roots)
+        return out
+
+
+def _pack_directory(name: str, path: str) -> str:
+    # 以檔案大小與修改時間區分版本，模型檔被替換時會產生新的目錄
+    stat = os.stat(path)
+    base = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(MODEL_PACK_DIR, f"{name}-{base}-{stat.st_size}-{stat.st_mtime_ns}")
+
+
+class LoadedModel(NamedTuple):
+    name: str
+    version: str
+    path: str
+    model: Any
+    load_seconds: float
+    file_bytes: int
+    file_mtime: float
+    memory_bytes: int
+    loaded_at: datetime
+    backend: str          # packed (記憶體對應的攤平森林) 或 pickle
+
+
+def _estimate_memory_bytes(model) -> int:
+    """估計模型佔用的記憶體：樹模型加總每棵樹的節點與數值陣列，其他模型以序列化後的大小估計。"""
+    if isinstance(model, PackedForest):
+        return model.nbytes
+    estimators = getattr(model, "estimators_", None)
+    if estimators is None and hasattr(model, "tree_"):
+        estimators = [model]
+    if estimators is not None:
+        total = 0
+        for estimator in estimators:
+            state = estimator.tree_.__getstate__()
+            total += state["nodes"].nbytes + state["values"].nbytes
+        return total
+    return len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class _ModelSource:
+    """模型的來源：單一檔案 (版本為檔名) 或版本目錄。"""
+
+    def __init__(self, path: Optional[str] = None, directory: Optional[str] = None):
+        self.path = path
+        self.directory = directory
+
+    def resolve(self) -> Tuple[str, str]:
+        """回傳目前應使用的 (版本, 檔案路徑)。"""
+        if not self.directory:
+            return os.path.splitext(os.path.basename(self.path))[0], self.path
+
+        versions = {
+            os.path.splitext(entry)[0]: os.path.join(self.directory, entry)
+            for entry in os.listdir(self.directory)
+            if entry.endswith(MODEL_FILE_EXTENSIONS)
+        }
+        current_file = os.path.join(self.directory, CURRENT_VERSION_FILE)
+        if os.path.exists(current_file):
+            with open(current_file, "r", encoding="utf-8") as f:
+                version = f.read().strip()
+            if version not in versions:
+                raise FileNotFoundError(f"{current_file} 指定的模型版本 {version} 不存在")
+        elif versions:
+            version = max(versions)
+        else:
+            raise FileNotFoundError(f"模型目錄 {self.directory} 中沒有任何模型檔")
+        return version, versions[version]
+
+
+class ModelRegistry:
+    def __init__(self, mmap: bool = True, reload_interval: float = 60):
+        self.mmap = mmap
+        self.reload_interval = reload_interval
+        self._sources: Dict[str, _ModelSource] = {}
+        self._models: Dict[str, LoadedModel] = {}
+        self._last_checked: Dict[str, float] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+
+    def register(self, name: str, path: Optional[str] = None, directory: Optional[str] = None) -> None:
+        """登錄模型來源 (不會立即載入)。directory 有值時優先使用版本目錄。"""
+        self._sources[name] = _ModelSource(path, directory)
+        self._locks[name] = threading.Lock()
+
+    def _load_model(self, name: str, path: str) -> Tuple[Any, str]:
+        if self.mmap:
+            pack_directory = _pack_directory(name, path)
+            if os.path.isdir(pack_directory):
+                return PackedForest.load(pack_directory), "packed"
+        # joblib (連同反序列化時的 scikit-learn) 只在需要時才 import，不拖慢服務啟動
+        import joblib
+        model = joblib.load(path, mmap_mode="r" if self.mmap else None)
+        if self.mmap:
+            arrays = pack_forest(model)
+            if arrays is not None:
+                save_packed_forest(pack_directory, arrays)
+                return PackedForest.load(pack_directory), "packed"
+        return model, "pickle"
+
+    def _load(self, name: str, version: str, path: str) -> LoadedModel:
+        started = time.perf_counter()
+        model, backend = self._load_model(name, path)
+        load_seconds = time.perf_counter() - started
+        entry = LoadedModel(
+            name=name,
+            version=version,
+            path=path,
+            model=model,
+            load_seconds=round(load_seconds, 4),
+            file_bytes=os.path.getsize(path),
+            file_mtime=os.path.getmtime(path),
+            memory_bytes=_estimate_memory_bytes(model),
+            loaded_at=datetime.now(timezone.utc),
+            backend=backend,
+        )
+        logger.info(f"模型登錄表：已載入 {name} 版本 {version} ({backend}，{entry.load_seconds} 秒，"
+                    f"約 {entry.memory_bytes / 1e6:.1f} MB)")
+        return entry
+
+    def reload(self, name: str, force: bool = False) -> LoadedModel:
+        """
+        重新解析版本，版本改變 (或 force) 時載入並替換。由同時呼叫者中的一個執行，
+        其他呼叫者不等待、直接取得舊版本；還沒有任何版本時才等待載入完成。
+        """
+        lock = self._locks[name]
+        current = self._models.get(name)
+        if not lock.acquire(blocking=current is None):
+            return current
+        try:
+            current = self._models.get(name)
+            self._last_checked[name] = time.monotonic()
+            version, path = self._sources[name].resolve()
+            # 同一個路徑的檔案被替換 (os.replace) 時修改時間會改變，同樣視為新版本
+            if (current is not None and not force and current.version == version and current.path == path
+                    and current.file_mtime == os.path.getmtime(path)):
+                return current
+            entry = self._load(name, version, path)
+            # 整個 LoadedModel 一次替換，讀取端不需要上鎖
+            self._models[name] = entry
+            return entry
+        except Exception as e:
+            if current is None:
+                raise
+            # 新版本載入失敗時繼續使用舊版本
+            logger.error(f"模型登錄表：重新載入 {name} 失敗，繼續使用版本 {current.version}: {e}", exc_info=True)
+            return current
+        finally:
+            lock.release()
+
+    def entry(self, name: str) -> LoadedModel:
+        """回傳目前的模型；尚未載入時載入，超過 reload_interval 秒沒有檢查時順便檢查新版本。"""
+        current = self._models.get(name)
+        if current is None:
+            return self.reload(name)
+        if self.reload_interval > 0 and time.monotonic() - self._last_checked.get(name, 0) >= self.reload_interval:
+            return self.reload(name)
+        return current
+
+    def get(self, name: str) -> Any:
+        return self.entry(name).model
+
+    def preload(self) -> None:
+        """載入所有登錄的模型 (啟動時呼叫)。"""
+        for name in self._sources:
+            self.entry(name)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """每個登錄模型的版本、載入耗時與記憶體用量；尚未載入的模型只列出名稱。"""
+        result = []
+        for name in self._sources:
+            entry = self._models.get(name)
+            if entry is None:
+                result.append({"name": name, "loaded": False})
+                continue
+            result.append({
+                "name": name,
+                "loaded": True,
+                "version": entry.version,
+                "path": entry.path,
+                "load_seconds": entry.load_seconds,
+                "file_bytes": entry.file_bytes,
+                "memory_bytes": entry.memory_bytes,
+                "mmap": self.mmap,
+                "backend": entry.backend,
+                "loaded_at": entry.loaded_at.isoformat(),
+            })
+        return result
+
+
+def process_model_stats() -> Dict[str, Any]:
+    """本行程的模型狀態 (給行程池的 worker 回報用)。"""
+    return {"pid": os.getpid(), "models": registry.stats()}
+
+
+async def collect_model_stats() -> Dict[str, Any]:
+    """
+    API 行程與行程池 worker 各自的模型狀態。同時送出 CPU_POOL_SIZE 個查詢，
+    回應來自哪些 worker 由行程池決定，因此以 pid 去除重複 (可能少於 worker 數)。
+    """
+    from executors import run_cpu
+    import asyncio
+    replies = await asyncio.gather(*(run_cpu(process_model_stats) for _ in range(max(CPU_POOL_SIZE, 1))),
+                                   return_exceptions=True)
+    workers = {}
+    for reply in replies:
+        if isinstance(reply, Exception):
+            logger.warning(f"模型登錄表：取得 worker 模型狀態失敗: {reply}")
+        elif reply["pid"] != os.getpid():
+            workers[reply["pid"]] = reply
+    return {"api": process_model_stats(), "workers": list(workers.values())}
+
+
+registry = ModelRegistry(mmap=MODEL_MMAP, reload_interval=MODEL_RELOAD_INTERVAL)
+registry.register("ball_quality", path=BALL_MODEL_PATH, directory=BALL_MODEL_DIR or None)
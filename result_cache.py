@@ -0,0 +1,129 @@
+# 檔案: result_cache.py
+# 職責: 以影片內容 SHA-256 為鍵的分析結果快取。
+#       第一層為本機磁碟 (JSON 檔，以檔案修改時間做 LRU)，第二層為資料庫 analysis_cache 資料表。
+#       快取內容只包含與比對標竿無關的結果 (骨架、球路、特徵、球速、好球機率、GCS 網址)，
+#       重新上傳同一支影片時只需要重算 pose_score。
+
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+import crud
+from config import RESULT_CACHE_ENABLED, RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MAX_ROWS
+
+logger = logging.getLogger(__name__)
+
+_eviction_lock = threading.Lock()
+
+
+def _cache_path(video_hash: str) -> str:
+    return os.path.join(RESULT_CACHE_DIR, f"{video_hash}.json")
+
+
+def _read_disk(video_hash: str) -> Optional[Dict[str, Any]]:
+    path = _cache_path(video_hash)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"快取檔案損毀，忽略: {path} ({e})")
+        return None
+    # 更新修改時間，作為 LRU 的「最近使用」標記；檔案剛好被淘汰或無權限時不影響這次讀取
+    try:
+        os.utime(path, None)
+    except OSError as e:
+        logger.warning(f"更新快取檔案時間失敗: {path} ({e})")
+    return payload
+
+
+def _write_disk(video_hash: str, payload: Dict[str, Any]) -> None:
+    os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+    path = _cache_path(video_hash)
+    # 暫存檔名由 tempfile 產生，多個行程 / 執行緒同時寫入同一支影片也不會共用暫存檔；
+    # 副檔名不是 .json，淘汰時不會被計入
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=RESULT_CACHE_DIR,
+                                     prefix=f"{video_hash}.", suffix=".tmp", delete=False) as f:
+        temp_path = f.name
+        try:
+            json.dump(payload, f, ensure_ascii=False)
+        except BaseException:
+            f.close()
+            os.remove(temp_path)
+            raise
+    try:
+        os.replace(temp_path, path)
+    except OSError:
+        os.remove(temp_path)
+        raise
+    _evict_disk()
+
+
+def _evict_disk() -> None:
+    """磁碟層超過 RESULT_CACHE_MAX_BYTES 時，從最久未使用的檔案開始刪除。"""
+    with _eviction_lock:
+        entries = []
+        total_bytes = 0
+        for entry in os.scandir(RESULT_CACHE_DIR):
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_bytes += stat.st_size
+        if total_bytes <= RESULT_CACHE_MAX_BYTES:
+            return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_bytes -= size
+            if total_bytes <= RESULT_CACHE_MAX_BYTES:
+                break
+
+
+def load_cached_result(db: Session, video_hash: str) -> Optional[Dict[str, Any]]:
+    """
+    依序查詢磁碟層與資料庫層，資料庫命中時回填磁碟層。
+    找不到或快取停用時回傳 None。
+    """
+    if not RESULT_CACHE_ENABLED:
+        return None
+
+    payload = _read_disk(video_hash)
+    if payload is not None:
+        return payload
+
+    try:
+        payload = crud.get_analysis_cache(db, video_hash)
+    except Exception as e:
+        logger.warning(f"讀取資料庫快取失敗: {e}", exc_info=True)
+        db.rollback()
+        return None
+    if payload is not None:
+        try:
+            _write_disk(video_hash, payload)
+        except Exception as e:
+            # 回填磁碟層失敗 (磁碟滿、無權限) 不影響這次讀取
+            logger.warning(f"回填磁碟快取失敗: {e}", exc_info=True)
+    return payload
+
+
+def store_cached_result(db: Session, video_hash: str, payload: Dict[str, Any]) -> None:
+    """寫入兩層快取。快取失敗不影響分析流程，只記錄警告。"""
+    if not RESULT_CACHE_ENABLED:
+        return
+    try:
+        _write_disk(video_hash, payload)
+    except Exception as e:
+        logger.warning(f"寫入磁碟快取失敗: {e}", exc_info=True)
+    try:
+        crud.upsert_analysis_cache(db, video_hash, payload, max_rows=RESULT_CACHE_MAX_ROWS)
+    except Exception as e:
+        logger.warning(f"寫入資料庫快取失敗: {e}", exc_info=True)
+        db.rollback()
@@ -0,0 +1,197 @@
+# 檔案: running_stats.py
+# 職責: 串流統計。逐筆加入數值即可得到平均、標準差 (Welford) 與近似百分位數 (t-digest)，
+#       不需要保留所有歷史數值；狀態可序列化成 dict 存入資料庫的 JSON 欄位。
+
+import math
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class TDigest:
+    """
+    Merging t-digest 百分位數草圖 (k1 scale function)。
+    樣本數少 (約 30 筆以內) 時每筆數值都是獨立的 centroid，結果與 np.percentile 相同；
+    樣本數多時以有限數量的 centroid 近似，兩端 (p10 / p90) 的精度最高。
+    """
+
+    def __init__(self, compression: float = 100, buffer_size: int = 500):
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.means: List[float] = []
+        self.weights: List[float] = []
+        self._buffer: List[float] = []
+
+    @property
+    def count(self) -> float:
+        return sum(self.weights) + len(self._buffer)
+
+    def add(self, value: float) -> None:
+        self._buffer.append(float(value))
+        if len(self._buffer) >= self.buffer_size:
+            self._compress()
+
+    def merge(self, other: "TDigest") -> None:
+        other._compress()
+        self._compress(other.means, other.weights)
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _k_inverse(self, k: float) -> float:
+        return (math.sin(min(k * 2 * math.pi / self.compression, math.pi / 2)) + 1) / 2
+
+    def _compress(self, extra_means: Iterable[float] = (), extra_weights: Iterable[float] = ()) -> None:
+        means = np.concatenate([self.means, self._buffer, list(extra_means)])
+        weights = np.concatenate([self.weights, np.ones(len(self._buffer)), list(extra_weights)])
+        self._buffer = []
+        if len(means) == 0:
+            return
+
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+
+        merged_means, merged_weights = [], []
+        cur_mean, cur_weight = means[0], weights[0]
+        weight_so_far = 0.0
+        q_limit = total * self._k_inverse(self._k(0.0) + 1)
+        for mean, weight in zip(means[1:], weights[1:]):
+            if weight_so_far + cur_weight + weight <= q_limit:
+                cur_weight += weight
+                cur_mean += (mean - cur_mean) * weight / cur_weight
+            else:
+                merged_means.append(float(cur_mean))
+                merged_weights.append(float(cur_weight))
+                weight_so_far += cur_weight
+                q_limit = total * self._k_inverse(self._k(weight_so_far / total) + 1)
+                cur_mean, cur_weight = mean, weight
+        merged_means.append(float(cur_mean))
+        merged_weights.append(float(cur_weight))
+
+        self.means, self.weights = merged_means, merged_weights
+
+    def quantile(self, q: float) -> Optional[float]:
+        """回傳第 q (0~1) 分位數的近似值，內插方式與 np.percentile 的 linear 相同。"""
+        self._compress()
+        if not self.weights:
+            return None
+        weights = np.asarray(self.weights)
+        # 每個 centroid 的「中心位置」(以排序後的索引表示)
+        centers = np.cumsum(weights) - weights + (weights - 1) / 2
+        target = q * (weights.sum() - 1)
+        return float(np.interp(target, centers, self.means))
+
+    def to_state(self) -> Dict:
+        self._compress()
+        return {"compression": self.compression, "means": self.means, "weights": self.weights}
+
+    @classmethod
+    def from_state(cls, state: Dict) -> "TDigest":
+        digest = cls(compression=state.get("compression", 100))
+        digest.means = list(state.get("means", []))
+        digest.weights = list(state.get("weights", []))
+        return digest
+
+
+class RunningStats:
+    """單一特徵的串流統計：Welford 平均 / 變異數、最小值、最大值與 t-digest 百分位數。"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.digest = TDigest()
+
+    def add(self, value: float) -> None:
+        value = float(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.digest.add(value)
+
+    def merge(self, other: "RunningStats") -> None:
+        """合併另一份統計 (平行計算的部分結果)，使用 Chan 等人的合併公式。"""
+        if other.count == 0:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.digest.merge(other.digest)
+
+    @property
+    def std(self) -> float:
+        # 母體標準差，與 np.std 預設 (ddof=0) 相同
+        return math.sqrt(self.m2 / self.count) if self.count else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        """輸出與 PitchModel.profile_data 相同格式的統計值。"""
+        return {
+            "mean": self.mean,
+            "std": self.std,
+            "min": self.min,
+            "max": self.max,
+            "p10": self.digest.quantile(0.10),
+            "p50_median": self.digest.quantile(0.50),
+            "p90": self.digest.quantile(0.90),
+        }
+
+    def to_state(self) -> Dict:
+        return {"count": self.count, "mean": self.mean, "m2": self.m2,
+                "min": self.min, "max": self.max, "digest": self.digest.to_state()}
+
+    @classmethod
+    def from_state(cls, state: Dict) -> "RunningStats":
+        stats = cls()
+        stats.count = state["count"]
+        stats.mean = state["mean"]
+        stats.m2 = state["m2"]
+        stats.min = state["min"]
+        stats.max = state["max"]
+        stats.digest = TDigest.from_state(state["digest"])
+        return stats
+
+
+class FeatureProfileAccumulator:
+    """
+    多個生物力學特徵的串流統計，輸出格式與 crud.calculate_user_average_profile 的 profile_data 相同
+    (特徵名稱轉小寫；只統計數值型的特徵)。
+    """
+
+    def __init__(self):
+        self.features: Dict[str, RunningStats] = {}
+        self.sample_count = 0
+
+    def update(self, features: Dict) -> None:
+        self.sample_count += 1
+        for key, value in features.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and not math.isnan(value):
+                self.features.setdefault(key.lower(), RunningStats()).add(value)
+
+    def merge(self, other: "FeatureProfileAccumulator") -> None:
+        self.sample_count += other.sample_count
+        for key, stats in other.features.items():
+            self.features.setdefault(key, RunningStats()).merge(stats)
+
+    def profile_data(self) -> Dict[str, Dict[str, float]]:
+        return {key: stats.summary() for key, stats in self.features.items()}
+
+    def to_state(self) -> Dict:
+        return {"sample_count": self.sample_count,
+                "features": {key: stats.to_state() for key, stats in self.features.items()}}
+
+    @classmethod
+    def from_state(cls, state: Dict) -> "FeatureProfileAccumulator":
+        accumulator = cls()
+        accumulator.sample_count = state.get("sample_count", 0)
+        accumulator.features = {key: RunningStats.from_state(s) for key, s in state.get("features", {}).items()}
+        return accumulator
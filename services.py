@@ -1,24 +1,62 @@
 import os
-import shutil
-import httpx
+import hashlib
+import uuid
 import asyncio
-import joblib
 import logging
 from datetime import datetime, timezone
 from sqlalchemy.orm import Session
-from config import GCS_BUCKET_NAME, POSE_API_URL, BALL_API_URL
-from gcs_utils import upload_video_to_gcs
-from Drawingfunction import render_video_with_pose_and_max_ball_speed, save_specific_frames
-from KinematicsModule import extract_pitching_biomechanics
-from PoseClassification import calculate_score_from_comparison
-from BallClassification import classify_ball_quality
-from typing import Dict, Optional, Tuple
+from config import (POSE_API_URL, BALL_API_URL, SPOOL_CHUNK_SIZE, KEYFRAME_JPEG_QUALITY, KEYFRAME_WEBP_ENABLED,
+                    KEYFRAME_WEBP_QUALITY, KEYFRAME_THUMBNAIL_WIDTH, VIDEO_ENCODER, FFMPEG_BINARY, VIDEO_ENCODER_PRESET,
+                    VIDEO_ENCODER_CRF, VIDEO_FASTSTART, RENDER_SCALE_WIDTH, RENDER_FPS_DIVISOR, ANNOTATION_FORMAT,
+                    BALL_PIXEL_TO_METER, BALL_MIN_VALID_SPEED_KMH, BALL_MAX_VALID_SPEED_KMH,
+                    BALL_SPEED_OUTLIER_REJECTION, BALL_SPEED_OUTLIER_THRESHOLD, PIXEL_CALIBRATION_MODE,
+                    DEFAULT_PITCHER_HEIGHT_CM, CALIBRATION_KPT_THR, CALIBRATION_MIN_FRAMES)
+from http_clients import get_http_client
+from gcs_utils import upload_files, upload_buffers
+from PixelCalibration import estimate_pixel_to_meter_from_pose
+from PoseClassification import compile_profiles, calculate_scores
+from BallClassification import predict_ball_quality
+from executors import run_io, run_cpu
+from startup import lazy_import
+from result_cache import load_cached_result, store_cached_result
+from typing import Awaitable, Callable, Dict, Optional, Tuple
 import crud
+import model_cache
+from database import new_async_session
+import calibration_cache
+
+# 影像處理相關模組 (連同 cv2) 在第一次分析影片時才 import，或由啟動後的背景預熱 (startup.py) 先載入
+Drawingfunction = lazy_import("Drawingfunction")
+AnnotationTrack = lazy_import("AnnotationTrack")
+BallSpeed = lazy_import("BallSpeed")
+VideoEncoder = lazy_import("VideoEncoder")
+KinematicsModule = lazy_import("KinematicsModule")
 logger = logging.getLogger(__name__)
-API_TIMEOUT = 300
 
-# 載入球路預測模型 用來分類好壞球
-ball_prediction_model = joblib.load('random_forest_model.pkl')
+def render_encoder_options():
+    """渲染影片的編碼設定 (見 VideoEncoder.py)。"""
+    return VideoEncoder.EncoderOptions(
+        preset=VIDEO_ENCODER_PRESET,
+        crf=VIDEO_ENCODER_CRF,
+        scale_width=RENDER_SCALE_WIDTH,
+        fps_divisor=RENDER_FPS_DIVISOR,
+        faststart=VIDEO_FASTSTART
+    )
+
+# 球速的換算比例與合理範圍：球速估算與渲染影片 / 標註軌上顯示的數字使用同一組設定
+# (pixel_to_meter 為沒有校正結果時的預設值，見 resolve_calibration)
+BALL_SPEED_RANGE = {
+    "pixel_to_meter": BALL_PIXEL_TO_METER,
+    "min_valid_speed_kmh": BALL_MIN_VALID_SPEED_KMH,
+    "max_valid_speed_kmh": BALL_MAX_VALID_SPEED_KMH,
+}
+
+# 進度回報函式：接收 (階段名稱, 0~1 的進度)，給非同步任務模式更新任務狀態用
+ProgressCallback = Optional[Callable[[str, float], Awaitable[None]]]
+
+async def _report_progress(progress: ProgressCallback, stage: str, fraction: float) -> None:
+    if progress is not None:
+        await progress(stage, fraction)
 
 # 取得比較模型 輸入資料庫 比較對象 球路 返回比較標準模型
 def get_comparison_model(db: Session, benchmark_player_name: str, detected_pitch_type: str):
@@ -26,38 +64,259 @@ def get_comparison_model(db: Session, benchmark_player_name: str, detected_pitch
     if detected_pitch_type and detected_pitch_type != "Unknown":
         ideal_model_name = f"{benchmark_player_name}_{detected_pitch_type}_v1"
         logger.info(f"服務層：正在嘗試載入球種專屬模型: {ideal_model_name}")
-        profile_model = crud.get_pitch_model_by_name(db, model_name=ideal_model_name)
+        profile_model = model_cache.get_pitch_model(db, model_name=ideal_model_name)
         if profile_model:
             return profile_model
 
     fallback_model_name = f"{benchmark_player_name}_all_v1"
     logger.warning(f"找不到或未指定專屬模型，嘗試載入通用模型: {fallback_model_name}")
-    profile_model = crud.get_pitch_model_by_name(db, model_name=fallback_model_name)
+    profile_model = model_cache.get_pitch_model(db, model_name=fallback_model_name)
     return profile_model
 
 # 分析生物力學特徵函數 輸入影片 返回 運動力學特徵 骨架
-async def analyze_video_kinematics(video_bytes: bytes, filename: str) -> Tuple[Dict, Dict]:
+async def analyze_video_kinematics(video_path: str, filename: str) -> Tuple[Dict, Dict]:
     logger.info("服務層：(子任務) 正在呼叫 POSE API...")
-    async with httpx.AsyncClient(timeout=API_TIMEOUT) as client:
-        files = {"file": (filename, video_bytes, "video/mp4")}
+    client = get_http_client("pose")
+    # 傳入檔案物件，httpx 會分塊讀取並串流 multipart 內容，不會把整支影片讀進記憶體
+    with open(video_path, "rb") as video_stream:
+        files = {"file": (filename, video_stream, "video/mp4")}
         response = await client.post(POSE_API_URL, files=files)
-        response.raise_for_status()
-        pose_data = response.json()
+    response.raise_for_status()
+    pose_data = response.json()
     logger.info("服務層：(子任務) 正在計算生物力學特徵...")
-    biomechanics_features = extract_pitching_biomechanics(pose_data)
+    biomechanics_features = await run_cpu(KinematicsModule.extract_pitching_biomechanics, pose_data)
     return biomechanics_features, pose_data
     
 # 棒球軌跡分析函數 輸入影片輸出球路軌跡
-async def analyze_ball_flight(video_bytes: bytes, filename: str) -> Dict:
+async def analyze_ball_flight(video_path: str, filename: str) -> Dict:
     """
-    呼叫 Ball API 以獲取球路相關數據。
+    呼叫 Ball API 以獲取球路相關數據 (以檔案串流上傳影片)。
     """
     logger.info("服務層：(子任務) 正在呼叫 BALL API...")
-    async with httpx.AsyncClient(timeout=API_TIMEOUT) as client:
-        files = {"file": (filename, video_bytes, "video/mp4")}
+    client = get_http_client("ball")
+    with open(video_path, "rb") as video_stream:
+        files = {"file": (filename, video_stream, "video/mp4")}
         response = await client.post(BALL_API_URL, files=files)
-        response.raise_for_status()
-        return response.json()
+    response.raise_for_status()
+    return response.json()
+
+# 決定本次分析的 pixel_to_meter，回傳 {"pixel_to_meter", "source", ...}
+# 順序：同一個 camera session 已校正過 (source="session") -> 由骨架估算 (source="pose"，需等 POSE API)
+#       -> 骨架不足以估算或關閉自動校正時使用設定檔的固定值 (source="fixed")
+async def resolve_calibration(db, camera_session_id: Optional[str], height_cm: Optional[float],
+                              kinematics: Awaitable[Tuple[Dict, Dict]]) -> Dict:
+    fixed = {"pixel_to_meter": BALL_PIXEL_TO_METER, "source": "fixed"}
+    if PIXEL_CALIBRATION_MODE != "auto":
+        return fixed
+    if db is not None and camera_session_id:
+        cached = await run_io(calibration_cache.get_calibration, db, camera_session_id)
+        if cached is not None:
+            return {**cached, "source": "session"}
+
+    _, pose_data = await kinematics
+    result = await run_cpu(
+        estimate_pixel_to_meter_from_pose,
+        pose_data,
+        height_cm or DEFAULT_PITCHER_HEIGHT_CM,
+        kpt_thr=CALIBRATION_KPT_THR,
+        min_frames=CALIBRATION_MIN_FRAMES
+    )
+    if result is None:
+        logger.warning("服務層：骨架關節點不足以估算 pixel_to_meter，改用預設值。")
+        return fixed
+    if db is not None and camera_session_id:
+        await run_io(calibration_cache.store_calibration, db, camera_session_id, result)
+    return {**result.to_dict(), "source": "pose"}
+
+# 球路分析 + 球速估算：BALL API 一回傳就計算球速，不必等影片渲染
+# (calibration 已有 session 快取時也不必等 POSE API；沒有傳入時使用預設的 pixel_to_meter)
+async def analyze_ball_flight_and_speed(video_path: str, filename: str,
+                                        calibration: Optional[Awaitable[Dict]] = None) -> Tuple[Dict, "BallSpeed.BallSpeedEstimate"]:
+    ball_data = await analyze_ball_flight(video_path, filename)
+    pixel_to_meter = (await calibration)["pixel_to_meter"] if calibration is not None else BALL_PIXEL_TO_METER
+    ball_speed = await run_io(
+        BallSpeed.estimate_ball_speed_for_video,
+        video_path,
+        ball_data,
+        outlier_rejection=BALL_SPEED_OUTLIER_REJECTION,
+        outlier_threshold=BALL_SPEED_OUTLIER_THRESHOLD,
+        **{**BALL_SPEED_RANGE, "pixel_to_meter": pixel_to_meter}
+    )
+    logger.info(f"服務層：(子任務) 球速估算完成，最大球速 {ball_speed.max_speed_kmh} km/h")
+    return ball_data, ball_speed
+
+# 以下為在 IO 執行緒池中執行的小工具
+def _spool_upload(source_file, destination_path: str) -> str:
+    """把上傳的影片分塊寫入磁碟，同時計算內容的 SHA-256 (作為結果快取的鍵)。"""
+    digest = hashlib.sha256()
+    with open(destination_path, "wb") as buffer:
+        while True:
+            chunk = source_file.read(SPOOL_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            buffer.write(chunk)
+    return digest.hexdigest()
+
+def _remove_files(paths) -> None:
+    try:
+        for path in paths:
+            if path and os.path.exists(path):
+                os.remove(path)
+    except Exception as e:
+        logger.warning(f"刪除暫存影片失敗: {e}", exc_info=True)
+
+# 影片本身的分析 (與比對標竿無關，結果可依影片內容快取)
+# 輸入暫存影片路徑 返回 骨架 球路 特徵 球速 好球機率 以及 GCS 網址
+# render_mode="video" 時輸出畫上骨架與棒球框的渲染影片；
+# render_mode="overlay" 時不重新編碼，上傳原始影片與標註軌 (AnnotationTrack.py)，由前端自行疊加
+async def analyze_video_content(temp_video_path: str, filename: str, video_hash: str, progress: ProgressCallback = None,
+                                render_mode: str = "video", db=None, camera_session_id: Optional[str] = None,
+                                height_cm: Optional[float] = None) -> Dict:
+    # 步驟 2: 並行呼叫 API 分析骨架跟球路，骨架回來後估算 pixel_to_meter (同一個 camera session 直接沿用)
+    await _report_progress(progress, "inference", 0.1)
+    kinematics_task = asyncio.ensure_future(analyze_video_kinematics(temp_video_path, filename))
+    calibration_task = asyncio.ensure_future(resolve_calibration(db, camera_session_id, height_cm, kinematics_task))
+    ball_task = asyncio.ensure_future(analyze_ball_flight_and_speed(temp_video_path, filename, calibration_task))
+    try:
+        (kinematics_results, (ball_data, ball_speed)) = await asyncio.gather(kinematics_task, ball_task)
+    finally:
+        # gather 在其中一個子任務失敗 (或本請求被取消) 時不會取消其他子任務，在這裡一併取消，避免背景繼續呼叫 API
+        for task in (kinematics_task, calibration_task, ball_task):
+            if not task.done():
+                task.cancel()
+    calibration = calibration_task.result()
+    max_speed_kmh = ball_speed.max_speed_kmh
+
+    # 從kinematics_results拿出骨架資料跟運動力學特徵
+    biomechanics_features, pose_data = kinematics_results
+
+    # 渲染影片 (或產生標註軌) 並擷取關鍵影格 (影片只解碼一次)，同時計算投球分數
+    # 球速已在上面算好 (包含離群值剔除)，渲染與標註軌直接使用同一份結果，只負責把數字畫上去
+    await _report_progress(progress, "rendering", 0.4)
+    frame_indices = {
+        "release": biomechanics_features.get("release_frame"),
+        "landing": biomechanics_features.get("landing_frame"),
+        "shoulder": biomechanics_features.get("shoulder_frame")
+        }
+    key_frame_options = {
+        "jpeg_quality": KEYFRAME_JPEG_QUALITY,
+        "webp_quality": KEYFRAME_WEBP_QUALITY if KEYFRAME_WEBP_ENABLED else None,
+        "thumbnail_width": KEYFRAME_THUMBNAIL_WIDTH,
+    }
+    buffer_uploads = {}
+    try:
+        if render_mode == "overlay":
+            (ball_score, (track, track_extension, track_content_type, _, encoded_frames)) = await asyncio.gather(
+                run_cpu(predict_ball_quality, ball_data),
+                run_cpu(
+                    AnnotationTrack.build_overlay_outputs,
+                    input_video_path=temp_video_path,
+                    pose_json=pose_data,
+                    ball_json=ball_data,
+                    frame_indices=frame_indices,
+                    track_format=ANNOTATION_FORMAT,
+                    ball_speed=ball_speed,
+                    **key_frame_options
+                )
+            )
+            # 原始影片不經處理直接上傳 (呼叫端結束後才會刪除暫存影片)
+            video_upload = (temp_video_path, f"videos/{video_hash[:12]}_{os.path.basename(filename)}")
+            buffer_uploads[("annotation", None)] = (
+                track, f"annotations/{video_hash[:12]}.{track_extension}", track_content_type
+            )
+            local_files = []
+        else:
+            (ball_score, (rendered_video_local_path, _, encoded_frames)) = await asyncio.gather(
+                run_cpu(predict_ball_quality, ball_data),
+                run_cpu(
+                    Drawingfunction.render_video_and_key_frames,
+                    input_video_path=temp_video_path,
+                    pose_json=pose_data,
+                    ball_json=ball_data,
+                    frame_indices=frame_indices,
+                    encoder=VIDEO_ENCODER,
+                    encoder_options=render_encoder_options(),
+                    ffmpeg_binary=FFMPEG_BINARY,
+                    ball_speed=ball_speed,
+                    **key_frame_options
+                )
+            )
+            video_upload = (rendered_video_local_path, f"render_videos/rendered_{video_hash[:12]}_{os.path.basename(filename)}")
+            local_files = [rendered_video_local_path]
+    except Exception as e:
+        logger.error(f"影片渲染失敗: {e}", exc_info=True)
+        raise e
+
+    # 上傳至 GCS：影片、關鍵影格 (與標註軌) 同時上傳；關鍵影格直接從記憶體上傳，物件名稱以影片雜湊區分
+    await _report_progress(progress, "uploading", 0.7)
+    for name, variants in encoded_frames.items():
+        for variant, image in variants.items():
+            suffix = "" if variant in ("jpeg", "webp") else f"_{variant}"
+            blob_name = f"key_frames/{video_hash[:12]}_{name}{suffix}.{image.extension}"
+            buffer_uploads[(name, variant)] = (image.data, blob_name, image.content_type)
+    try:
+        uploaded_video_urls, uploaded_buffer_urls = await asyncio.gather(
+            upload_files({"output_video_url": video_upload}),
+            upload_buffers(buffer_uploads)
+        )
+    except Exception as e:
+        logger.error(f"GCS 上傳失敗: {e}", exc_info=True)
+        raise e
+    finally:
+        # 清理本地臨時檔案
+        await run_io(_remove_files, local_files)
+
+    # JPEG 為主要網址 (沿用原本的欄位)，其他版本放在 keyframe_variant_urls，例如 {"release": {"webp": url}}
+    keyframe_variant_urls = {}
+    for (name, variant), url in uploaded_buffer_urls.items():
+        if variant not in (None, "jpeg"):
+            keyframe_variant_urls.setdefault(name, {})[variant] = url
+
+    return {
+        "pose_data": pose_data,
+        "ball_data": ball_data,
+        "biomechanics_features": biomechanics_features,
+        "max_speed_kmh": max_speed_kmh,
+        "ball_speed": ball_speed.to_dict(),
+        "calibration": calibration,
+        "ball_score": ball_score,
+        "output_video_url": uploaded_video_urls["output_video_url"],
+        "release_frame_url": uploaded_buffer_urls.get(("release", "jpeg")),
+        "landing_frame_url": uploaded_buffer_urls.get(("landing", "jpeg")),
+        "shoulder_frame_url": uploaded_buffer_urls.get(("shoulder", "jpeg")),
+        "keyframe_variant_urls": keyframe_variant_urls,
+        "annotation_url": uploaded_buffer_urls.get(("annotation", None)),
+    }
+
+# 結果快取的鍵：預設設定 (渲染影片、沒有 camera session 與身高) 沿用影片雜湊，
+# 其他組合會影響上傳內容或球速，另外雜湊一次 (維持 64 字元)
+def _result_cache_key(video_hash: str, render_mode: str, camera_session_id: Optional[str] = None,
+                      height_cm: Optional[float] = None) -> str:
+    variant = [render_mode] if render_mode != "video" else []
+    # 校正方式會改變球速，auto 的結果不能與 fixed (舊快取、沒有後綴) 共用
+    if PIXEL_CALIBRATION_MODE != "fixed":
+        variant.append(f"calibration={PIXEL_CALIBRATION_MODE}")
+    if camera_session_id:
+        variant.append(f"session={camera_session_id}")
+    if height_cm:
+        variant.append(f"height={height_cm:g}")
+    if not variant:
+        return video_hash
+    return hashlib.sha256(":".join([video_hash, *variant]).encode("utf-8")).hexdigest()
+
+# 暫存上傳的影片 輸入 UploadFile 與暫存目錄 返回 暫存路徑 與 影片 SHA-256
+async def spool_video(video_file, spool_dir: str = ".") -> Tuple[str, str]:
+    # 只落地一次，之後的上傳與解碼都直接讀這個檔案
+    # 加上隨機前綴，避免同名影片同時上傳時互相覆蓋
+    temp_video_path = os.path.join(spool_dir, f"temp_{uuid.uuid4().hex[:8]}_{os.path.basename(video_file.filename)}")
+
+    try:
+        video_hash = await run_io(_spool_upload, video_file.file, temp_video_path)
+    except Exception as e:
+        logger.error(f"無法儲存影片檔案: {e}", exc_info=True)
+        raise e
+    return temp_video_path, video_hash
 
 # 主要分析路由 輸入資料庫 影片 球員名稱 比較對象 返回分析結果
 async def analyze_pitch_service(
@@ -65,69 +324,113 @@ async def analyze_pitch_service(
         video_file, 
         player_name,
         benchmark_name,
-        compare_average: bool
+        compare_average: bool,
+        render_mode: str = "video",
+        camera_session_id: Optional[str] = None,
+        height_cm: Optional[float] = None
         ):
     
-    logger.info(f"[服務層] 收到參數: player_name='{player_name}', benchmark_name='{benchmark_name}', compare_average={compare_average}") # 偵錯日誌
+    logger.info(f"[服務層] 收到參數: player_name='{player_name}', benchmark_name='{benchmark_name}', compare_average={compare_average}, render_mode='{render_mode}', camera_session_id='{camera_session_id}', height_cm={height_cm}") # 偵錯日誌
     
     # 步驟 1 嘗試暫存原始影片
-    temp_video_path = f"temp_{video_file.filename}"
-    
-    try:
-        with open(temp_video_path, "wb") as buffer:
-            shutil.copyfileobj(video_file.file, buffer)
-    except Exception as e:
-        logger.error(f"無法儲存影片檔案: {e}", exc_info=True)
-        raise e
+    temp_video_path, video_hash = await spool_video(video_file)
+
+    return await analyze_spooled_pitch(
+        db=db,
+        temp_video_path=temp_video_path,
+        filename=video_file.filename,
+        video_hash=video_hash,
+        player_name=player_name,
+        benchmark_name=benchmark_name,
+        compare_average=compare_average,
+        render_mode=render_mode,
+        camera_session_id=camera_session_id,
+        height_cm=height_cm
+    )
+
+# 分析已暫存到磁碟的影片 (同步路由與非同步任務共用)，結束後刪除暫存影片
+async def analyze_spooled_pitch(
+        db,
+        temp_video_path: str,
+        filename: str,
+        video_hash: str,
+        player_name,
+        benchmark_name,
+        compare_average: bool,
+        progress: ProgressCallback = None,
+        render_mode: str = "video",
+        camera_session_id: Optional[str] = None,
+        height_cm: Optional[float] = None
+        ):
 
     try:
-        with open(temp_video_path, "rb") as f:
-            video_bytes = f.read()
-    except Exception as e:
-        logger.error(f"無法讀取影片內容: {e}", exc_info=True)
-        raise e
+        # 身高：本次有傳入就記錄到投手資料，否則使用投手資料中的身高 (估算 pixel_to_meter 用)
+        height_cm = await run_io(crud.resolve_player_height, db, player_name, height_cm)
 
-    # 步驟 2: 並行呼叫 API 分析骨架跟球路
-    (kinematics_results, ball_data) = await asyncio.gather(
-            analyze_video_kinematics(video_bytes, video_file.filename),
-            analyze_ball_flight(video_bytes, video_file.filename)
+        # 同一支影片分析過就直接使用快取，只重新計算 pose_score (輸出模式、校正條件不同時分開快取)
+        cache_key = _result_cache_key(video_hash, render_mode, camera_session_id, height_cm)
+        video_analysis = await run_io(load_cached_result, db, cache_key)
+        if video_analysis is not None:
+            logger.info(f"服務層：影片 {video_hash[:12]} 命中結果快取，略過推論、渲染與上傳。")
+        else:
+            video_analysis = await analyze_video_content(
+                temp_video_path, filename, video_hash, progress, render_mode,
+                db=db, camera_session_id=camera_session_id, height_cm=height_cm
             )
-    
-    # 從kinematics_results拿出骨架資料跟運動力學特徵
-    biomechanics_features, pose_data = kinematics_results
-    
+            await run_io(store_cached_result, db, cache_key, video_analysis)
+    finally:
+        await run_io(_remove_files, [temp_video_path])
+    await _report_progress(progress, "scoring", 0.85)
+
+    biomechanics_features = video_analysis["biomechanics_features"]
+    max_speed_kmh = video_analysis["max_speed_kmh"]
+    ball_score = video_analysis["ball_score"]
+    gcs_video_url = video_analysis["output_video_url"]
+    release_frame_url = video_analysis["release_frame_url"]
+    landing_frame_url = video_analysis["landing_frame_url"]
+    shoulder_frame_url = video_analysis["shoulder_frame_url"]
+
     # 從球路資料拿到pitch_type
-    detected_pitch_type = ball_data.get("predicted_pitch_type",None)
+    detected_pitch_type = video_analysis["ball_data"].get("predicted_pitch_type",None)
     
     # 步驟 3: 決定比較標竿並取得模型
     # 建立一個列表來存放所有要比對的模型
     benchmark_profiles_to_return = []
 
-    # 處理菁英選手模型
-    if benchmark_name:
-        elite_model = crud.get_pitch_model_by_name(db, model_name=benchmark_name)
-        if elite_model:
-            benchmark_profiles_to_return.append(elite_model)
+    async with new_async_session() as async_db:
+        # 處理菁英選手模型
+        if benchmark_name:
+            # 模型由記憶體快取提供 (背景定期檢查資料表是否變動)，只有快取尚未載入時才會查詢資料庫
+            elite_model = await model_cache.get_pitch_model_async(async_db, model_name=benchmark_name)
+            if elite_model:
+                benchmark_profiles_to_return.append(elite_model)
 
-    # 如果勾選了，處理個人歷史平均模型
-    if compare_average:
-        current_time = datetime.now(timezone.utc)
-        user_average_model = crud.calculate_user_average_profile(db, player_name, end_date=current_time)
-        if user_average_model:
-            benchmark_profiles_to_return.append(user_average_model)
+        # 如果勾選了，處理個人歷史平均模型
+        if compare_average:
+            current_time = datetime.now(timezone.utc)
+            user_average_model = await crud.calculate_user_average_profile_async(async_db, player_name, end_date=current_time)
+            if user_average_model:
+                benchmark_profiles_to_return.append(user_average_model)
 
-    # 使用第一個模型（通常是菁英模型）來計算主要分數
+    # 所有比對模型一次編譯成平均值/標準差矩陣、一次計分；第一個模型（通常是菁英模型）的分數為主要分數
     pose_score = 0
     pose_score_details = {}
     pose_score_message = "分析成功" # 預設訊息
+    benchmark_scores = []
 
     if benchmark_profiles_to_return:
-        main_profile_data = benchmark_profiles_to_return[0].profile_data
-        if main_profile_data:
-            pose_score, pose_score_details = calculate_score_from_comparison(
-                features=biomechanics_features,
-                profile_data=main_profile_data
-            )
+        compiled_profiles = compile_profiles([(p.model_name, p.profile_data) for p in benchmark_profiles_to_return])
+        for profile, (score, details) in zip(benchmark_profiles_to_return,
+                                             calculate_scores(biomechanics_features, compiled_profiles)):
+            benchmark_scores.append({
+                "model_name": profile.model_name,
+                "display_name": getattr(profile, "display_name", profile.model_name),
+                "pose_score": score,
+                "pose_score_details": details
+            })
+        if benchmark_profiles_to_return[0].profile_data:
+            pose_score = benchmark_scores[0]["pose_score"]
+            pose_score_details = benchmark_scores[0]["pose_score_details"]
         else:
             # 雖然有模型，但模型沒有資料的情況
             pose_score_message = "比對模型資料不完整"
@@ -137,82 +440,6 @@ async def analyze_pitch_service(
         pose_score_message = "未選擇或找不到比對模型"
         logger.warning(f"服務層：找不到任何比對模型，pose_score 設為 0。")
 
-    # 計算投球分數
-    ball_score = classify_ball_quality(ball_data, ball_prediction_model)
-        
-    # 渲染影片
-    try:
-        rendered_video_local_path, max_speed_kmh = render_video_with_pose_and_max_ball_speed(
-            input_video_path=temp_video_path,
-            pose_json=pose_data,
-            ball_json=ball_data
-        )
-    except Exception as e:
-        logger.error(f"影片渲染失敗: {e}", exc_info=True)
-        raise e
-
-    # 上傳至 GCS
-    gcs_video_url = None
-    try:
-        destination_blob_name = f"render_videos/rendered_{video_file.filename}"
-        gcs_video_url = upload_video_to_gcs(
-            bucket_name=GCS_BUCKET_NAME,
-            source_file_path=rendered_video_local_path,
-            destination_blob_name=destination_blob_name
-        )
-    except Exception as e:
-        logger.error(f"GCS 上傳失敗: {e}", exc_info=True)
-        raise e
-
-    # 儲存關鍵影格圖片
-    release_frame_url = None
-    landing_frame_url = None
-    shoulder_frame_url = None
-    frame_indices = {
-        "release": biomechanics_features.get("release_frame"),
-        "landing": biomechanics_features.get("landing_frame"),
-        "shoulder": biomechanics_features.get("shoulder_frame")
-        }
-        
-    saved_frame_paths = save_specific_frames(temp_video_path, frame_indices)
-
-    # 上傳關鍵影格圖片到 GCS
-    try:
-        if "release_frame_path" in saved_frame_paths:
-            release_frame_url = upload_video_to_gcs(
-                bucket_name=GCS_BUCKET_NAME,
-                source_file_path=saved_frame_paths["release_frame_path"],
-                destination_blob_name=f"key_frames/release_{os.path.basename(saved_frame_paths['release_frame_path'])}"
-            )
-        if "landing_frame_path" in saved_frame_paths:
-            landing_frame_url = upload_video_to_gcs(
-                bucket_name=GCS_BUCKET_NAME,
-                source_file_path=saved_frame_paths["landing_frame_path"],
-                destination_blob_name=f"key_frames/landing_{os.path.basename(saved_frame_paths['landing_frame_path'])}"
-            )
-        if "shoulder_frame_path" in saved_frame_paths:
-            shoulder_frame_url = upload_video_to_gcs(
-                bucket_name=GCS_BUCKET_NAME,
-                source_file_path=saved_frame_paths["shoulder_frame_path"],
-                destination_blob_name=f"key_frames/shoulder_{os.path.basename(saved_frame_paths['shoulder_frame_path'])}"
-            )
-    except Exception as e:
-        logger.error(f"GCS 上傳失敗: {e}", exc_info=True)
-        raise e
-
-    # 清理本地臨時檔案
-    try:
-        if os.path.exists(temp_video_path):
-            os.remove(temp_video_path)
-        if os.path.exists(rendered_video_local_path):
-            os.remove(rendered_video_local_path)
-        for key in ["release_frame_path", "landing_frame_path", "shoulder_frame_path"]:
-            path = saved_frame_paths.get(key)
-            if path and os.path.exists(path):
-                os.remove(path)
-    except Exception as e:
-        logger.warning(f"刪除暫存影片失敗: {e}", exc_info=True)
-
     # 步驟 6: 組裝一個「扁平化」的字典，用來存入資料庫
     data_for_db = {
         "output_video_url": gcs_video_url,
@@ -224,15 +451,15 @@ async def analyze_pitch_service(
         "release_frame_url": release_frame_url,
         "landing_frame_url": landing_frame_url,
         "shoulder_frame_url": shoulder_frame_url,
+        "annotation_url": video_analysis.get("annotation_url"),
         "pose_score_message": pose_score_message
     }
 
     # 步驟 7: 將本次分析結果存入資料庫
+    await _report_progress(progress, "saving", 0.95)
     try:
-        created_record_from_db = crud.create_pitch_analysis(
-            db=db,
-            analysis_data=data_for_db
-        )
+        async with new_async_session() as async_db:
+            created_record_from_db = await crud.create_pitch_analysis_async(async_db, analysis_data=data_for_db)
         new_record_id = created_record_from_db.id
         new_record_created_at = created_record_from_db.created_at.isoformat()
         logger.info(f"成功將分析結果 (ID: {new_record_id}) 存入資料庫。")
@@ -252,12 +479,20 @@ async def analyze_pitch_service(
                 "landing_frame_url": landing_frame_url,
                 "shoulder_frame_url": shoulder_frame_url
             },
+            "keyframe_variant_urls": video_analysis.get("keyframe_variant_urls") or {},
+            "render_mode": render_mode,
+            "annotation_url": video_analysis.get("annotation_url"),
+            "calibration": video_analysis.get("calibration"),
             "predictions": {
                 "max_speed_kmh": max_speed_kmh,
+                "median_speed_kmh": (video_analysis.get("ball_speed") or {}).get("median_speed_kmh"),
+                "ball_speed_profile": (video_analysis.get("ball_speed") or {}).get("segments"),
                 "pose_score": pose_score,
                 "ball_score": ball_score,
                 "pose_score_details": pose_score_details,
-                "pose_score_message": pose_score_message 
+                "pose_score_message": pose_score_message,
+                # 每個比對模型 (菁英模型、個人歷史平均) 各自的分數，順序與 benchmark_profiles 相同
+                "benchmark_scores": benchmark_scores
             },
             "biomechanics_features": biomechanics_features
         },
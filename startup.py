@@ -0,0 +1,362 @@
+# 檔案: startup.py
+# 職責: 冷啟動 (Cloud Run 由 0 擴展) 的效能工具。
+#       - LazyModule / lazy_import：第一次存取屬性時才 import 的模組代理，讓 cv2 等重量級模組不拖慢 import main
+#       - 啟動 import 分析器：記錄每個模組的 import 耗時 (累計與自身)，以及 import main、啟動流程、第一個請求的耗時，
+#         由 GET /startup-profile 查詢，超過 STARTUP_BUDGET_SECONDS 時記錄警告
+#       - 背景預熱：服務開始接受請求後預先 import 重量級模組、建立資料庫連線、載入統計模型與分類模型、
+#         建立儲存 client、連線上游 API，並讓行程池的 worker 執行一次假推論；完成後 /readyz 才回報就緒
+
+import asyncio
+import builtins
+import importlib
+import logging
+import sys
+import threading
+import time
+import types
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import (STARTUP_PROFILE, STARTUP_BUDGET_SECONDS, MODEL_PRELOAD, CPU_POOL_SIZE, API_CONNECT_TIMEOUT,
+                    POSE_API_URL, BALL_API_URL, WARMUP_STEP_TIMEOUT, WARMUP_UPSTREAMS)
+
+logger = logging.getLogger(__name__)
+
+# 背景預熱時 import 的模組 (依序)；這些模組只在分析影片時才用得到
+WARMUP_MODULES = (
+    "numpy",
+    "cv2",
+    "FramePipeline",
+    "VideoEncoder",
+    "Drawingfunction",
+    "AnnotationTrack",
+    "BallSpeed",
+    "KinematicsModule",
+    "joblib",
+    "sklearn.ensemble",
+)
+UPSTREAM_URLS = {"pose": POSE_API_URL, "ball": BALL_API_URL}
+# 這些步驟失敗時 /readyz 回報未就緒；其他步驟失敗時服務仍可運作 (第一次使用時再載入或連線)
+REQUIRED_WARMUP_STEPS = ("database",)
+
+
+class LazyModule(types.ModuleType):
+    """第一次存取屬性時才 import 的模組代理 (import 失敗時在存取的地方拋出例外)。"""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lazy_target = None
+
+    def _load(self) -> types.ModuleType:
+        if self._lazy_target is None:
+            self._lazy_target = importlib.import_module(self.__name__)
+        return self._lazy_target
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """已經載入的模組直接回傳，否則回傳 LazyModule。"""
+    return sys.modules.get(name) or LazyModule(name)
+
+
+class ImportProfiler:
+    """
+    以包裝 builtins.__import__ 的方式記錄每個絕對 import 的耗時 (只記錄第一次、真正執行模組的那次)。
+    cumulative 包含該模組 import 的其他模組，self 則扣除被記錄到的子模組。
+    """
+
+    def __init__(self):
+        self.records: Dict[str, Dict[str, float]] = {}
+        self._original_import = None
+        self._stack: List[List[float]] = []
+        self._lock = threading.Lock()
+        self._thread_id = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # 只記錄主執行緒的絕對 import；背景執行緒 (預熱) 的 import 由預熱本身計時
+        if level != 0 or name in sys.modules or threading.get_ident() != self._thread_id:
+            return self._original_import(name, globals, locals, fromlist, level)
+        self._stack.append([0.0])
+        started = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            children = self._stack.pop()[0]
+            if self._stack:
+                self._stack[-1][0] += elapsed
+            self.records.setdefault(name, {"cumulative_ms": round(elapsed * 1000, 2),
+                                           "self_ms": round((elapsed - children) * 1000, 2)})
+
+    def install(self) -> None:
+        with self._lock:
+            if self._original_import is None:
+                self._thread_id = threading.get_ident()
+                self._original_import = builtins.__import__
+                builtins.__import__ = self._import
+
+    def uninstall(self) -> None:
+        with self._lock:
+            if self._original_import is not None:
+                builtins.__import__ = self._original_import
+                self._original_import = None
+
+    def top(self, limit: int = 20, key: str = "self_ms") -> List[Dict[str, Any]]:
+        ranked = sorted(self.records.items(), key=lambda item: item[1][key], reverse=True)
+        return [{"module": name, **timing} for name, timing in ranked[:limit]]
+
+
+_profiler = ImportProfiler()
+_timeline: Dict[str, Optional[float]] = {
+    "import_started": None, "import_finished": None, "startup_finished": None, "first_response": None,
+}
+# status: pending → running → done (→ stopping，關閉時)；steps 為每個步驟的結果
+_warmup: Dict[str, Any] = {"status": "pending", "steps": {}, "modules": {}, "seconds": None}
+_warmup_task: Optional[asyncio.Task] = None
+
+
+def mark_import_started() -> None:
+    """在 main.py 最前面呼叫：開始計時，STARTUP_PROFILE 開啟時安裝 import 分析器。"""
+    _timeline["import_started"] = time.perf_counter()
+    if STARTUP_PROFILE:
+        _profiler.install()
+
+
+def mark_import_finished() -> None:
+    _timeline["import_finished"] = time.perf_counter()
+
+
+def _elapsed(event: str) -> Optional[float]:
+    started, finished = _timeline["import_started"], _timeline[event]
+    if started is None or finished is None:
+        return None
+    return round(finished - started, 4)
+
+
+def mark_startup_finished() -> None:
+    """FastAPI 啟動流程結束 (開始接受請求) 時呼叫：移除 import 分析器並記錄耗時。"""
+    _timeline["startup_finished"] = time.perf_counter()
+    _profiler.uninstall()
+    ready_seconds = _elapsed("startup_finished")
+    slowest = ", ".join(f"{item['module']} {item['cumulative_ms']:.0f}ms" for item in _profiler.top(5, "cumulative_ms"))
+    logger.info(f"啟動完成：import main {_elapsed('import_finished')} 秒，可接受請求 {ready_seconds} 秒 (最慢的 import: {slowest})")
+    if STARTUP_BUDGET_SECONDS and ready_seconds is not None and ready_seconds > STARTUP_BUDGET_SECONDS:
+        logger.warning(f"啟動耗時 {ready_seconds} 秒，超過預算 {STARTUP_BUDGET_SECONDS} 秒")
+
+
+def mark_response() -> None:
+    """每個回應送出前呼叫；只記錄第一個。"""
+    if _timeline["first_response"] is None:
+        _timeline["first_response"] = time.perf_counter()
+
+
+def _import_modules() -> None:
+    """依序 import 重量級模組 (任一個失敗不影響其他模組)。"""
+    failed = []
+    for name in WARMUP_MODULES:
+        module_started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+            elapsed_ms = round((time.perf_counter() - module_started) * 1000, 2)
+        except Exception as e:
+            elapsed_ms = None
+            failed.append(f"{name}: {e}")
+        # 在 IO 執行緒中執行，整個 dict 替換，/readyz 序列化時不會遇到 dict 在迭代中被修改
+        _warmup["modules"] = {**_warmup["modules"], name: elapsed_ms}
+    if failed:
+        raise ImportError("; ".join(failed))
+
+
+def _ping_database() -> None:
+    from sqlalchemy import text
+    from database import engine
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
+async def _check_database() -> None:
+    """同步與非同步連線池各建立一條連線並執行 SELECT 1。"""
+    from sqlalchemy import text
+    from database import async_engine
+    from executors import run_io
+    await run_io(_ping_database)
+    if async_engine is not None:
+        async with async_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+
+def _load_pitch_models() -> None:
+    """載入比對用的統計模型快照 (model_cache)。"""
+    import model_cache
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        model_cache.get_snapshot(db)
+    finally:
+        db.close()
+
+
+def _load_ball_model() -> None:
+    if MODEL_PRELOAD:
+        from model_registry import registry
+        registry.preload()
+
+
+def _warm_storage() -> None:
+    from gcs_utils import get_storage, upload_retry, GCSStorage
+    storage_backend = get_storage()
+    if isinstance(storage_backend, GCSStorage):
+        # GCS 的 client 在建立時會尋找憑證，先做掉
+        storage_backend.client
+        upload_retry()
+
+
+async def _preconnect_upstreams() -> None:
+    """
+    對 POSE / BALL API 的主機各送一個 HEAD /，讓共用 client 的連線池先完成 DNS、TCP 與 TLS 握手
+    (連線在 keepalive 期間內會被分析請求沿用)。任何 HTTP 狀態碼都算成功，只有連線失敗才算失敗。
+    """
+    import httpx
+    from http_clients import get_http_client
+
+    async def connect(upstream: str, url: str) -> None:
+        origin = httpx.URL(url).copy_with(path="/", query=None)
+        await get_http_client(upstream).head(origin, timeout=API_CONNECT_TIMEOUT)
+
+    await asyncio.gather(*(connect(upstream, url) for upstream, url in UPSTREAM_URLS.items()))
+
+
+def _dummy_pose_response(frame_count: int = 30) -> Dict[str, Any]:
+    """合成一段 POSE API 格式的投球骨架 (右手臂由後下方往前上方揮動)，供預熱推論使用。"""
+    import numpy as np
+    base = np.array([[280, 150], [285, 145], [275, 145], [290, 150], [270, 150], [300, 200], [260, 200],
+                     [305, 250], [255, 250], [305, 300], [250, 300], [300, 350], [270, 350],
+                     [305, 450], [265, 450], [305, 550], [265, 550]], dtype=np.float64)
+    frames = []
+    for t in range(frame_count):
+        keypoints = base.copy()
+        angle = np.deg2rad(-120 + 240 * t / (frame_count - 1))
+        direction = np.array([np.sin(angle), -np.cos(angle)])
+        keypoints[8] = keypoints[6] + 50 * direction    # 右手肘
+        keypoints[10] = keypoints[6] + 100 * direction  # 右手腕
+        keypoints[5, 0] += t                            # 左肩隨轉體前移
+        frames.append({"frame_idx": t, "predictions": [{"keypoints": keypoints.tolist(),
+                                                        "keypoint_scores": [0.9] * 17}]})
+    return {"frames": frames}
+
+
+def warm_up_inference() -> Dict[str, Any]:
+    """
+    在行程池的 worker 中執行一次假的生物力學計算與球路分類：worker 行程啟動、import 模組並載入模型，
+    第一個分析請求不必再等。
+    """
+    from KinematicsModule import extract_pitching_biomechanics
+    from BallClassification import predict_ball_quality
+    features = extract_pitching_biomechanics(_dummy_pose_response())
+    ball_json = {"results": [[i, [100 + 5 * i, 200, 110 + 5 * i, 210]] for i in range(30)]}
+    return {"release_frame": features.get("release_frame"), "ball_probability": predict_ball_quality(ball_json)}
+
+
+async def _warm_cpu_workers() -> None:
+    from executors import run_cpu
+    # 行程池每送出一個工作最多啟動一個 worker，同時送出 CPU_POOL_SIZE 個讓所有 worker 都預熱
+    results = await asyncio.gather(*(run_cpu(warm_up_inference) for _ in range(max(CPU_POOL_SIZE, 1))))
+    if results[0]["release_frame"] is None:
+        raise RuntimeError("預熱推論沒有偵測到出手幀")
+
+
+async def _run_step(name: str, func, *args) -> bool:
+    """執行一個預熱步驟 (同步函式交給 IO 執行緒池)，記錄耗時與錯誤，不拋出例外。"""
+    from executors import run_io
+    started = time.perf_counter()
+    try:
+        work = func(*args) if asyncio.iscoroutinefunction(func) else run_io(func, *args)
+        await asyncio.wait_for(work, timeout=WARMUP_STEP_TIMEOUT)
+        result = {"ok": True, "error": None}
+    except Exception as e:
+        result = {"ok": False, "error": str(e) or type(e).__name__}
+        logger.warning(f"預熱步驟 {name} 失敗: {result['error']}")
+    result["seconds"] = round(time.perf_counter() - started, 4)
+    _warmup["steps"][name] = result
+    return result["ok"]
+
+
+async def run_warmup() -> None:
+    """
+    背景預熱，三條路線並行：
+    - import 重量級模組 → 載入分類模型 → 行程池 worker 執行假推論 (本行程先載入並攤平模型，worker 直接以記憶體對應載入)
+    - 資料庫連線池 → 統計模型快照
+    - 物件儲存 client、上游 API 預先連線 (WARMUP_UPSTREAMS)
+    完成後 /readyz 才回報就緒 (必要步驟見 REQUIRED_WARMUP_STEPS)。
+    """
+    started = time.perf_counter()
+    _warmup["status"] = "running"
+
+    async def compute_chain():
+        await _run_step("imports", _import_modules)
+        await _run_step("ball_model", _load_ball_model)
+        await _run_step("inference", _warm_cpu_workers)
+
+    async def database_chain():
+        if await _run_step("database", _check_database):
+            await _run_step("pitch_models", _load_pitch_models)
+
+    async def network_chain():
+        await _run_step("storage", _warm_storage)
+        if WARMUP_UPSTREAMS:
+            await _run_step("upstreams", _preconnect_upstreams)
+
+    await asyncio.gather(compute_chain(), database_chain(), network_chain())
+    _warmup["seconds"] = round(time.perf_counter() - started, 4)
+    if _warmup["status"] == "running":
+        _warmup["status"] = "done"
+    failed = [name for name, step in _warmup["steps"].items() if not step["ok"]]
+    logger.info(f"預熱完成，耗時 {_warmup['seconds']} 秒" + (f" (失敗: {', '.join(failed)})" if failed else ""))
+
+
+def start_warmup() -> asyncio.Task:
+    """在背景執行 run_warmup，回傳 task (需要等預熱完成才開始服務時可以 await)。"""
+    global _warmup_task
+    _warmup_task = asyncio.create_task(run_warmup())
+    return _warmup_task
+
+
+async def stop_warmup() -> None:
+    """關閉時呼叫：/readyz 改回報未就緒，並等待還在進行的預熱結束。"""
+    global _warmup_task
+    _warmup["status"] = "stopping"
+    if _warmup_task is not None:
+        await asyncio.gather(_warmup_task, return_exceptions=True)
+        _warmup_task = None
+
+
+def is_ready() -> bool:
+    return _warmup["status"] == "done" and all(
+        _warmup["steps"].get(name, {}).get("ok") for name in REQUIRED_WARMUP_STEPS
+    )
+
+
+async def check_readiness() -> Tuple[bool, Dict[str, Any]]:
+    """
+    回傳 (是否就緒, 預熱狀態)。預熱已結束但必要步驟失敗 (例如啟動時資料庫還連不上) 時重新執行那些步驟，
+    之後恢復正常的執行個體會自動轉為就緒。
+    """
+    if _warmup["status"] == "done" and not is_ready():
+        if await _run_step("database", _check_database):
+            await _run_step("pitch_models", _load_pitch_models)
+    return is_ready(), _warmup
+
+
+def startup_report(limit: int = 30) -> Dict[str, Any]:
+    return {
+        "import_seconds": _elapsed("import_finished"),
+        "ready_seconds": _elapsed("startup_finished"),
+        "first_response_seconds": _elapsed("first_response"),
+        "budget_seconds": STARTUP_BUDGET_SECONDS or None,
+        "warmup": _warmup,
+        "slowest_imports": _profiler.top(limit),
+    }
@@ -0,0 +1,41 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+# 專案是平面的模組結構，讓測試可以直接 import 根目錄的模組
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config.py 在 import 時讀取環境變數：測試一律使用暫存目錄中的 SQLite 與本機儲存，不會連到正式資料庫或 GCS
+_TEST_DIR = tempfile.mkdtemp(prefix="baseball_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TEST_DIR, 'test.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ["STORAGE_BACKEND"] = "local"
+os.environ["LOCAL_STORAGE_DIR"] = os.path.join(_TEST_DIR, "storage")
+os.environ["RESULT_CACHE_DIR"] = os.path.join(_TEST_DIR, "result_cache")
+os.environ["MODEL_PACK_DIR"] = os.path.join(_TEST_DIR, "model_packs")
+
+
+@pytest.fixture
+def db_tables():
+    """建立所有資料表，測試結束後刪除；回傳 database 模組。"""
+    import database
+    database.Base.metadata.create_all(database.engine)
+    yield database
+    database.Base.metadata.drop_all(database.engine)
+    if database.async_engine is not None:
+        # aiosqlite 的連線各自有一條執行緒，不釋放的話 pytest 結束時會卡住
+        asyncio.run(database.async_engine.dispose())
+
+
+@pytest.fixture
+def client(db_tables):
+    """不執行 lifespan (不啟動行程池、背景預熱與任務 worker) 的 API 測試客戶端。"""
+    from fastapi.testclient import TestClient
+    import main
+    import model_cache
+    model_cache.invalidate()
+    yield TestClient(main.app)
+    model_cache.invalidate()
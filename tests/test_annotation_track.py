@@ -0,0 +1,69 @@
+# 標註軌的編解碼：json / binary 兩種格式都能還原量化後的陣列 (差分 + 累加)
+
+import numpy as np
+import pytest
+
+from AnnotationTrack import (COORD_SCALE, SCORE_SCALE, build_annotation_arrays, decode_annotation_track,
+                             encode_annotation_track)
+from FramePipeline import VideoMeta
+
+META = VideoMeta(width=1920, height=1080, fps=30.0, frame_count=40)
+
+
+def make_inputs(seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for frame_idx in range(0, 45, 2):
+        frames.append({"frame_idx": frame_idx, "predictions": [{
+            "keypoints": rng.uniform(0, 1920, size=(17, 2)).round(2).tolist(),
+            "keypoint_scores": rng.uniform(0, 1, size=17).tolist(),
+            "bbox": [[[100.5, 200.25, 300.0, 800.75]]],
+        }]})
+    frames.append({"frame_idx": 1, "predictions": []})
+    # 關節點數量不對的影格不會寫入標註軌
+    frames.append({"frame_idx": 3, "predictions": [{"keypoints": [[1, 2]] * 12, "keypoint_scores": [1] * 12}]})
+    ball = {"results": [(frame_idx, [900 - 30 * frame_idx, 500, 920 - 30 * frame_idx, 520]) for frame_idx in range(10, 20)]
+            + [(12, None), (50, [0, 0, 1, 1])]}
+    return {"frames": frames}, ball
+
+
+@pytest.fixture
+def arrays():
+    pose, ball = make_inputs()
+    arrays, _ = build_annotation_arrays(pose, ball, META, pixel_to_meter=0.02)
+    return arrays
+
+
+@pytest.mark.parametrize("track_format", ["json", "binary"])
+def test_round_trip(arrays, track_format):
+    payload, extension, _ = encode_annotation_track(arrays, META, track_format)
+    assert extension == ("bin" if track_format == "binary" else "json")
+    header, decoded = decode_annotation_track(payload)
+    assert header["frame_count"] == META.frame_count
+    assert header["coord_scale"] == COORD_SCALE
+    assert decoded.keys() == arrays.keys()
+    for name, array in arrays.items():
+        assert decoded[name].shape == array.shape, name
+        np.testing.assert_array_equal(decoded[name], array, err_msg=name)
+
+
+def test_quantization_and_filtering(arrays):
+    pose, _ = make_inputs()
+    # 影格 0..38 (frame_count 之後的影格、沒有投手或關節點數量不對的影格都不寫入)
+    np.testing.assert_array_equal(arrays["pose_frames"], np.arange(0, 40, 2))
+    first = pose["frames"][0]["predictions"][0]
+    np.testing.assert_allclose(arrays["keypoints"][0] / COORD_SCALE, first["keypoints"], atol=0.5 / COORD_SCALE)
+    np.testing.assert_allclose(arrays["keypoint_scores"][0] / SCORE_SCALE, first["keypoint_scores"], atol=0.5 / SCORE_SCALE)
+    np.testing.assert_array_equal(arrays["pose_bbox"][0], [1005, 2002, 3000, 8008])
+    np.testing.assert_array_equal(arrays["ball_frames"], np.arange(10, 20))
+    # 累積最大球速只在增加時記錄
+    assert len(arrays["speed_frames"]) == len(arrays["max_speed"]) >= 1
+    assert np.all(np.diff(arrays["max_speed"]) > 0)
+
+
+def test_binary_uses_int32_when_deltas_are_large():
+    arrays = {"values": np.array([0, 40000, -40000, 5], dtype=np.int32), "empty": np.zeros((0, 4), dtype=np.int32)}
+    payload, _, _ = encode_annotation_track(arrays, META, "binary")
+    _, decoded = decode_annotation_track(payload)
+    np.testing.assert_array_equal(decoded["values"], arrays["values"])
+    assert decoded["empty"].shape == (0, 4)
@@ -0,0 +1,66 @@
+# BallSpeed 的 MAD 離群值剔除：合理範圍內但明顯偏離的段落 (誤判跳動) 不計入最大球速
+
+import numpy as np
+
+from BallSpeed import estimate_ball_speed, estimate_ball_speed_from_json
+
+FPS = 30.0
+KMH_PER_PIXEL = 0.04 * FPS * 3.6   # pixel_to_meter=0.04、相鄰影格移動 1 像素 = 4.32 km/h
+
+
+def track(steps):
+    """每一幀沿 x 軸移動 steps[i] 像素的軌跡，回傳 (frames, centers)。"""
+    x = np.concatenate([[100], 100 + np.cumsum(steps)])
+    return np.arange(len(x)), np.stack([x, np.full(len(x), 500)], axis=1)
+
+
+def test_mad_rejects_in_range_jump():
+    steps = [23, 22, 24, 23, 42, 23, 22, 24]   # 第 5 段約 181 km/h，在合理範圍內但是離群值
+    frames, centers = track(steps)
+
+    plain = estimate_ball_speed(frames, centers, FPS)
+    assert plain.max_speed_kmh == round(42 * KMH_PER_PIXEL, 2)
+    assert plain.valid.all()
+
+    robust = estimate_ball_speed(frames, centers, FPS, outlier_rejection="mad")
+    assert robust.valid.tolist() == [True, True, True, True, False, True, True, True]
+    assert robust.max_speed_kmh == round(24 * KMH_PER_PIXEL, 2)
+    assert robust.median_speed_kmh == round(23 * KMH_PER_PIXEL, 2)
+    # 標註軌 / 渲染影片上的累積最大球速也不包含被剔除的段落
+    assert np.isclose(robust.running_max_kmh().max(), 24 * KMH_PER_PIXEL)
+
+
+def test_threshold_controls_rejection():
+    frames, centers = track([23, 22, 24, 23, 42, 23, 22, 24])
+    assert estimate_ball_speed(frames, centers, FPS, outlier_rejection="mad", outlier_threshold=100).valid.all()
+
+
+def test_constant_speed_keeps_every_segment():
+    # MAD 為 0 時 (所有速度相同) 不剔除任何段落
+    frames, centers = track([23] * 6)
+    estimate = estimate_ball_speed(frames, centers, FPS, outlier_rejection="mad")
+    assert estimate.valid.all()
+    assert estimate.max_speed_kmh == round(23 * KMH_PER_PIXEL, 2)
+
+
+def test_too_few_segments_skip_rejection():
+    frames, centers = track([23, 42])
+    assert estimate_ball_speed(frames, centers, FPS, outlier_rejection="mad").valid.all()
+
+
+def test_out_of_range_segments_do_not_affect_median():
+    # 超出合理範圍 (> 200 km/h) 的段落本來就無效，也不參與 MAD 的中位數計算
+    frames, centers = track([23, 80, 22, 24, 23, 90])
+    estimate = estimate_ball_speed(frames, centers, FPS, outlier_rejection="mad")
+    assert estimate.valid.tolist() == [True, False, True, True, True, False]
+    assert estimate.max_speed_kmh == round(24 * KMH_PER_PIXEL, 2)
+
+
+def test_from_json_matches_arrays():
+    frames, centers = track([23, 22, 24, 23, 42, 23])
+    ball_json = {"results": [(int(f), [int(x) - 5, 495, int(x) + 5, 505]) for f, (x, _) in zip(frames, centers)]
+                 + [(99, None)]}
+    from_json = estimate_ball_speed_from_json(ball_json, FPS, outlier_rejection="mad")
+    from_arrays = estimate_ball_speed(frames, centers, FPS, outlier_rejection="mad")
+    assert from_json.max_speed_kmh == from_arrays.max_speed_kmh
+    np.testing.assert_array_equal(from_json.valid, from_arrays.valid)
@@ -0,0 +1,70 @@
+# /history/ 的 keyset 分頁：依 id 由新到舊、X-Next-Cursor 只在還有下一頁時出現，以及欄位投影
+
+import pytest
+
+
+def add_analyses(database, player_names):
+    db = database.SessionLocal()
+    try:
+        records = [database.PitchAnalyses(player_name=name, pose_score=i, biomechanics_features={"x": float(i)})
+                   for i, name in enumerate(player_names)]
+        db.add_all(records)
+        db.commit()
+        return [record.id for record in records]
+    finally:
+        db.close()
+
+
+def fetch_all_pages(client, limit, **params):
+    pages, cursor = [], None
+    while True:
+        query = {"limit": limit, **params}
+        if cursor is not None:
+            query["cursor"] = cursor
+        response = client.get("/history/", params=query)
+        assert response.status_code == 200
+        pages.append([record["id"] for record in response.json()])
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            return pages
+        assert int(cursor) == pages[-1][-1]
+
+
+@pytest.mark.parametrize("limit", [1, 3, 4, 5, 12, 13])
+def test_pages_cover_every_record_once(client, db_tables, limit):
+    ids = add_analyses(db_tables, ["a"] * 12)
+    pages = fetch_all_pages(client, limit)
+    assert [record_id for page in pages for record_id in page] == sorted(ids, reverse=True)
+    # 最後一頁剛好 limit 筆時不回傳游標，不會多出一個空頁
+    assert all(pages)
+    assert all(len(page) == limit for page in pages[:-1])
+
+
+def test_player_filter(client, db_tables):
+    ids = add_analyses(db_tables, ["a", "b", "a", "b", "b", "a", "b"])
+    b_ids = [record_id for record_id, name in zip(ids, ["a", "b", "a", "b", "b", "a", "b"]) if name == "b"]
+    pages = fetch_all_pages(client, 2, player_name="b")
+    assert pages == [sorted(b_ids, reverse=True)[:2], sorted(b_ids, reverse=True)[2:]]
+
+
+def test_empty_history_has_no_cursor(client, db_tables):
+    response = client.get("/history/", params={"player_name": "nobody"})
+    assert response.status_code == 200
+    assert response.json() == []
+    assert "x-next-cursor" not in response.headers
+
+
+def test_cursor_is_exclusive(client, db_tables):
+    ids = add_analyses(db_tables, ["a"] * 5)
+    response = client.get("/history/", params={"cursor": ids[2], "limit": 10})
+    assert [record["id"] for record in response.json()] == [ids[1], ids[0]]
+    assert "x-next-cursor" not in response.headers
+
+
+def test_summary_fields_omit_features(client, db_tables):
+    add_analyses(db_tables, ["a"])
+    full = client.get("/history/").json()[0]
+    summary = client.get("/history/", params={"fields": "summary"}).json()[0]
+    assert full["biomechanics_features"] == {"x": 0.0}
+    assert "biomechanics_features" not in summary
+    assert {key: value for key, value in full.items() if key != "biomechanics_features"} == summary
@@ -0,0 +1,55 @@
+# LocalStorage 只能寫入 root_dir 之內：拒絕 ../、指向外部的符號連結與空的物件名稱
+
+import os
+
+import pytest
+
+from gcs_utils import LocalStorage
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorage(str(tmp_path / "root"), "http://testserver/storage/")
+
+
+def test_upload_bytes_writes_inside_root(storage, tmp_path):
+    url = storage.upload_bytes(b"data", "videos/abc/clip.mp4")
+    assert url == "http://testserver/storage/videos/abc/clip.mp4"
+    assert (tmp_path / "root" / "videos" / "abc" / "clip.mp4").read_bytes() == b"data"
+
+
+def test_upload_file_copies_source(storage, tmp_path):
+    source = tmp_path / "source.jpg"
+    source.write_bytes(b"jpeg")
+    storage.upload_file(str(source), "keyframes/release.jpg")
+    assert (tmp_path / "root" / "keyframes" / "release.jpg").read_bytes() == b"jpeg"
+
+
+def test_leading_slash_stays_inside_root(storage, tmp_path):
+    storage.upload_bytes(b"x", "/etc/passwd")
+    assert (tmp_path / "root" / "etc" / "passwd").read_bytes() == b"x"
+
+
+@pytest.mark.parametrize("name", ["../outside.txt", "videos/../../outside.txt", "a/b/../../../outside.txt", "", ".", "videos/.."])
+def test_rejects_names_that_escape_root(storage, tmp_path, name):
+    with pytest.raises(ValueError):
+        storage.upload_bytes(b"x", name)
+    assert not (tmp_path / "outside.txt").exists()
+
+
+def test_rejects_symlink_out_of_root(storage, tmp_path):
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    (tmp_path / "root").mkdir()
+    os.symlink(outside, tmp_path / "root" / "link")
+    with pytest.raises(ValueError):
+        storage.upload_bytes(b"x", "link/file.txt")
+    assert not (outside / "file.txt").exists()
+
+
+def test_sibling_directory_with_same_prefix_is_rejected(tmp_path):
+    # root 為 .../root 時，.../root_other 不能因為字串前綴相同而被視為 root 之內
+    storage = LocalStorage(str(tmp_path / "root"), "http://testserver/storage")
+    with pytest.raises(ValueError):
+        storage.upload_bytes(b"x", "../root_other/file.txt")
+    assert not (tmp_path / "root_other").exists()
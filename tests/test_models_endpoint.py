@@ -0,0 +1,50 @@
+# /models/ 的 ETag 與 304：內容由 model_cache 的快照提供，模型變動後 ETag 跟著改變
+
+import model_cache
+
+
+def add_model(database, name, mean):
+    db = database.SessionLocal()
+    try:
+        db.add(database.PitchModel(model_name=name, method="tdigest",
+                                   profile_data={"trunk_flexion_excursion": {"mean": mean, "std": 1.0}}))
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_models_returns_etag_and_body(client, db_tables):
+    add_model(db_tables, "Cole_FF_v1", 10.0)
+    response = client.get("/models/")
+    assert response.status_code == 200
+    assert response.headers["etag"].startswith('"')
+    assert response.headers["cache-control"] == "no-cache"
+    body = response.json()
+    assert [model["model_name"] for model in body] == ["Cole_FF_v1"]
+    assert body[0]["display_name"] == "Cole - 四縫線快速球 (Four-Seam Fastball)"
+    assert body[0]["profile_data"]["trunk_flexion_excursion"]["mean"] == 10.0
+
+
+def test_if_none_match_returns_304(client, db_tables):
+    add_model(db_tables, "A_FF_v1", 10.0)
+    etag = client.get("/models/").headers["etag"]
+
+    for header in (etag, f'"other", {etag}', "*"):
+        response = client.get("/models/", headers={"If-None-Match": header})
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        assert response.content == b""
+
+    assert client.get("/models/", headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_etag_changes_when_models_change(client, db_tables):
+    add_model(db_tables, "A_FF_v1", 10.0)
+    etag = client.get("/models/").headers["etag"]
+
+    add_model(db_tables, "B_SL_v1", 20.0)
+    model_cache.invalidate()
+    response = client.get("/models/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert len(response.json()) == 2
@@ -0,0 +1,79 @@
+# PackedForest 以攤平的陣列做隨機森林推論，predict_proba 必須與 scikit-learn 逐位元相同
+
+import numpy as np
+import pytest
+
+sklearn_ensemble = pytest.importorskip("sklearn.ensemble")
+joblib = pytest.importorskip("joblib")
+
+import model_registry
+from model_registry import ModelRegistry, PackedForest, pack_forest, save_packed_forest
+
+
+def make_data(seed=0, n=400, features=8, classes=2, missing=False):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, features))
+    y = (X[:, 0] + X[:, 1] * X[:, 2] + rng.normal(scale=0.5, size=n) > 0).astype(int)
+    if classes > 2:
+        y = y + (X[:, 3] > 0.5)
+    if missing:
+        X[rng.random(X.shape) < 0.1] = np.nan
+    return X, y
+
+
+@pytest.mark.parametrize("estimator, classes, missing", [
+    ("RandomForestClassifier", 2, False),
+    ("RandomForestClassifier", 3, False),
+    ("ExtraTreesClassifier", 2, False),
+    ("RandomForestClassifier", 2, True),
+])
+def test_predict_proba_matches_sklearn(estimator, classes, missing):
+    X, y = make_data(classes=classes, missing=missing)
+    model = getattr(sklearn_ensemble, estimator)(n_estimators=25, max_depth=8, random_state=0).fit(X, y)
+    packed = PackedForest(pack_forest(model))
+
+    X_test, _ = make_data(seed=1, n=200, classes=classes, missing=missing)
+    np.testing.assert_array_equal(packed.predict_proba(X_test), model.predict_proba(X_test))
+    np.testing.assert_array_equal(packed.classes_, model.classes_)
+
+
+def test_saved_arrays_load_with_mmap(tmp_path):
+    X, y = make_data()
+    model = sklearn_ensemble.RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y)
+    directory = str(tmp_path / "forest")
+    save_packed_forest(directory, pack_forest(model))
+    # 已經存在時 (其他行程先寫好) 不會出錯
+    save_packed_forest(directory, pack_forest(model))
+
+    loaded = PackedForest.load(directory)
+    assert isinstance(loaded.left, np.memmap)
+    np.testing.assert_array_equal(loaded.predict_proba(X[:50]), model.predict_proba(X[:50]))
+
+
+def test_unsupported_models_are_not_packed():
+    from sklearn.linear_model import LogisticRegression
+    X, y = make_data()
+    assert pack_forest(LogisticRegression().fit(X, y)) is None
+
+
+def test_registry_serves_packed_forest(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_registry, "MODEL_PACK_DIR", str(tmp_path / "packs"))
+    X, y = make_data()
+    model = sklearn_ensemble.RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y)
+    path = str(tmp_path / "ball.joblib")
+    joblib.dump(model, path)
+
+    registry = ModelRegistry(mmap=True, reload_interval=0)
+    registry.register("ball", path=path)
+    entry = registry.entry("ball")
+    assert entry.backend == "packed"
+    np.testing.assert_array_equal(entry.model.predict_proba(X[:20]), model.predict_proba(X[:20]))
+
+    # 第二個行程 (新的登錄表) 直接讀取已攤平的陣列
+    second = ModelRegistry(mmap=True, reload_interval=0)
+    second.register("ball", path=path)
+    assert second.entry("ball").backend == "packed"
+
+    plain = ModelRegistry(mmap=False, reload_interval=0)
+    plain.register("ball", path=path)
+    assert plain.entry("ball").backend == "pickle"
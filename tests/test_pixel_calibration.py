@@ -0,0 +1,92 @@
+# PixelCalibration 由骨架估算 pixel_to_meter；骨架退化 (重疊、信心不足、幀數太少) 時回傳 None，
+# 服務層改用設定檔的固定比例
+
+import asyncio
+
+import numpy as np
+import pytest
+
+import services
+from PixelCalibration import BODY_SEGMENTS, estimate_pixel_to_meter, estimate_pixel_to_meter_from_pose
+
+HEIGHT_CM = 180.0
+PIXELS_PER_METER = 400.0
+
+
+def standing_skeleton():
+    """肢段長度符合人體比例 (身高 180 cm、1 公尺 = 400 像素) 的正面骨架 (17, 2)。"""
+    keypoints = np.zeros((17, 2))
+    height_px = HEIGHT_CM / 100 * PIXELS_PER_METER
+    shoulder_y, hip_y = 200.0, 200.0 + 0.288 * height_px
+    knee_y = hip_y + 0.245 * height_px
+    ankle_y = knee_y + 0.246 * height_px
+    for side, x in ((0, 900.0), (1, 1000.0)):
+        keypoints[5 + side] = (x, shoulder_y)
+        keypoints[11 + side] = (x, hip_y)
+        keypoints[13 + side] = (x, knee_y)
+        keypoints[15 + side] = (x, ankle_y)
+    keypoints[:5] = (950.0, 150.0)
+    keypoints[7:11] = (950.0, 300.0)
+    return keypoints
+
+
+def pose_json(keypoints_per_frame, score=0.9):
+    return {"frames": [{"frame_idx": i, "predictions": [{
+        "keypoints": np.asarray(keypoints).tolist(),
+        "keypoint_scores": [score] * 17,
+    }]} for i, keypoints in enumerate(keypoints_per_frame)]}
+
+
+def test_estimates_scale_from_valid_skeleton():
+    result = estimate_pixel_to_meter_from_pose(pose_json([standing_skeleton()] * 10), HEIGHT_CM)
+    assert result is not None
+    assert result.pixel_to_meter == pytest.approx(1 / PIXELS_PER_METER, rel=1e-4)
+    assert set(result.segments) == set(BODY_SEGMENTS)
+    assert result.sample_count == 10 * len(BODY_SEGMENTS)
+
+
+@pytest.mark.parametrize("pose, height_cm", [
+    (pose_json([np.full((17, 2), 500.0)] * 10), HEIGHT_CM),         # 所有關節點重疊，肢段長度為 0
+    (pose_json([standing_skeleton()] * 10, score=0.1), HEIGHT_CM),  # 信心分數都低於門檻
+    (pose_json([standing_skeleton()] * 3), HEIGHT_CM),              # 可靠的幀數不足 min_frames
+    (pose_json([np.zeros((12, 2))] * 10), HEIGHT_CM),               # 關節點數量不對，整幀略過
+    ({"frames": [{"frame_idx": 0, "predictions": []}]}, HEIGHT_CM),  # 沒有偵測到人
+    (pose_json([standing_skeleton()] * 10), 0),                     # 沒有身高
+])
+def test_degenerate_skeleton_returns_none(pose, height_cm):
+    assert estimate_pixel_to_meter_from_pose(pose, height_cm) is None
+
+
+def test_nan_keypoints_are_not_counted():
+    keypoints = np.stack([standing_skeleton()] * 10)
+    scores = np.full((10, 17), 0.9)
+    keypoints[:, 11:17] = np.nan
+    # 髖、膝、踝都是 NaN：沒有任何肢段可用
+    assert estimate_pixel_to_meter(keypoints, scores, HEIGHT_CM) is None
+
+
+def test_service_falls_back_to_fixed_scale(monkeypatch):
+    async def run_inline(fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    async def kinematics():
+        return {}, pose_json([np.full((17, 2), 500.0)] * 10)
+
+    monkeypatch.setattr(services, "PIXEL_CALIBRATION_MODE", "auto")
+    monkeypatch.setattr(services, "run_cpu", run_inline)
+    calibration = asyncio.run(services.resolve_calibration(None, None, HEIGHT_CM, kinematics()))
+    assert calibration == {"pixel_to_meter": services.BALL_PIXEL_TO_METER, "source": "fixed"}
+
+
+def test_service_uses_pose_scale(monkeypatch):
+    async def run_inline(fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    async def kinematics():
+        return {}, pose_json([standing_skeleton()] * 10)
+
+    monkeypatch.setattr(services, "PIXEL_CALIBRATION_MODE", "auto")
+    monkeypatch.setattr(services, "run_cpu", run_inline)
+    calibration = asyncio.run(services.resolve_calibration(None, None, HEIGHT_CM, kinematics()))
+    assert calibration["source"] == "pose"
+    assert calibration["pixel_to_meter"] == pytest.approx(1 / PIXELS_PER_METER, rel=1e-4)
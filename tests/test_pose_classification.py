@@ -0,0 +1,102 @@
+# PoseClassification 的矩陣計分與原本逐一比較的版本結果相同 (含特徵名稱大小寫的比對規則)
+
+import numpy as np
+import pytest
+
+from PoseClassification import calculate_score_from_comparison, calculate_scores, compile_profiles
+
+
+def reference_score(features, profile_data):
+    """改寫成矩陣運算之前的 calculate_score_from_comparison。"""
+    if not profile_data:
+        return 0, {}
+    total_score = 0
+    feature_count = 0
+    comparison_details = {}
+    for key, user_value in features.items():
+        profile_stats = profile_data.get(key.lower())
+        if not profile_stats or user_value is None:
+            continue
+        mean = profile_stats.get('mean')
+        std = profile_stats.get('std')
+        if mean is None or std is None:
+            continue
+        z_score = 0.0 if std == 0 else abs((user_value - mean) / std)
+        feature_score = max(0, 100 - z_score * 25)
+        total_score += feature_score
+        feature_count += 1
+        comparison_details[key] = {"user_value": user_value, "mean": mean, "std": std,
+                                   "z_score": z_score, "score": int(feature_score)}
+    if feature_count == 0:
+        return 0, {}
+    return int(total_score / feature_count), comparison_details
+
+
+FEATURE_NAMES = ["trunk_flexion_excursion", "Pelvis_Obliquity_at_FC", "trunk_rotation_at_br",
+                 "shoulder_abduction_at_br", "TRUNK_FLEXION_AT_BR", "trunk_lateral_flexion_at_hs"]
+
+
+def make_case(rng):
+    features = {}
+    for name in FEATURE_NAMES:
+        roll = rng.random()
+        if roll < 0.1:
+            features[name] = None
+        elif roll < 0.2:
+            features[name] = int(rng.integers(-50, 50))
+        elif roll < 0.9:
+            features[name] = float(rng.normal(20, 15))
+
+    profile_data = {}
+    for name in FEATURE_NAMES + ["not_a_user_feature"]:
+        roll = rng.random()
+        # 模型的特徵名稱可能是小寫、原樣 (含大寫) 或缺少
+        key = name.lower() if roll < 0.6 else name if roll < 0.8 else None
+        if key is None:
+            continue
+        stats = {"mean": float(rng.normal(20, 10)), "std": float(rng.choice([0.0, rng.uniform(1, 20)]))}
+        if rng.random() < 0.1:
+            stats["std"] = None
+        profile_data[key] = stats
+    # 只差大小寫的兩個鍵：只有小寫的那個會被比對到
+    if rng.random() < 0.3:
+        profile_data["Trunk_Rotation_at_BR"] = {"mean": 999.0, "std": 1.0}
+    return features, profile_data
+
+
+def assert_same_result(actual, expected):
+    assert actual[0] == expected[0]
+    assert actual[1].keys() == expected[1].keys()
+    for key, detail in expected[1].items():
+        assert actual[1][key]["user_value"] == detail["user_value"]
+        assert actual[1][key]["mean"] == detail["mean"]
+        assert actual[1][key]["std"] == detail["std"]
+        assert actual[1][key]["z_score"] == pytest.approx(detail["z_score"], rel=1e-12, abs=1e-12)
+        assert actual[1][key]["score"] == detail["score"]
+
+
+def test_matches_reference_loop():
+    rng = np.random.default_rng(0)
+    for _ in range(500):
+        features, profile_data = make_case(rng)
+        assert_same_result(calculate_score_from_comparison(features, profile_data),
+                           reference_score(features, profile_data))
+
+
+def test_mixed_case_profile_keys_are_not_scored():
+    features = {"Trunk_Rotation_at_BR": 10.0, "pelvis_obliquity_at_fc": 5.0}
+    profile_data = {"Trunk_Rotation_at_BR": {"mean": 10.0, "std": 1.0},
+                    "pelvis_obliquity_at_fc": {"mean": 7.0, "std": 2.0}}
+    score, details = calculate_score_from_comparison(features, profile_data)
+    assert list(details) == ["pelvis_obliquity_at_fc"]
+    assert score == 75
+    assert "Trunk_Rotation_at_BR" not in compile_profiles([("m", profile_data)]).features
+
+
+def test_multiple_profiles_match_single_profile_scoring():
+    rng = np.random.default_rng(1)
+    cases = [make_case(rng) for _ in range(5)]
+    features = cases[0][0]
+    profiles = [(f"m{i}", profile_data) for i, (_, profile_data) in enumerate(cases)]
+    for (name, profile_data), result in zip(profiles, calculate_scores(features, compile_profiles(profiles))):
+        assert_same_result(result, reference_score(features, profile_data))
@@ -0,0 +1,165 @@
+# PoseCodec 的來回編解碼測試：float16 / float32、zstd 壓縮、不足 17 點的影格
+
+import numpy as np
+import pytest
+
+import PoseCodec
+from KinematicsModule import extract_pitching_biomechanics, load_pose_from_response
+from PoseCodec import (decode_pose, decode_pose_arrays, encode_keypoints_data, encode_pose,
+                       encode_pose_arrays, is_pose_blob, pose_to_response)
+
+COMPRESSIONS = ["none", pytest.param("zstd", marks=pytest.mark.skipif(
+    PoseCodec.zstandard is None, reason="需要 zstandard"))]
+
+
+def make_response(num_frames=6, short_frames=(), num_short=12, seed=0):
+    """產生 POSE API 格式的回傳結果，short_frames 中的影格只有 num_short 個關節點。"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(num_frames):
+        count = num_short if i in short_frames else 17
+        frames.append({
+            "frame_idx": 10 + i * 2,
+            "predictions": [{
+                "keypoints": rng.uniform(0, 1920, size=(count, 2)).round(3).tolist(),
+                "keypoint_scores": rng.uniform(0, 1, size=count).round(3).tolist(),
+            }],
+        })
+    # 沒有偵測到人的影格不會被編碼
+    frames.append({"frame_idx": 99, "predictions": []})
+    return {"frames": frames}
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_float32_round_trip_is_exact(compression):
+    rng = np.random.default_rng(1)
+    frames = np.arange(5, 25)
+    keypoints = rng.uniform(-5, 2000, size=(20, 17, 3)).astype(np.float32)
+    keypoints[3, 5:] = np.nan
+
+    blob = encode_pose_arrays(frames, keypoints, "float32", compression)
+    assert is_pose_blob(blob)
+    decoded_frames, decoded_keypoints = decode_pose_arrays(blob)
+
+    assert decoded_keypoints.dtype == np.float32
+    np.testing.assert_array_equal(decoded_frames, frames)
+    np.testing.assert_array_equal(decoded_keypoints, keypoints)
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_float16_round_trip_within_precision(compression):
+    rng = np.random.default_rng(2)
+    keypoints = rng.uniform(0, 1920, size=(8, 17, 3))
+    keypoints[..., 2] = rng.uniform(0, 1, size=(8, 17))
+
+    _, decoded = decode_pose_arrays(encode_pose_arrays(np.arange(8), keypoints, "float16", compression))
+
+    assert decoded.dtype == np.float16
+    # float16 有效位數約 3 位：1024~2048 之間的解析度為 1 像素
+    np.testing.assert_allclose(decoded.astype(np.float64), keypoints, rtol=1e-3, atol=1e-3)
+
+
+def test_uncompressed_decode_is_read_only_view():
+    blob = encode_pose_arrays(np.arange(3), np.ones((3, 17, 3)), "float32", "none")
+    frames, keypoints = decode_pose_arrays(blob)
+    assert not frames.flags.writeable and not keypoints.flags.writeable
+
+
+@pytest.mark.parametrize("dtype", ["float16", "float32"])
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_short_frames_round_trip(dtype, compression):
+    response = make_response(short_frames=(1, 4), num_short=12)
+    pose = decode_pose(encode_pose(response, dtype, compression))
+
+    detected = [frame for frame in response["frames"] if frame["predictions"]]
+    np.testing.assert_array_equal(pose.frames, [frame["frame_idx"] for frame in detected])
+    np.testing.assert_array_equal(pose.num_keypoints, [12 if i in (1, 4) else 17 for i in range(len(detected))])
+    assert np.isnan(pose.keypoints[1, 12:]).all()
+    assert not np.isnan(pose.keypoints[1, :12]).any()
+
+    restored = pose_to_response(encode_pose(response, dtype, compression))
+    tolerance = 1.0 if dtype == "float16" else 1e-3
+    for original, frame in zip(detected, restored["frames"]):
+        assert frame["frame_idx"] == original["frame_idx"]
+        prediction, expected = frame["predictions"][0], original["predictions"][0]
+        assert len(prediction["keypoints"]) == len(expected["keypoints"])
+        np.testing.assert_allclose(prediction["keypoints"], expected["keypoints"], atol=tolerance)
+        np.testing.assert_allclose(prediction["keypoint_scores"], expected["keypoint_scores"], atol=1e-3)
+
+
+def test_encode_keypoints_data_legacy_formats():
+    response = make_response(num_frames=3)
+    nested = [frame["predictions"][0]["keypoints"] for frame in response["frames"] if frame["predictions"]]
+
+    from_response = decode_pose(encode_keypoints_data(response))
+    from_frames = decode_pose(encode_keypoints_data(response["frames"]))
+    from_nested = decode_pose(encode_keypoints_data(nested))
+
+    np.testing.assert_array_equal(from_response.keypoints, from_frames.keypoints)
+    # 只有 (x, y) 的巢狀列表：影格編號為 0..T-1，信心分數補 1
+    np.testing.assert_array_equal(from_nested.frames, np.arange(3))
+    np.testing.assert_allclose(from_nested.keypoints[..., :2], from_response.keypoints[..., :2], atol=1e-3)
+    assert (from_nested.keypoints[..., 2] == 1).all()
+    assert len(decode_pose(encode_keypoints_data([])).frames) == 0
+
+
+def test_rejects_unknown_formats():
+    with pytest.raises(ValueError):
+        encode_pose_arrays(np.arange(1), np.ones((1, 17, 3)), "float64")
+    with pytest.raises(ValueError):
+        decode_pose_arrays(b"XXXX" + bytes(12))
+
+
+def make_pitch_response(rng, num_frames=60, with_scores_channel=False, short_frame=None):
+    """
+    模擬一次投球的 POSE API 回傳結果：座標為 1/8 像素、分數為 1/1024 的倍數 (float32 可以精確表示)，
+    分數隨機 (低於生物力學偵測的信心門檻的關節點也會出現)。
+    """
+    base = rng.uniform(200, 1800, size=(17, 2))
+    drift = rng.normal(0, 6, size=(num_frames, 17, 2)).cumsum(axis=0)
+    frames = []
+    for i in range(num_frames):
+        keypoints = np.round((base + drift[i]) * 8) / 8
+        scores = np.round(rng.uniform(0, 1, size=17) * 1024) / 1024
+        count = 12 if i == short_frame else 17
+        if with_scores_channel:
+            points = np.concatenate([keypoints, scores[:, None]], axis=1)[:count].tolist()
+        else:
+            points = keypoints[:count].tolist()
+        frames.append({"frame_idx": i, "predictions": [{"keypoints": points, "keypoint_scores": scores[:count].tolist()}]})
+    return {"frames": frames}
+
+
+def assert_same_biomechanics(expected, actual):
+    assert expected.keys() == actual.keys()
+    for key, value in expected.items():
+        if isinstance(value, float) and np.isnan(value):
+            assert np.isnan(actual[key]), key
+        else:
+            assert actual[key] == value, key
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_blob_and_json_give_same_biomechanics(compression):
+    # 由 blob 解碼的骨架與直接讀 JSON 的結果必須完全相同 (分數通道相同，信心門檻的判斷才會一致)
+    rng = np.random.default_rng(7)
+    for case in range(200):
+        response = make_pitch_response(rng, with_scores_channel=case % 4 == 0,
+                                       short_frame=int(rng.integers(60)) if case % 5 == 0 else None)
+        decoded = decode_pose(encode_pose(response, "float32", compression))
+        expected = load_pose_from_response(response)
+
+        np.testing.assert_array_equal(decoded.keypoints, expected.keypoints)
+        np.testing.assert_array_equal(decoded.num_keypoints, expected.num_keypoints)
+        assert_same_biomechanics(extract_pitching_biomechanics(response), extract_pitching_biomechanics(decoded))
+
+
+def test_raw_scores_survive_for_pose_to_response():
+    response = make_pitch_response(np.random.default_rng(8), num_frames=5)
+    blob = encode_pose(response, "float32")
+
+    # 生物力學使用的分數通道與 load_pose_from_response 相同 (只有 x, y 時為 1.0)
+    assert (decode_pose(blob).keypoints[..., 2] == 1.0).all()
+    for original, frame in zip(response["frames"], pose_to_response(blob)["frames"]):
+        np.testing.assert_allclose(frame["predictions"][0]["keypoint_scores"],
+                                   original["predictions"][0]["keypoint_scores"], atol=1e-6)
@@ -0,0 +1,100 @@
+# running_stats 的串流統計：Welford / t-digest 與 NumPy 精確值比較、平行合併、狀態序列化
+
+import json
+
+import numpy as np
+import pytest
+
+from running_stats import FeatureProfileAccumulator, RunningStats, TDigest
+
+
+def test_small_sample_quantiles_are_exact():
+    values = np.random.default_rng(0).normal(50, 10, size=25)
+    digest = TDigest()
+    for value in values:
+        digest.add(value)
+    for q in (0.1, 0.5, 0.9):
+        assert digest.quantile(q) == pytest.approx(np.percentile(values, q * 100), abs=1e-9)
+
+
+def test_large_sample_quantiles_are_close():
+    values = np.random.default_rng(1).normal(0, 1, size=20000)
+    digest = TDigest()
+    for value in values:
+        digest.add(value)
+    assert len(digest.to_state()["means"]) < 500
+    for q in (0.1, 0.5, 0.9):
+        assert digest.quantile(q) == pytest.approx(np.percentile(values, q * 100), abs=0.02)
+
+
+def test_empty_digest_has_no_quantile():
+    assert TDigest().quantile(0.5) is None
+
+
+def test_welford_matches_numpy():
+    values = np.random.default_rng(2).uniform(-100, 100, size=1000)
+    stats = RunningStats()
+    for value in values:
+        stats.add(value)
+    assert stats.count == len(values)
+    assert stats.mean == pytest.approx(values.mean(), rel=1e-12)
+    assert stats.std == pytest.approx(values.std(), rel=1e-9)
+    assert (stats.min, stats.max) == (values.min(), values.max())
+
+
+def test_merge_matches_single_pass():
+    values = np.random.default_rng(3).normal(10, 3, size=3000)
+    single = RunningStats()
+    for value in values:
+        single.add(value)
+
+    merged = RunningStats()
+    for part in np.array_split(values, 7):
+        partial = RunningStats()
+        for value in part:
+            partial.add(value)
+        merged.merge(partial)
+    merged.merge(RunningStats())  # 合併空的統計不影響結果
+
+    assert merged.count == single.count
+    assert merged.mean == pytest.approx(single.mean, rel=1e-12)
+    assert merged.std == pytest.approx(single.std, rel=1e-9)
+    assert (merged.min, merged.max) == (single.min, single.max)
+    for q in (0.1, 0.5, 0.9):
+        assert merged.digest.quantile(q) == pytest.approx(np.percentile(values, q * 100), abs=0.1)
+
+
+def test_state_round_trip_through_json():
+    rng = np.random.default_rng(4)
+    accumulator = FeatureProfileAccumulator()
+    for _ in range(300):
+        accumulator.update({"Trunk_Flexion": float(rng.normal(30, 5)), "speed": int(rng.integers(100, 150)),
+                            "flag": True, "missing": None, "nan": float("nan")})
+
+    state = json.loads(json.dumps(accumulator.to_state()))
+    restored = FeatureProfileAccumulator.from_state(state)
+    assert restored.sample_count == 300
+    assert set(restored.features) == {"trunk_flexion", "speed"}
+    assert restored.profile_data() == accumulator.profile_data()
+
+    # 還原後繼續加入資料，與從頭串流的結果相同
+    extra = [{"trunk_flexion": float(value)} for value in rng.normal(30, 5, size=50)]
+    for features in extra:
+        accumulator.update(features)
+        restored.update(features)
+    assert restored.profile_data()["trunk_flexion"]["mean"] == pytest.approx(
+        accumulator.profile_data()["trunk_flexion"]["mean"], rel=1e-12)
+
+
+def test_accumulator_merge():
+    left, right, both = FeatureProfileAccumulator(), FeatureProfileAccumulator(), FeatureProfileAccumulator()
+    for value in range(10):
+        (left if value % 2 else right).update({"x": value})
+        both.update({"x": value})
+    right.update({"y": 1.0})
+    both.update({"y": 1.0})
+    left.merge(right)
+    assert left.sample_count == both.sample_count
+    for key in ("x", "y"):
+        for stat in ("mean", "std", "min", "max", "p10", "p50_median", "p90"):
+            assert left.profile_data()[key][stat] == pytest.approx(both.profile_data()[key][stat])